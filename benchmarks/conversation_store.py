@@ -0,0 +1,164 @@
+"""
+Compare per-turn storage latency of the conversation store backends.
+
+Replays the store calls of chat turns without the model: each turn
+allocates a sequence number for the user message, stores it while
+reading the recent history, then stores the assistant reply, exactly
+as `ChatService` does. Conversations run concurrently, their turns one
+after another, and the report holds p50/p95/p99 of whole turns and of
+their write and read calls per backend:
+
+    python -m benchmarks.conversation_store --conversations 200 --turns 20 --concurrency 50
+    python -m benchmarks.conversation_store --backends postgres --postgres-uri postgresql+asyncpg://...
+
+MongoDB runs against ``<MONGO_DB_NAME>_benchmark``, which is dropped
+afterwards; PostgreSQL rows are created in the configured database and
+deleted afterwards, so point ``--postgres-uri`` at a scratch database.
+``memory://`` works for both, for a quick offline check.
+"""
+from typing import Dict, List
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from benchmarks.load_test import percentiles
+from src.core.config import settings
+
+def open_backend(name: str, args):
+    """Store plus a cleanup coroutine function"""
+    if name == "mongodb":
+        from src.db.mongodb import MongoClientManager, LazyCollection
+        from src.db.mongodb.buckets import MessageBucketStore
+        from src.db.mongodb.conversations import MongoConversationStore
+        from src.db.mongodb.indexes import ensure_indexes
+
+        manager = MongoClientManager(args.mongo_uri, f"{settings.MONGO_DB_NAME}_benchmark")
+        conversations = LazyCollection(manager, settings.CHAT_COLLECTION)
+        store = MongoConversationStore(
+            conversations,
+            MessageBucketStore(conversations, LazyCollection(manager, settings.MESSAGE_COLLECTION))
+        )
+
+        async def prepare():
+            await ensure_indexes(manager.db)
+
+        async def cleanup(conversation_ids: List[str]):
+            await manager.client.drop_database(manager.db_name)
+            manager.close()
+
+        return store, prepare, cleanup
+
+    if name == "postgres":
+        from src.db.postgres import PostgresClientManager
+        from src.db.postgres.conversations import PostgresConversationStore, chat_messages, chats, create_schema
+
+        client = PostgresClientManager(args.postgres_uri)
+        store = PostgresConversationStore(client)
+
+        async def prepare():
+            await create_schema(client.engine)
+
+        async def cleanup(conversation_ids: List[str]):
+            async with client.engine.begin() as connection:
+                await connection.execute(chat_messages.delete().where(chat_messages.c.conversation_id.in_(conversation_ids)))
+                await connection.execute(chats.delete().where(chats.c.conversation_id.in_(conversation_ids)))
+            await client.close()
+
+        return store, prepare, cleanup
+
+    raise ValueError(f"Unknown backend: {name}")
+
+def _message(role: str, content: str) -> Dict:
+    return {
+        "message_id": str(uuid.uuid4()),
+        "role": role,
+        "content": content,
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+async def run_backend(name: str, args) -> Dict:
+    store, prepare, cleanup = open_backend(name, args)
+    await prepare()
+
+    timings: Dict[str, List[float]] = {"turn": [], "write": [], "read": []}
+    conversation_ids = [str(uuid.uuid4()) for _ in range(args.conversations)]
+    now = datetime.now(timezone.utc)
+    for conversation_id in conversation_ids:
+        await store.create({
+            "conversation_id": conversation_id,
+            "user_id": f"user-{conversation_id[:4]}",
+            "created_at": now,
+            "updated_at": now,
+            "status": "active",
+            "metadata": {"total_messages": 0, "last_user_message_time": None, "last_assistant_message_time": None}
+        })
+
+    async def store_message(conversation_id: str, message: Dict, tail: int) -> None:
+        started_at = time.perf_counter()
+        seq, _ = await store.allocate_seq(conversation_id, message["role"], message["timestamp"], fields=("summary",))
+        message["seq"] = seq
+
+        async def read():
+            read_started_at = time.perf_counter()
+            await store.read(conversation_id, tail - 1, before=seq)
+            timings["read"].append((time.perf_counter() - read_started_at) * 1000)
+
+        if tail:
+            await asyncio.gather(read(), store.append(conversation_id, message))
+        else:
+            await store.append(conversation_id, message)
+        timings["write"].append((time.perf_counter() - started_at) * 1000)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def conversation(conversation_id: str) -> None:
+        async with semaphore:
+            for turn in range(args.turns):
+                started_at = time.perf_counter()
+                await store_message(conversation_id, _message("user", f"問題 {turn}：" + "訂單" * args.message_chars), args.history)
+                await store_message(conversation_id, _message("assistant", f"回覆 {turn}：" + "處理" * args.message_chars), 0)
+                timings["turn"].append((time.perf_counter() - started_at) * 1000)
+
+    started_at = time.perf_counter()
+    try:
+        await asyncio.gather(*[conversation(conversation_id) for conversation_id in conversation_ids])
+        elapsed = time.perf_counter() - started_at
+    finally:
+        await cleanup(conversation_ids)
+
+    return {
+        "turns_per_s": round(len(timings["turn"]) / elapsed, 1),
+        "turn_ms": percentiles(timings["turn"]),
+        "write_ms": percentiles(timings["write"]),
+        "read_ms": percentiles(timings["read"])
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-turn latency of conversation stores")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=10, help="Turns per conversation")
+    parser.add_argument("--concurrency", type=int, default=20, help="Conversations running at once")
+    parser.add_argument("--history", type=int, default=settings.MEMORY_MAX_MESSAGES, help="Messages read per turn")
+    parser.add_argument("--message-chars", type=int, default=50, help="Repetitions of the filler word per message")
+    parser.add_argument("--backends", nargs="+", default=["mongodb", "postgres"])
+    parser.add_argument("--mongo-uri", default=settings.MONGO_URI)
+    parser.add_argument("--postgres-uri", default=settings.POSTGRES_URI)
+    args = parser.parse_args()
+
+    report = {}
+    for name in args.backends:
+        report[name] = asyncio.run(run_backend(name, args))
+
+    print(f"{'backend':<10}{'turns/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'w.p95':>9}{'r.p95':>9}")
+    for name, result in report.items():
+        turn = result["turn_ms"]
+        print(
+            f"{name:<10}{result['turns_per_s']:>9}{turn['p50']:>9}{turn['p95']:>9}{turn['p99']:>9}"
+            f"{result['write_ms']['p95']:>9}{result['read_ms']['p95']:>9}"
+        )
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
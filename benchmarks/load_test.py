@@ -0,0 +1,298 @@
+"""
+Replay a traffic file against the chat API and report latency per stage.
+
+Serves the FastAPI app from this process by default, through uvicorn on
+a loopback port, with the offline fake LLM, in-memory Mongo/Redis
+stand-ins, hashing embeddings and the NumPy vector store, so no external
+service is called:
+
+    python -m benchmarks.load_test requests.jsonl --rps 20 --duration 30
+    python -m benchmarks.load_test requests.jsonl --save-baseline
+    python -m benchmarks.load_test requests.jsonl --baseline benchmarks/results/baseline.json
+
+Every line of the traffic file is a JSON object; the message text is
+taken from ``content``, ``message`` or ``title`` + ``body``. Records with
+a ``conversation`` key are replayed on the same conversation, the rest
+are spread over ``--conversations`` conversations.
+
+Requests are sent open loop at the target rate. The report holds
+throughput, end-to-end latency, time to first token (with ``--stream``)
+and p50/p95/p99 per pipeline stage; stage timings are only available
+in-process. Compared against a baseline, any percentile more than
+``--tolerance`` slower fails the run with exit status 1.
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+OFFLINE_DEFAULTS = {
+    "LLM_BACKEND": "fake",
+    "MONGO_URI": "memory://",
+    "REDIS_URI": "memory://",
+    "POSTGRES_URI": "memory://",
+    "EMBEDDING_MODEL": "hash",
+    "VECTOR_STORE_TYPE": "numpy",
+    "SLOW_REQUEST_LOG_ENABLED": "False",
+    # Replayed traffic comes from one client; measure the service, not the limiter
+    "RATE_LIMIT_ENABLED": "False",
+}
+
+DEFAULT_OUTPUT = Path("benchmarks/results/latest.json")
+DEFAULT_BASELINE = Path("benchmarks/results/baseline.json")
+
+# Differences below this are treated as noise when comparing
+NOISE_FLOOR_MS = 1.0
+
+def load_traffic(path: str) -> List[Dict]:
+    """Read replayable messages from a JSONL file"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            content = record.get("content") or record.get("message")
+            if not content:
+                content = "\n".join(part for part in (record.get("title"), record.get("body")) if part)
+            if content:
+                records.append({"content": content, "conversation": record.get("conversation")})
+    if not records:
+        raise ValueError(f"No messages found in {path}")
+    return records
+
+def percentiles(values: List[float]) -> Dict:
+    """Nearest-rank p50/p95/p99 plus mean, in the unit of `values`"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": round(rank(50), 2),
+        "p95": round(rank(95), 2),
+        "p99": round(rank(99), 2),
+    }
+
+class LoadTest:
+    def __init__(self, client, traffic: List[Dict], args):
+        self.client = client
+        self.traffic = traffic
+        self.args = args
+        self.results: List[Dict] = []
+        self.conversations: Dict[str, str] = {}
+
+    async def _conversation(self, key: str) -> str:
+        if key not in self.conversations:
+            response = await self.client.post(
+                "/api/v1/chat/conversations",
+                json={"user_id": f"loadtest-{key}"}
+            )
+            response.raise_for_status()
+            self.conversations[key] = response.json()["conversation_id"]
+        return self.conversations[key]
+
+    async def _send(self, record: Dict, index: int) -> None:
+        key = record["conversation"] or str(index % self.args.conversations)
+        result = {"status": None, "latency_ms": None, "ttft_ms": None}
+        try:
+            conversation_id = await self._conversation(key)
+            path = f"/api/v1/chat/conversations/{conversation_id}/messages"
+            started_at = time.perf_counter()
+
+            if self.args.stream:
+                async with self.client.stream("POST", f"{path}/stream", json={"content": record["content"]}) as response:
+                    result["status"] = response.status_code
+                    async for line in response.aiter_lines():
+                        if result["ttft_ms"] is None and line.startswith("event: token"):
+                            result["ttft_ms"] = (time.perf_counter() - started_at) * 1000
+            else:
+                response = await self.client.post(path, json={"content": record["content"]})
+                result["status"] = response.status_code
+
+            result["latency_ms"] = (time.perf_counter() - started_at) * 1000
+        except Exception as e:
+            result["error"] = type(e).__name__
+        self.results.append(result)
+
+    async def run(self) -> float:
+        """Send requests at the target rate; returns the wall time in seconds"""
+        interval = 1 / self.args.rps
+        total = self.args.requests or int(self.args.rps * self.args.duration)
+        started_at = time.perf_counter()
+        tasks = []
+
+        for index in range(total):
+            delay = started_at + index * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            record = self.traffic[index % len(self.traffic)]
+            tasks.append(asyncio.create_task(self._send(record, index)))
+
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started_at
+
+def build_report(args, results: List[Dict], traces: List, wall_time: float) -> Dict:
+    ok = [result for result in results if result["status"] is not None and result["status"] < 400]
+    errors: Dict[str, int] = {}
+    for result in results:
+        if result not in ok:
+            key = str(result["status"] or result.get("error"))
+            errors[key] = errors.get(key, 0) + 1
+
+    stages: Dict[str, List[float]] = {}
+    for trace in traces:
+        for stage, seconds in trace.stages.items():
+            stages.setdefault(stage, []).append(seconds * 1000)
+
+    return {
+        "config": {
+            "traffic": args.traffic,
+            "rps": args.rps,
+            "requests": len(results),
+            "conversations": args.conversations,
+            "stream": args.stream,
+            "target": args.base_url or "in-process",
+        },
+        "wall_time_s": round(wall_time, 2),
+        "throughput_rps": round(len(ok) / wall_time, 2) if wall_time else 0.0,
+        "errors": errors,
+        "latency_ms": percentiles([result["latency_ms"] for result in ok]),
+        "ttft_ms": percentiles([result["ttft_ms"] for result in ok if result["ttft_ms"] is not None]),
+        "stages_ms": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+    }
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every percentile that regressed beyond `tolerance`"""
+    regressions = []
+
+    def check(name: str, current: Dict, previous: Dict) -> None:
+        for key in ("p50", "p95", "p99"):
+            if key not in current or key not in previous:
+                continue
+            if current[key] - previous[key] > NOISE_FLOOR_MS and current[key] > previous[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {previous[key]:.1f}ms -> {current[key]:.1f}ms")
+
+    check("latency", report["latency_ms"], baseline.get("latency_ms", {}))
+    check("ttft", report["ttft_ms"], baseline.get("ttft_ms", {}))
+    for stage, current in report["stages_ms"].items():
+        check(stage, current, baseline.get("stages_ms", {}).get(stage, {}))
+
+    previous_rps = baseline.get("throughput_rps") or 0
+    if previous_rps and report["throughput_rps"] < previous_rps * (1 - tolerance):
+        regressions.append(f"throughput: {previous_rps:.1f} -> {report['throughput_rps']:.1f} rps")
+    return regressions
+
+def print_report(report: Dict) -> None:
+    print(f"requests={report['config']['requests']} throughput={report['throughput_rps']} rps errors={report['errors']}")
+    rows = [("latency", report["latency_ms"]), ("ttft", report["ttft_ms"])]
+    rows += list(report["stages_ms"].items())
+    print(f"{'stage':<16}{'count':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, values in rows:
+        if values.get("count"):
+            print(f"{name:<16}{values['count']:>8}{values['p50']:>10}{values['p95']:>10}{values['p99']:>10}")
+
+async def main_async(args) -> Dict:
+    import httpx
+
+    traffic = load_traffic(args.traffic)
+    traces = []
+    server = None
+    # Open loop: requests must not queue in the client's connection pool
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits)
+    else:
+        for key, value in OFFLINE_DEFAULTS.items():
+            os.environ.setdefault(key, value)
+        import socket
+        import uvicorn
+        from main import app
+        from src.core.metrics import add_trace_listener
+        from src.services.chat import chat_service
+
+        route_suffix = "/messages/stream" if args.stream else "/messages"
+
+        def collect(trace, status):
+            if trace.route and trace.route.endswith(route_suffix) and status < 400:
+                traces.append(trace)
+
+        add_trace_listener(collect)
+
+        # A real server rather than httpx.ASGITransport, which buffers the
+        # whole response body and would make TTFT equal to latency; in
+        # this process, so stage traces can still be collected
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        server = uvicorn.Server(uvicorn.Config(app, lifespan="on", log_level="warning"))
+        serving = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started:
+            if serving.done():
+                await serving
+                raise RuntimeError("The load-test server did not start")
+            await asyncio.sleep(0.05)
+
+        client = httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{sock.getsockname()[1]}",
+            timeout=args.timeout,
+            limits=limits
+        )
+
+    test = LoadTest(client, traffic, args)
+    async with client:
+        wall_time = await test.run()
+
+    if server is not None:
+        # Let trailing writes finish so final_write is part of the breakdown
+        await asyncio.gather(*list(chat_service._background_tasks), return_exceptions=True)
+        server.should_exit = True
+        await serving
+
+    return build_report(args, test.results, traces, wall_time)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay chat traffic and report per-stage latency")
+    parser.add_argument("traffic", nargs="?", default="requests.jsonl", help="JSONL traffic file")
+    parser.add_argument("--rps", type=float, default=10.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to send traffic for")
+    parser.add_argument("--requests", type=int, default=None, help="Send exactly this many requests")
+    parser.add_argument("--conversations", type=int, default=20, help="Conversations to spread traffic over")
+    parser.add_argument("--stream", action="store_true", help="Use the SSE endpoint")
+    parser.add_argument("--base-url", default=None, help="Target a running server instead of the app in-process")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="Where to write the JSON report")
+    parser.add_argument("--baseline", type=Path, default=None, help="Compare against this report")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also write the report to {DEFAULT_BASELINE}")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.save_baseline:
+        DEFAULT_BASELINE.parent.mkdir(parents=True, exist_ok=True)
+        DEFAULT_BASELINE.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
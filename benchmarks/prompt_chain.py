@@ -0,0 +1,105 @@
+"""
+Measure the per-call overhead of assembling the LLM chain.
+
+Compares the old path, which built a new prompt template and chain for
+every system prompt carrying knowledge base context and converted the
+history into new message objects on every call, with the compiled
+chains cached in `LLMEngine`. A zero-latency fake model stands in for
+the upstream call, so the difference is pure prompt assembly:
+
+    python -m benchmarks.prompt_chain --calls 2000 --history 20
+
+Reports microseconds per call for building the chain alone and for a
+full `ainvoke`.
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import time
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from src.llm.engine import LLMEngine
+from src.llm.models.fake import FakeChatModel
+from src.llm.prompts.templates import prompt_templates
+from benchmarks.load_test import percentiles
+
+def make_history(turns: int) -> List[Dict[str, str]]:
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"第 {turn} 個問題：請問訂單什麼時候會出貨？"})
+        messages.append({"role": "assistant", "content": f"第 {turn} 個回覆：訂單通常在付款後兩個工作天內出貨。"})
+    messages.append({"role": "user", "content": "可以改寄送地址嗎？"})
+    return messages
+
+def legacy_prepare(llm, messages: List[Dict[str, str]], context: str):
+    """The chain and inputs as they were built before chains were cached"""
+    system_prompt = f"""您是一位 AI 客服代表。
+{prompt_templates.get_knowledge_context(context)}
+
+請使用繁體中文回覆。"""
+    history = []
+    for msg in messages[:-1]:
+        if msg["role"] == "system":
+            history.append(SystemMessage(content=msg["content"]))
+        elif msg["role"] == "user":
+            history.append(HumanMessage(content=msg["content"]))
+        elif msg["role"] == "assistant":
+            history.append(AIMessage(content=msg["content"]))
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{input}")
+    ])
+    return prompt | llm | StrOutputParser(), {"history": history, "input": messages[-1]["content"]}
+
+def compiled_prepare(engine: LLMEngine, llm, messages: List[Dict[str, str]], context: str):
+    return engine._prepare(messages, prompt_templates.CUSTOMER_SERVICE_PROMPT, context, llm)
+
+async def measure(prepare, calls: int, invoke: bool) -> Dict:
+    latencies = []
+    for _ in range(calls):
+        started_at = time.perf_counter()
+        chain, variables = prepare()
+        if invoke:
+            await chain.ainvoke(variables)
+        latencies.append((time.perf_counter() - started_at) * 1_000_000)
+    return percentiles(latencies)
+
+async def run(args) -> Dict:
+    llm = FakeChatModel(model_name="fake", first_token_latency=0, tokens_per_second=0, response_tokens=4)
+    engine = LLMEngine()
+    messages = make_history(args.history)
+    # A different context per call, as with real retrieval
+    contexts = [f"文件 {i}：退貨需在收到商品後七天內申請。" for i in range(args.calls)]
+
+    paths = {
+        "legacy": lambda context: legacy_prepare(llm, messages, context),
+        "compiled": lambda context: compiled_prepare(engine, llm, messages, context)
+    }
+    report = {}
+    for name, prepare in paths.items():
+        for invoke in (False, True):
+            picks = iter(contexts)
+            await measure(lambda: prepare(contexts[0]), args.warmup, invoke)
+            report[f"{name}.{'invoke' if invoke else 'build'}_us"] = await measure(
+                lambda: prepare(next(picks)), args.calls, invoke
+            )
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure prompt chain assembly overhead")
+    parser.add_argument("--calls", type=int, default=2000, help="Calls per measurement")
+    parser.add_argument("--history", type=int, default=10, help="Earlier turns in the conversation")
+    parser.add_argument("--warmup", type=int, default=50)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(f"{'path':<22}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, latency in report.items():
+        print(f"{name:<22}{latency['p50']:>10}{latency['p95']:>10}{latency['p99']:>10}")
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
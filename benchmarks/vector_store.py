@@ -0,0 +1,130 @@
+"""
+Compare recall and query latency of the vector store backends.
+
+Builds a synthetic clustered corpus, computes the exact neighbours by
+brute force and measures, per backend, recall@k against them and the
+p50/p95/p99 latency of single queries, with and without a `where`
+filter:
+
+    python -m benchmarks.vector_store --rows 100000 --dimensions 384
+    python -m benchmarks.vector_store --backends numpy numpy-int8
+
+Chroma is skipped when chromadb is not installed. Every backend writes
+into a temporary directory that is removed afterwards.
+"""
+from typing import Dict, List
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from benchmarks.load_test import percentiles
+
+def make_corpus(rows: int, queries: int, dimensions: int, clusters: int, seed: int):
+    """Unit vectors drawn around shared random centroids, plus a category per row"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+
+    def sample(count: int) -> np.ndarray:
+        labels = rng.integers(0, clusters, size=count)
+        vectors = centroids[labels] + rng.normal(scale=0.6, size=(count, dimensions)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return sample(rows), rng.integers(0, 8, size=rows), sample(queries)
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int, allowed=None) -> List[set]:
+    scores = queries @ vectors.T
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [{f"doc-{row}" for row in rows} for rows in top]
+
+def open_backend(name: str, directory: str):
+    if name in ("numpy", "numpy-int8"):
+        from src.db.vector.numpy_store import NumpyCollection
+        return NumpyCollection(directory, quantize=name == "numpy-int8")
+    if name == "chroma":
+        import chromadb
+        client = chromadb.PersistentClient(path=directory)
+        return client.create_collection("benchmark", metadata={"hnsw:space": "cosine"})
+    raise ValueError(f"Unknown backend: {name}")
+
+def run_backend(name: str, vectors: np.ndarray, categories: np.ndarray, queries: np.ndarray, args) -> Dict:
+    filtered = categories == 0
+    truth = exact_neighbours(vectors, queries, args.k)
+    truth_filtered = exact_neighbours(vectors, queries, args.k, filtered)
+
+    with tempfile.TemporaryDirectory() as directory:
+        collection = open_backend(name, directory)
+
+        started_at = time.perf_counter()
+        for start in range(0, len(vectors), args.batch_size):
+            end = min(start + args.batch_size, len(vectors))
+            collection.upsert(
+                ids=[f"doc-{row}" for row in range(start, end)],
+                embeddings=vectors[start:end].tolist(),
+                metadatas=[{"category": int(category)} for category in categories[start:end]],
+                documents=[f"document {row}" for row in range(start, end)]
+            )
+        ingest_seconds = time.perf_counter() - started_at
+
+        def measure(where, expected: List[set]) -> Dict:
+            latencies, hits = [], 0
+            for query, relevant in zip(queries, expected):
+                started_at = time.perf_counter()
+                result = collection.query(query_embeddings=[query.tolist()], n_results=args.k, where=where)
+                latencies.append((time.perf_counter() - started_at) * 1000)
+                hits += len(relevant & set(result["ids"][0]))
+            return {
+                "recall": round(hits / (len(expected) * args.k), 4),
+                "latency_ms": percentiles(latencies)
+            }
+
+        return {
+            "ingest_s": round(ingest_seconds, 2),
+            "query": measure(None, truth),
+            "filtered_query": measure({"category": 0}, truth_filtered)
+        }
+
+def available(name: str) -> bool:
+    if name != "chroma":
+        return True
+    try:
+        import chromadb  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare vector store recall and latency")
+    parser.add_argument("--rows", type=int, default=20000, help="Corpus size")
+    parser.add_argument("--dimensions", type=int, default=384, help="Embedding dimensions")
+    parser.add_argument("--clusters", type=int, default=64, help="Clusters in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per measurement")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per upsert")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--backends", nargs="+", default=["numpy", "numpy-int8", "chroma"])
+    args = parser.parse_args()
+
+    vectors, categories, queries = make_corpus(args.rows, args.queries, args.dimensions, args.clusters, args.seed)
+
+    report = {}
+    for name in args.backends:
+        if not available(name):
+            print(f"{name}: not installed, skipped")
+            continue
+        report[name] = run_backend(name, vectors, categories, queries, args)
+
+    print(f"{'backend':<12}{'ingest_s':>10}{'recall':>9}{'p50':>9}{'p95':>9}{'f.recall':>10}{'f.p50':>9}{'f.p95':>9}")
+    for name, result in report.items():
+        plain, filtered = result["query"], result["filtered_query"]
+        print(
+            f"{name:<12}{result['ingest_s']:>10}{plain['recall']:>9}{plain['latency_ms']['p50']:>9}"
+            f"{plain['latency_ms']['p95']:>9}{filtered['recall']:>10}{filtered['latency_ms']['p50']:>9}"
+            f"{filtered['latency_ms']['p95']:>9}"
+        )
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,42 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest
+import math
+import os
 from src.core.config import settings
 from src.api.routes import test, chat, llm, knowledge
+from src.api.middlewares import MetricsMiddleware, RateLimitMiddleware
+from src.llm.engine import LLMOverloadedError
+from src.services.chat import ConversationBusy
+from src.services.idempotency import RequestInProgress
+from src.core.container import container
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients connect and models load once per worker, here rather than
+    # at import time
+    await container.startup()
+    yield
+    await container.shutdown()
 
 app = FastAPI(
+    lifespan=lifespan,
     title=settings.PROJECT_NAME,
     description=settings.DESCRIPTION,
     version=settings.VERSION,
     docs_url="/docs",
     redoc_url="/redoc",
+    # orjson serializes datetimes itself and is several times faster than json
+    default_response_class=ORJSONResponse,
 )
 
+# Per-user and per-tenant admission control, ahead of any database or LLM
+# work; added first so CORS headers and metrics still cover its 429s
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # Add CORS middleware with more specific configuration
 app.add_middleware(
     CORSMiddleware,
@@ -20,12 +46,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency histograms and slow-request logging
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(test.router, prefix="/api/v1", tags=["test"])
 app.include_router(chat.router, prefix="/api/v1/chat", tags=["chat"])
 app.include_router(llm.router, prefix="/api/v1/llm", tags=["llm"])
 app.include_router(knowledge.router, prefix="/api/v1/knowledge", tags=["knowledge"])
 
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloadedError):
+    """Shed load with 503 so clients back off instead of piling up"""
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": f"服務繁忙，請稍後再試：{str(exc)}"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.exception_handler(ConversationBusy)
+@app.exception_handler(RequestInProgress)
+async def conversation_busy_handler(request: Request, exc: Exception):
+    """The conversation's previous turn (or the original of a duplicate) is still running"""
+    return ORJSONResponse(
+        status_code=409,
+        content={"detail": f"對話處理中，請稍後再試：{str(exc)}"},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Aggregate across uvicorn/gunicorn worker processes
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Readiness and startup timings of this worker"""
+    return container.report()
+
 @app.get("/")
 async def root():
     return {
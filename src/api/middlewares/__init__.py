@@ -0,0 +1,4 @@
+from .metrics import MetricsMiddleware
+from .rate_limit import RateLimitMiddleware
+
+__all__ = ["MetricsMiddleware", "RateLimitMiddleware"]
@@ -0,0 +1,55 @@
+from typing import Dict
+from src.core.logging import log_slow_request
+from src.core.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS, finish_trace, start_trace
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template.
+
+    Routes are labelled by their template (``/conversations/{conversation_id}``)
+    rather than the raw path to keep label cardinality bounded. The
+    duration covers the whole response body, so streamed replies are
+    measured until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict = {}
+
+    def _route_for(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    self._routes[endpoint] = route.path
+                    break
+            else:
+                self._routes[endpoint] = "unmatched"
+        return self._routes[endpoint]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        trace = start_trace(method, scope["path"])
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.labels(method).inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.labels(method).dec()
+            trace.route = self._route_for(scope)
+            HTTP_REQUEST_SECONDS.labels(method, trace.route, str(status)).observe(trace.elapsed())
+            log_slow_request(trace, status)
+            finish_trace(trace, status)
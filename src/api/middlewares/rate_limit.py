@@ -0,0 +1,175 @@
+from typing import Dict, List, Optional, Tuple
+import json
+from fastapi.responses import ORJSONResponse
+from starlette.routing import Match
+from src.core.config import settings
+from src.core.metrics import RATE_LIMIT_REJECTIONS
+from src.db.redis.rate_limit import Bucket, TokenBuckets, retry_after
+
+# Body fields holding text that goes to the LLM
+_TEXT_FIELDS = ("content", "initial_message")
+
+class RateLimiter:
+    """
+    Per-user, per-tenant and per-address budgets held in token buckets.
+
+    Each admitted call is charged against its identities' buckets:
+
+    - a request-count bucket per route template, so one endpoint cannot
+      be flooded without limiting the others;
+    - an LLM token bucket shared by all routes, charged the prompt
+      tokens of the payload plus `RATE_LIMIT_COMPLETION_TOKENS` for the
+      reply, when the payload carries text for the model.
+
+    A user set by an authentication middleware (``scope["user"]``) is
+    trusted as is. Otherwise the user comes from the client-supplied
+    ``X-User-ID`` header (or a ``user_id`` query parameter), which a
+    client can rotate freely, so the client address is always charged
+    too; the tenant comes from ``X-Tenant-ID``.
+    """
+
+    def __init__(self, buckets: Optional[TokenBuckets] = None):
+        self.buckets = buckets or TokenBuckets()
+        self.budgets = {
+            "user": (settings.RATE_LIMIT_USER_REQUESTS_PER_MINUTE, settings.RATE_LIMIT_USER_TOKENS_PER_MINUTE),
+            "tenant": (settings.RATE_LIMIT_TENANT_REQUESTS_PER_MINUTE, settings.RATE_LIMIT_TENANT_TOKENS_PER_MINUTE),
+            "ip": (settings.RATE_LIMIT_IP_REQUESTS_PER_MINUTE, settings.RATE_LIMIT_IP_TOKENS_PER_MINUTE),
+        }
+
+    def route_for(self, scope) -> Optional[str]:
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return None
+
+    def identities(self, scope) -> Dict[str, str]:
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        identities = {"tenant": headers.get("x-tenant-id") or "default"}
+
+        authenticated = scope.get("user")
+        if getattr(authenticated, "is_authenticated", False):
+            identities["user"] = authenticated.display_name
+            return identities
+
+        client = scope.get("client")
+        identities["ip"] = client[0] if client else "anonymous"
+        user = headers.get("x-user-id")
+        if not user:
+            for pair in scope.get("query_string", b"").decode("latin-1").split("&"):
+                key, _, value = pair.partition("=")
+                if key == "user_id" and value:
+                    user = value
+                    break
+        if user:
+            identities["user"] = user
+        return identities
+
+    def estimate_tokens(self, payload) -> int:
+        """Prompt tokens in a JSON payload plus the reply budget; 0 when no text goes to the LLM"""
+        if not isinstance(payload, dict):
+            return 0
+
+        texts = [payload[field] for field in _TEXT_FIELDS if isinstance(payload.get(field), str)]
+        for message in payload.get("messages") or []:
+            if isinstance(message, dict) and isinstance(message.get("content"), str):
+                texts.append(message["content"])
+        if not texts:
+            return 0
+
+        # Imported here: src.memory pulls in the LLM engine
+        from src.memory.buffer import token_counter
+        return sum(token_counter.count(text) for text in texts) + settings.RATE_LIMIT_COMPLETION_TOKENS
+
+    def _buckets(self, identities: Dict[str, str], route: str, tokens: int) -> List[Bucket]:
+        buckets = []
+        for scope_name, identity in identities.items():
+            requests_per_minute, tokens_per_minute = self.budgets[scope_name]
+            buckets.append(Bucket(
+                f"{scope_name}:{identity}:requests:{route}",
+                requests_per_minute, requests_per_minute / 60, 1
+            ))
+            if tokens:
+                buckets.append(Bucket(
+                    f"{scope_name}:{identity}:tokens",
+                    tokens_per_minute, tokens_per_minute / 60, tokens
+                ))
+        return buckets
+
+    async def admit(self, scope, route: str, tokens: int = 0) -> Tuple[bool, float]:
+        """Charge one call to `route`; returns (allowed, seconds until it would be)"""
+        allowed, wait = await self.buckets.take(self._buckets(self.identities(scope), route, tokens))
+        if not allowed:
+            RATE_LIMIT_REJECTIONS.labels(route).inc()
+        return allowed, wait
+
+# Shared by the middleware and the WebSocket handler, which charges each message
+rate_limiter = RateLimiter()
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware admitting requests through `RateLimiter`.
+
+    Requests under `RATE_LIMIT_PATHS` are charged before routing, and
+    therefore before any database or model work; rejected requests get
+    429 with ``Retry-After``. WebSocket handshakes are charged one
+    request here, and each message afterwards by the handler.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+        self.paths = tuple(path for path in settings.RATE_LIMIT_PATHS.split(",") if path)
+
+    async def _read_body(self, receive) -> Tuple[bytes, List[Dict]]:
+        """Read the whole request body, keeping the messages to replay to the app"""
+        messages, chunks = [], []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        return b"".join(chunks), messages
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        route = self.limiter.route_for(scope)
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        tokens = 0
+        if scope["type"] == "http" and scope["method"] in ("POST", "PUT", "PATCH"):
+            body, buffered = await self._read_body(receive)
+            try:
+                tokens = self.limiter.estimate_tokens(json.loads(body) if body else None)
+            except ValueError:
+                pass
+            original_receive = receive
+
+            async def receive():
+                if buffered:
+                    return buffered.pop(0)
+                return await original_receive()
+
+        allowed, wait = await self.limiter.admit(scope, route, tokens)
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["type"] == "websocket":
+            # Closing before accepting answers the handshake with 403
+            await send({"type": "websocket.close", "code": 1008})
+            return
+        response = ORJSONResponse(
+            status_code=429,
+            content={"detail": "請求過於頻繁，請稍後再試"},
+            headers={"Retry-After": str(retry_after(wait))}
+        )
+        await response(scope, receive, send)
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime
-from src.services.chat import chat_service
+from datetime import datetime, timezone
+import orjson
+from src.services.chat import chat_service, ConversationBusy
+from src.services.idempotency import RequestInProgress
+from src.llm.engine import LLMOverloadedError
+from src.api.middlewares.rate_limit import rate_limiter
+from src.core.config import settings
+from src.db.redis.rate_limit import retry_after
 
 router = APIRouter()
 
@@ -11,6 +18,7 @@ class MessageCreate(BaseModel):
 
 class Message(BaseModel):
     message_id: str
+    seq: int
     role: str
     content: str
     timestamp: datetime
@@ -38,45 +46,187 @@ async def create_conversation(data: ConversationCreate):
         
         return {"conversation_id": conversation["conversation_id"]}
     
+    except (LLMOverloadedError, ConversationBusy):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"建立對話失敗：{str(e)}")
 
 @router.post("/conversations/{conversation_id}/messages")
-async def send_message(conversation_id: str, message: MessageCreate):
-    """在對話中發送訊息"""
+async def send_message(
+    conversation_id: str,
+    message: MessageCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255)
+):
+    """在對話中發送訊息（重複送出相同 Idempotency-Key 時回傳同一結果，不會再次呼叫模型）"""
     try:
-        response = await chat_service.generate_response(
+        response = await chat_service.send_message(
             conversation_id=conversation_id,
-            user_message=message.content
+            user_message=message.content,
+            idempotency_key=idempotency_key
         )
         return response
     
+    except (LLMOverloadedError, ConversationBusy, RequestInProgress):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"發送訊息失敗：{str(e)}")
 
+@router.post("/conversations/{conversation_id}/messages/stream")
+async def stream_message(conversation_id: str, message: MessageCreate):
+    """在對話中發送訊息，並以 Server-Sent Events 串流回應"""
+    events = chat_service.stream_response(
+        conversation_id=conversation_id,
+        user_message=message.content
+    )
+    # Wait for the first event before sending headers so an overloaded
+    # gateway is still answered with 503 + Retry-After
+    try:
+        first_event = await events.__anext__()
+    except BaseException:
+        await events.aclose()
+        raise
+    
+    async def event_stream():
+        try:
+            event = first_event
+            while True:
+                data = orjson.dumps(event, default=str).decode("utf-8")
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+                event = await events.__anext__()
+        except StopAsyncIteration:
+            pass
+        except (LLMOverloadedError, ConversationBusy) as e:
+            data = orjson.dumps({"type": "error", "response": str(e), "retry_after": e.retry_after}).decode("utf-8")
+            yield f"event: error\ndata: {data}\n\n"
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@router.websocket("/conversations/{conversation_id}/ws")
+async def conversation_websocket(websocket: WebSocket, conversation_id: str):
+    """以 WebSocket 發送訊息並串流回應"""
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            content = data.get("content") if isinstance(data, dict) else None
+            if not content:
+                await websocket.send_json({"type": "error", "response": "訊息內容不可為空"})
+                continue
+
+            # The handshake was charged once by the middleware; every
+            # message is a model call and is charged like a POST
+            if settings.RATE_LIMIT_ENABLED:
+                route = rate_limiter.route_for(websocket.scope)
+                allowed, wait = await rate_limiter.admit(websocket.scope, route, rate_limiter.estimate_tokens(data))
+                if not allowed:
+                    await websocket.send_json({
+                        "type": "error",
+                        "response": "請求過於頻繁，請稍後再試",
+                        "retry_after": retry_after(wait)
+                    })
+                    continue
+            
+            events = chat_service.stream_response(
+                conversation_id=conversation_id,
+                user_message=content
+            )
+            try:
+                async for event in events:
+                    await websocket.send_json(event)
+            except (LLMOverloadedError, ConversationBusy) as e:
+                await websocket.send_json({
+                    "type": "error",
+                    "response": str(e),
+                    "retry_after": e.retry_after
+                })
+            finally:
+                await events.aclose()
+    
+    except WebSocketDisconnect:
+        pass
+
 @router.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: str, limit: Optional[int] = 50):
-    """獲取對話歷史"""
+async def get_conversation(
+    conversation_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = Query(None, ge=0)
+):
+    """獲取對話歷史（以 before 游標向前分頁）"""
     try:
-        messages = await chat_service.get_conversation_history(
+        page = await chat_service.get_conversation_page(
             conversation_id=conversation_id,
-            limit=limit
+            limit=limit,
+            before=before
         )
-        return {"conversation_id": conversation_id, "messages": messages}
+        # Returned as a response so orjson serializes the message
+        # timestamps directly, without a jsonable_encoder pass
+        return ORJSONResponse({
+            "conversation_id": conversation_id,
+            "messages": page["messages"],
+            "next_cursor": page["next_cursor"]
+        })
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取對話歷史失敗：{str(e)}")
 
 @router.get("/conversations")
-async def get_active_conversations(user_id: str):
-    """獲取用戶的所有進行中對話"""
+async def get_active_conversations(
+    user_id: str,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """獲取用戶的進行中對話（依最後更新時間分頁，`next_cursor` 取得下一頁）"""
     try:
-        conversations = await chat_service.get_active_conversations(user_id)
-        return {"conversations": conversations}
+        return ORJSONResponse(
+            await chat_service.get_active_conversation_page(user_id, limit=limit, cursor=cursor)
+        )
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"獲取對話列表失敗：{str(e)}")
 
+@router.get("/export")
+async def export_conversations(
+    user_id: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(active|archived)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """匯出對話逐字稿（gzip 壓縮的 NDJSON，每行一個對話；可依用戶、狀態與建立時間 [since, until) 篩選）"""
+    chunks = chat_service.export_conversations(user_id=user_id, status=status, since=since, until=until)
+    # Read the first batch before sending headers so a failing store is
+    # still answered with 500
+    try:
+        first_chunk = await chunks.__anext__()
+    except Exception as e:
+        await chunks.aclose()
+        raise HTTPException(status_code=500, detail=f"匯出對話失敗：{str(e)}")
+    
+    async def body():
+        try:
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+    
+    filename = f"conversations-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.ndjson.gz"
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.delete("/conversations/{conversation_id}")
 async def end_conversation(conversation_id: str):
     """結束/封存對話"""
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict
-from src.llm.engine import llm_engine
+from typing import List, Dict, Optional
+from src.llm.engine import llm_engine, LLMOverloadedError
+from src.services.knowledge import knowledge_service
+from src.rag.cache import retrieval_cache
 
 router = APIRouter()
 
@@ -13,6 +15,10 @@ class Message(BaseModel):
 class SpecialKnowledgeRequest(BaseModel):
     messages: List[Dict[str, str]]
 
+class IngestRequest(BaseModel):
+    paths: List[str] = []
+    name: str = "default"
+
 @router.post("/special-knowledge")
 async def query_special_knowledge(request: SpecialKnowledgeRequest):
     """特殊知識查詢"""
@@ -21,5 +27,39 @@ async def query_special_knowledge(request: SpecialKnowledgeRequest):
             messages=request.messages
         )
         return {"response": response}
+    except LLMOverloadedError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/ingest", status_code=202)
+async def start_ingestion(request: IngestRequest):
+    """啟動知識庫批次匯入"""
+    try:
+        job = knowledge_service.start_ingestion(request.paths, name=request.name)
+        return job
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ingest")
+async def list_ingestion_jobs():
+    """列出知識庫匯入工作"""
+    return {"jobs": knowledge_service.list_jobs()}
+
+@router.get("/ingest/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """查詢知識庫匯入進度"""
+    job = knowledge_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Ingestion job not found: {job_id}")
+    return job
+
+@router.get("/cache/stats")
+async def get_retrieval_cache_stats():
+    """查詢檢索結果快取命中率與目前知識庫版本"""
+    try:
+        return await retrieval_cache.get_stats()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
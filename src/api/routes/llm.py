@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, List, Dict
-from src.llm.engine import llm_engine
+from src.llm.engine import llm_engine, LLMOverloadedError
+from src.llm.cache import response_cache
+from src.llm.router import chat_router
 
 router = APIRouter()
 
@@ -21,6 +23,8 @@ async def generate_response(request: GenerateRequest):
             system_prompt=request.system_prompt
         )
         return {"response": response}
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -39,5 +43,32 @@ async def detect_intent(request: TextAnalysisRequest):
     try:
         result = await llm_engine.detect_intent(request.text)
         return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get response cache hit/miss counters"""
+    try:
+        return await response_cache.get_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/gateway/stats")
+async def get_gateway_stats():
+    """Get per-model concurrency limits, queue depth and shedding counters"""
+    return llm_engine.gateway.get_stats()
+
+@router.get("/router/stats")
+async def get_router_stats():
+    """Get chat turns per route (canned, cheap or full model)"""
+    return chat_router.get_stats()
+
+@router.delete("/cache/{knowledge_base}")
+async def invalidate_cache(knowledge_base: str):
+    """Invalidate cached responses of a knowledge base"""
+    try:
+        generation = await response_cache.invalidate(knowledge_base)
+        return {"knowledge_base": knowledge_base, "generation": generation}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
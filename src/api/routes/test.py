@@ -18,6 +18,16 @@ async def test_mongodb():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"MongoDB connection failed: {str(e)}")
 
+@router.get("/test/postgres")
+async def test_postgres():
+    try:
+        # Test PostgreSQL connection
+        from src.db.postgres import postgres_client
+        await postgres_client.ping()
+        return {"status": "connected", "message": "PostgreSQL connection successful"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"PostgreSQL connection failed: {str(e)}")
+
 @router.get("/test/redis")
 async def test_redis():
     try:
@@ -0,0 +1,129 @@
+from typing import Dict, Optional
+import asyncio
+import logging
+import time
+from prometheus_client import Gauge
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = Gauge(
+    "app_startup_duration_seconds",
+    "Time spent in each startup step of this worker",
+    ["step"]
+)
+
+class ServiceContainer:
+    """
+    Process-wide clients and models, owned by the FastAPI lifespan.
+
+    Modules still import their singletons (`chat_collection`,
+    `redis_client`, `vector_store`, `llm_engine`, ...), but those only
+    connect or load on first use. `startup` forces that first use once
+    per worker so the first request does not pay for it, and `shutdown`
+    drains background writes and closes everything again. A failing
+    warmup step is logged and skipped; the client then initializes on
+    demand. Indexes and tables are ensured even with warmup disabled.
+    """
+
+    def __init__(self, warmup: bool = settings.STARTUP_WARMUP, drain_timeout: float = settings.SHUTDOWN_DRAIN_TIMEOUT):
+        self.warmup = warmup
+        self.drain_timeout = drain_timeout
+        self.timings: Dict[str, float] = {}
+        self.started_at: Optional[float] = None
+        self.ready = False
+
+    async def _step(self, name: str, coro) -> None:
+        started_at = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            logger.warning(f"Startup step '{name}' failed, continuing lazily: {str(e)}")
+        finally:
+            self.timings[name] = time.perf_counter() - started_at
+            STARTUP_SECONDS.labels(name).set(self.timings[name])
+
+    async def startup(self) -> None:
+        from src.db.conversations import conversation_store
+        from src.db.redis import redis_client
+        from src.db.vector import vector_store
+        from src.llm.engine import llm_engine
+        from src.rag.embeddings import embedding_service
+        from src.rag.retriever import retriever
+
+        self.started_at = time.perf_counter()
+
+        await self._step("schema", conversation_store.ensure_schema())
+
+        if self.warmup:
+            # Independent steps run concurrently; the keyword index needs
+            # the vector store, so it follows it
+            async def vector_and_index():
+                await self._step("vector_store", asyncio.to_thread(lambda: vector_store.collection))
+                if hasattr(retriever, "ensure_index"):
+                    await self._step("keyword_index", self._warm_index(retriever))
+
+            await asyncio.gather(
+                self._step(settings.CONVERSATION_STORE.lower(), conversation_store.warmup()),
+                self._step("redis", redis_client.ping()),
+                self._step("embedding_model", embedding_service.warmup()),
+                self._step("classifier", llm_engine.classifier.warmup()),
+                self._step("llm_client", asyncio.to_thread(lambda: llm_engine.chain)),
+                vector_and_index()
+            )
+
+        self.timings["total"] = time.perf_counter() - self.started_at
+        STARTUP_SECONDS.labels("total").set(self.timings["total"])
+        self.ready = True
+        logger.info(
+            "Startup finished in %.2fs (%s)",
+            self.timings["total"],
+            ", ".join(f"{name}={seconds:.2f}s" for name, seconds in self.timings.items() if name != "total")
+        )
+
+        conversation_store.start()
+
+    async def _warm_index(self, retriever) -> None:
+        loading = await retriever.ensure_index()
+        if loading is not None:
+            await loading
+
+    async def shutdown(self) -> None:
+        from src.db.conversations import conversation_store
+        from src.db.mongodb import mongodb_client
+        from src.db.redis import redis_client
+        from src.rag.embeddings import embedding_service
+        from src.rag.retriever import retriever
+        from src.services.chat import chat_service
+
+        self.ready = False
+
+        # Let pending message writes land before the clients go away
+        pending = list(chat_service._background_tasks)
+        if pending:
+            _, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+            if not_done:
+                logger.warning(f"Shutting down with {len(not_done)} unfinished background writes")
+        await conversation_store.stop(self.drain_timeout)
+
+        retriever.close()
+        embedding_service.close()
+        try:
+            await redis_client.close()
+        except Exception as e:
+            logger.warning(f"Closing Redis failed: {str(e)}")
+        try:
+            await conversation_store.close()
+        except Exception as e:
+            logger.warning(f"Closing the conversation store failed: {str(e)}")
+        mongodb_client.close()
+
+    def report(self) -> Dict:
+        """Startup timings of this worker in milliseconds"""
+        return {
+            "ready": self.ready,
+            "startup_ms": {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()}
+        }
+
+# Create container instance
+container = ServiceContainer()
@@ -0,0 +1,27 @@
+import json
+import logging
+import random
+from src.core.config import settings
+from src.core.metrics import RequestTrace
+
+slow_request_logger = logging.getLogger("slow_requests")
+
+def log_slow_request(trace: RequestTrace, status: int) -> None:
+    """Log a sampled stage breakdown for requests slower than the threshold"""
+    if not settings.SLOW_REQUEST_LOG_ENABLED:
+        return
+
+    duration_ms = trace.elapsed() * 1000
+    if duration_ms < settings.SLOW_REQUEST_THRESHOLD_MS:
+        return
+    if random.random() >= settings.SLOW_REQUEST_SAMPLE_RATE:
+        return
+
+    slow_request_logger.warning(json.dumps({
+        "method": trace.method,
+        "path": trace.path,
+        "route": trace.route,
+        "status": status,
+        "duration_ms": round(duration_ms, 1),
+        "stages_ms": trace.breakdown_ms()
+    }, ensure_ascii=False))
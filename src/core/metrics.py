@@ -0,0 +1,133 @@
+from typing import Callable, Dict, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency buckets in seconds; LLM calls routinely take several seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being served",
+    ["method"]
+)
+STAGE_SECONDS = Histogram(
+    "chat_stage_duration_seconds",
+    "Time spent in each stage of a chat turn",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens sent to and received from the LLM",
+    ["kind"]
+)
+CHAT_ROUTES = Counter(
+    "chat_routes_total",
+    "Chat turns by routing decision (canned, cheap or full model) and detected intent",
+    ["route", "intent"]
+)
+MESSAGE_FLUSH_LAG_SECONDS = Histogram(
+    "message_flush_lag_seconds",
+    "Time from queueing a message in the Redis stream to its MongoDB write",
+    buckets=LATENCY_BUCKETS
+)
+MESSAGE_STREAM_BACKLOG = Gauge(
+    "message_stream_backlog",
+    "Messages in the Redis stream not yet written to MongoDB"
+)
+DUPLICATE_REQUESTS = Counter(
+    "chat_duplicate_requests_total",
+    "Duplicate sends answered from another request's result instead of a new turn",
+    ["result"]
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total",
+    "Requests rejected with 429 by admission control, by route",
+    ["route"]
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and outcome",
+    ["cache", "result"]
+)
+
+class RequestTrace:
+    """Per-request stage breakdown, shared with tasks spawned by the request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.started_at = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def breakdown_ms(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+_current_stage: ContextVar[Optional[str]] = ContextVar("trace_stage", default=None)
+_trace_listeners: List[Callable[[RequestTrace, int], None]] = []
+
+def add_trace_listener(listener: Callable[[RequestTrace, int], None]) -> None:
+    """Register a callback receiving every finished trace and its status (used by benchmarks)"""
+    _trace_listeners.append(listener)
+
+def finish_trace(trace: RequestTrace, status: int) -> None:
+    trace.duration = trace.elapsed()
+    for listener in _trace_listeners:
+        listener(trace, status)
+
+def start_trace(method: str, path: str) -> RequestTrace:
+    """Begin tracing the current request; stages recorded below it attach here"""
+    trace = RequestTrace(method, path)
+    _current_trace.set(trace)
+    return trace
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration measured by the caller"""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+@contextmanager
+def stage(name: str):
+    """
+    Time a block as a pipeline stage.
+
+    Stages do not nest: inside another stage the block is attributed to
+    the outer one, so the breakdown of a request never double counts.
+    """
+    if _current_stage.get() is not None:
+        yield
+        return
+
+    token = _current_stage.set(name)
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        record_stage(name, time.perf_counter() - started_at)
+
+def record_cache(cache: str, result: str, count: int = 1) -> None:
+    """Count cache lookups; hit ratios are derived from these in Prometheus"""
+    CACHE_REQUESTS.labels(cache, result).inc(count)
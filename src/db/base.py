@@ -0,0 +1,107 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime
+
+class ConversationStore:
+    """
+    Storage of conversations and their messages, as `ChatService` uses it.
+
+    Conversations are returned as MongoDB-shaped documents
+    (``{"conversation_id", "user_id", "status", "created_at",
+    "updated_at", "metadata": {"total_messages", ...}, "summary"}``) and
+    messages as ``{"message_id", "role", "content", "timestamp", "seq"}``,
+    with timestamps in naive UTC, whichever backend stores them.
+
+    Every message gets a per-conversation sequence number from
+    `allocate_seq` before it is appended; appending a message that is
+    already stored is a no-op, so writes can be retried.
+    """
+
+    async def create(self, conversation: Dict) -> None:
+        """Store a new conversation document"""
+        raise NotImplementedError
+
+    async def exists(self, conversation_id: str) -> bool:
+        raise NotImplementedError
+
+    async def allocate_seq(
+        self,
+        conversation_id: str,
+        role: str,
+        timestamp: datetime,
+        fields: Tuple[str, ...] = ()
+    ) -> Optional[Tuple[int, Dict]]:
+        """
+        Reserve the next sequence number and touch conversation metadata.
+
+        Returns the sequence number and the conversation projected to
+        `fields`, or None if the conversation does not exist.
+        """
+        raise NotImplementedError
+
+    async def append(self, conversation_id: str, message: Dict) -> None:
+        """Store a message carrying ``seq``"""
+        raise NotImplementedError
+
+    async def read(self, conversation_id: str, limit: int, before: Optional[int] = None) -> List[Dict]:
+        """Read the last `limit` messages with ``seq`` lower than `before`, oldest first"""
+        raise NotImplementedError
+
+    async def end(self, conversation_id: str, timestamp: datetime) -> bool:
+        """Mark a conversation archived; False if it does not exist"""
+        raise NotImplementedError
+
+    async def list_active(
+        self,
+        user_id: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict]:
+        """
+        Active conversations of a user, most recently updated first.
+
+        `after` is the (updated_at, conversation_id) of the last
+        conversation of the previous page.
+        """
+        raise NotImplementedError
+
+    async def save_summary(self, conversation_id: str, summary: Dict) -> None:
+        """Store a rolling summary unless the stored one already covers more messages"""
+        raise NotImplementedError
+
+    def export(
+        self,
+        batch_size: int,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Conversations matching the filters, with all their messages.
+
+        Yields batches of at most `batch_size` conversations, each with
+        a ``messages`` list; `since` and `until` bound ``created_at``
+        (until exclusive). Only one batch is held in memory at a time.
+        """
+        raise NotImplementedError
+
+    async def load_archived(self, conversation_id: str) -> Optional[Dict]:
+        """A conversation moved to cold storage, with its messages"""
+        return None
+
+    # Lifecycle, driven by the service container
+
+    async def ensure_schema(self) -> None:
+        """Create the indexes or tables the queries rely on; runs at every startup"""
+
+    async def warmup(self) -> None:
+        """Connect ahead of the first request"""
+
+    def start(self) -> None:
+        """Start background work"""
+
+    async def stop(self, timeout: float) -> None:
+        """Finish background work, waiting at most `timeout` seconds"""
+
+    async def close(self) -> None:
+        """Release connections"""
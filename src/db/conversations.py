@@ -0,0 +1,19 @@
+from src.core.config import settings
+from src.db.base import ConversationStore
+
+def get_conversation_store() -> ConversationStore:
+    """Conversation store selected by `CONVERSATION_STORE`"""
+    backend = settings.CONVERSATION_STORE.lower()
+    if backend == "mongodb":
+        from src.db.mongodb.conversations import MongoConversationStore
+        return MongoConversationStore()
+    elif backend == "postgres":
+        # Imported here: SQLAlchemy is only needed by this backend
+        from src.db.postgres import postgres_client
+        from src.db.postgres.conversations import PostgresConversationStore
+        return PostgresConversationStore(postgres_client)
+    else:
+        raise ValueError(f"Unsupported conversation store: {settings.CONVERSATION_STORE}")
+
+# Create conversation store instance (connects on first use)
+conversation_store = get_conversation_store()
@@ -1,22 +1,90 @@
-from motor.motor_asyncio import AsyncIOMotorClient
+from typing import Optional
+import os
 from src.core.config import settings
+from .buckets import MessageBucketStore
+from .write_behind import WriteBehindMessageStore
 
-# Create MongoDB client
-mongodb_client = AsyncIOMotorClient(settings.MONGO_URI)
+class MongoClientManager:
+    """
+    Create the Motor client on first use, once per process.
 
-# Get database
-db = mongodb_client[settings.MONGO_DB_NAME]
+    Nothing connects at import time, and a worker forked from a parent
+    that already had a client gets a fresh one instead of sharing its
+    sockets.
+    """
+
+    def __init__(self, uri: str = settings.MONGO_URI, db_name: str = settings.MONGO_DB_NAME):
+        self.uri = uri
+        self.db_name = db_name
+        self._client = None
+        self._pid: Optional[int] = None
+
+    @property
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            if self.uri.startswith("memory://"):
+                # In-process stand-in for benchmarks and offline runs
+                from mongomock_motor import AsyncMongoMockClient
+                self._client = AsyncMongoMockClient()
+            else:
+                from motor.motor_asyncio import AsyncIOMotorClient
+                self._client = AsyncIOMotorClient(
+                    self.uri,
+                    maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=settings.MONGO_MIN_POOL_SIZE
+                )
+            self._pid = os.getpid()
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.db_name]
+
+    def __getattr__(self, name):
+        # Behave like the client itself (`mongodb_client.admin.command(...)`)
+        return getattr(self.client, name)
+
+    async def ping(self) -> None:
+        await self.client.admin.command("ping")
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+class LazyCollection:
+    """Collection handle resolved against the current process's client"""
+
+    def __init__(self, manager: MongoClientManager, name: str):
+        self._manager = manager
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._manager.db[self.name], attr)
+
+# Create MongoDB client (connects on first use)
+mongodb_client = MongoClientManager()
 
 # Get collections
-chat_collection = db[settings.CHAT_COLLECTION]
-user_collection = db[settings.USER_COLLECTION]
-knowledge_collection = db[settings.KNOWLEDGE_COLLECTION]
+chat_collection = LazyCollection(mongodb_client, settings.CHAT_COLLECTION)
+message_collection = LazyCollection(mongodb_client, settings.MESSAGE_COLLECTION)
+user_collection = LazyCollection(mongodb_client, settings.USER_COLLECTION)
+knowledge_collection = LazyCollection(mongodb_client, settings.KNOWLEDGE_COLLECTION)
+archive_collection = LazyCollection(mongodb_client, settings.ARCHIVE_COLLECTION)
+
+# Bucketed message storage, optionally acknowledged from a Redis stream
+if settings.MESSAGE_WRITE_BEHIND:
+    message_store = WriteBehindMessageStore(chat_collection, message_collection)
+else:
+    message_store = MessageBucketStore(chat_collection, message_collection)
 
 # Export all
 __all__ = [
     'mongodb_client',
-    'db',
     'chat_collection',
+    'message_collection',
+    'message_store',
     'user_collection',
-    'knowledge_collection'
-]
\ No newline at end of file
+    'knowledge_collection',
+    'archive_collection'
+]
@@ -0,0 +1,276 @@
+"""
+Cold storage for ended conversations.
+
+Conversations ended more than `ARCHIVE_AFTER_DAYS` ago are moved out of
+the hot collections into compressed JSON Lines files on local disk,
+partitioned by the day they were ended::
+
+    ARCHIVE_DIR/day=2024-05-01/part-<run>.jsonl.zst
+
+Each line is one conversation with its messages, written as its own
+zstd (or gzip) frame, so the files decompress with standard tools and
+load into DuckDB/Polars/Spark as they are, while a single transcript
+is read back by seeking to its frame. The ``chat_archive`` collection
+records where every transcript lives.
+
+A conversation is only deleted from ``chats`` and ``chat_messages``
+after its frame is on disk and catalogued, so an interrupted run is
+resumed by running it again:
+
+    python -m src.db.mongodb.archive --older-than-days 30 --max-per-second 20
+    python -m src.db.mongodb.archive --dry-run
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+import bson
+from pymongo import ASCENDING, UpdateOne
+from src.core.config import settings
+from src.db.mongodb import chat_collection, message_store, archive_collection
+
+logger = logging.getLogger(__name__)
+
+# Fields stored as ISO strings in the files and revived on read
+_DATETIME_FIELDS = ("created_at", "updated_at", "archived_at")
+
+def _codec(name: str) -> Tuple[str, Callable[[bytes], bytes], str]:
+    """Name, compressor and file suffix; zstd falls back to gzip when zstandard is missing"""
+    if name == "zstd":
+        try:
+            import zstandard
+            return "zstd", zstandard.ZstdCompressor(level=10).compress, "zst"
+        except ImportError:
+            logger.warning("zstandard is not installed, archiving with gzip")
+    elif name != "gzip":
+        raise ValueError(f"Unsupported archive codec: {name}")
+    return "gzip", lambda data: gzip.compress(data, compresslevel=6), "gz"
+
+def _decompress(codec: str, frame: bytes) -> bytes:
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return gzip.decompress(frame)
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _revive(record: Dict) -> Dict:
+    for field in _DATETIME_FIELDS:
+        if isinstance(record.get(field), str):
+            record[field] = datetime.fromisoformat(record[field])
+    for message in record.get("messages", []):
+        message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+    return record
+
+class _PartitionWriter:
+    """Append-only part files of one run, one per day partition"""
+
+    def __init__(self, directory: Path, run_id: str, suffix: str):
+        self.directory = directory
+        self.run_id = run_id
+        self.suffix = suffix
+        self._files: Dict[str, object] = {}
+
+    def write(self, day: str, frame: bytes) -> Tuple[str, int]:
+        """Append a frame; returns the part file (relative to the directory) and its offset"""
+        path = f"day={day}/part-{self.run_id}.jsonl.{self.suffix}"
+        file = self._files.get(path)
+        if file is None:
+            (self.directory / path).parent.mkdir(parents=True, exist_ok=True)
+            file = self._files[path] = open(self.directory / path, "ab")
+        offset = file.tell()
+        file.write(frame)
+        return path, offset
+
+    def sync(self) -> None:
+        """Make every frame written so far durable"""
+        for file in self._files.values():
+            file.flush()
+            os.fsync(file.fileno())
+
+    def close(self) -> None:
+        for file in self._files.values():
+            file.close()
+        self._files.clear()
+
+class ConversationArchive:
+    """Move ended conversations to compressed files and read them back"""
+
+    def __init__(self, conversations, store, catalogue, directory: str = settings.ARCHIVE_DIR, codec: str = settings.ARCHIVE_CODEC):
+        self.conversations = conversations
+        self.store = store
+        self.catalogue = catalogue
+        self.directory = Path(directory)
+        self.codec = codec
+
+    def get_current_time(self) -> datetime:
+        """Get current UTC time with timezone information"""
+        return datetime.now(timezone.utc)
+
+    async def archive(
+        self,
+        older_than: timedelta = timedelta(days=settings.ARCHIVE_AFTER_DAYS),
+        batch_size: int = settings.ARCHIVE_BATCH_SIZE,
+        max_per_second: float = settings.ARCHIVE_MAX_PER_SECOND,
+        dry_run: bool = False,
+        progress: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Archive every conversation ended before now minus `older_than`.
+
+        Works in batches of `batch_size`, paced to `max_per_second`
+        conversations. `bytes_removed` is the BSON size of the documents
+        deleted from the hot collections, `bytes_written` the compressed
+        size on disk.
+        """
+        stats = progress if progress is not None else {}
+        stats.update({"conversations": 0, "messages": 0, "bytes_removed": 0, "bytes_written": 0})
+        cutoff = self.get_current_time() - older_than
+
+        codec, compress, suffix = _codec(self.codec)
+        writer = _PartitionWriter(self.directory, f"{int(time.time())}-{os.getpid()}", suffix)
+        cursor = self.conversations.find(
+            {"status": "archived", "archived_at": {"$lt": cutoff}},
+            {"_id": 0}
+        ).sort("archived_at", ASCENDING).batch_size(batch_size)
+
+        try:
+            batch: List[Dict] = []
+            async for conversation in cursor:
+                batch.append(conversation)
+                if len(batch) >= batch_size:
+                    await self._archive_batch(batch, writer, codec, compress, dry_run, stats, max_per_second)
+                    batch = []
+            if batch:
+                await self._archive_batch(batch, writer, codec, compress, dry_run, stats, max_per_second)
+        finally:
+            writer.close()
+        return stats
+
+    async def _archive_batch(
+        self,
+        batch: List[Dict],
+        writer: _PartitionWriter,
+        codec: str,
+        compress: Callable[[bytes], bytes],
+        dry_run: bool,
+        stats: Dict,
+        max_per_second: float
+    ) -> None:
+        started_at = time.monotonic()
+        ids = [conversation["conversation_id"] for conversation in batch]
+        archived = {
+            entry["conversation_id"]: entry
+            async for entry in self.catalogue.find({"conversation_id": {"$in": ids}}, {"_id": 0})
+        }
+
+        entries = []
+        for conversation in batch:
+            conversation_id = conversation["conversation_id"]
+            total = conversation.get("metadata", {}).get("total_messages", 0)
+            messages = await self.store.read(conversation_id, total) if total else []
+            stats["messages"] += len(messages)
+            stats["bytes_removed"] += len(bson.encode(conversation)) + len(bson.encode({"messages": messages}))
+
+            previous = archived.get(conversation_id)
+            if previous is not None and previous["messages"] >= len(messages):
+                # An interrupted run stored it but did not get to delete everything
+                continue
+
+            line = json.dumps({**conversation, "messages": messages}, ensure_ascii=False, default=_json_default) + "\n"
+            frame = compress(line.encode("utf-8"))
+            stats["bytes_written"] += len(frame)
+            if dry_run:
+                continue
+
+            day = (conversation.get("archived_at") or conversation["updated_at"]).strftime("%Y-%m-%d")
+            path, offset = writer.write(day, frame)
+            entries.append({
+                "conversation_id": conversation_id,
+                "user_id": conversation.get("user_id"),
+                "day": day,
+                "path": path,
+                "offset": offset,
+                "length": len(frame),
+                "codec": codec,
+                "messages": len(messages),
+                "archived_at": conversation.get("archived_at"),
+                "stored_at": self.get_current_time()
+            })
+
+        stats["conversations"] += len(batch)
+        if dry_run:
+            return
+
+        # Frames must be durable and findable before the hot copies go
+        writer.sync()
+        if entries:
+            await self.catalogue.bulk_write(
+                [
+                    UpdateOne({"conversation_id": entry["conversation_id"]}, {"$set": entry}, upsert=True)
+                    for entry in entries
+                ],
+                ordered=False
+            )
+        for conversation_id in ids:
+            await self.store.delete(conversation_id)
+            await self.conversations.delete_one({"conversation_id": conversation_id, "status": "archived"})
+
+        logger.info(
+            f"Archived {stats['conversations']} conversations, "
+            f"{stats['bytes_removed']} bytes removed, {stats['bytes_written']} bytes written"
+        )
+
+        if max_per_second > 0:
+            pause = len(batch) / max_per_second - (time.monotonic() - started_at)
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+    async def load(self, conversation_id: str) -> Optional[Dict]:
+        """An archived conversation with all its messages, or None if it was never archived"""
+        entry = await self.catalogue.find_one({"conversation_id": conversation_id}, {"_id": 0})
+        if entry is None:
+            return None
+
+        def read_frame() -> bytes:
+            with open(self.directory / entry["path"], "rb") as file:
+                file.seek(entry["offset"])
+                return file.read(entry["length"])
+
+        frame = await asyncio.to_thread(read_frame)
+        return _revive(json.loads(_decompress(entry["codec"], frame)))
+
+conversation_archive = ConversationArchive(chat_collection, message_store, archive_collection)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move ended conversations to cold storage")
+    parser.add_argument("--older-than-days", type=float, default=settings.ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--max-per-second", type=float, default=settings.ARCHIVE_MAX_PER_SECOND, help="0 for unthrottled")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = asyncio.run(conversation_archive.archive(
+        timedelta(days=args.older_than_days),
+        batch_size=args.batch_size,
+        max_per_second=args.max_per_second,
+        dry_run=args.dry_run
+    ))
+    ratio = stats["bytes_removed"] / stats["bytes_written"] if stats["bytes_written"] else 0
+    print(
+        f"Conversations: {stats['conversations']}, messages: {stats['messages']}, "
+        f"bytes reclaimed: {stats['bytes_removed']}, bytes written: {stats['bytes_written']} ({ratio:.1f}x)"
+    )
+
+if __name__ == "__main__":
+    main()
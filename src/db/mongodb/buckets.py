@@ -0,0 +1,158 @@
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+from pymongo import ReturnDocument, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from src.core.config import settings
+from src.core.metrics import stage
+
+class MessageBucketStore:
+    """
+    Store conversation messages in fixed-size buckets.
+
+    Every message gets a per-conversation sequence number allocated from
+    ``metadata.total_messages`` on the conversation document, and lives in
+    the bucket ``seq // bucket_size``. A bucket document looks like::
+
+        {"conversation_id": ..., "bucket": 3, "count": 50, "messages": [...]}
+
+    so a conversation never grows a single unbounded document and reads
+    only touch the buckets that cover the requested range.
+    """
+
+    def __init__(self, conversations, buckets, bucket_size: int = None):
+        self.conversations = conversations
+        self.buckets = buckets
+        self.bucket_size = bucket_size or settings.MESSAGE_BUCKET_SIZE
+
+    def bucket_for(self, seq: int) -> int:
+        """Bucket number holding the message with sequence `seq`"""
+        return seq // self.bucket_size
+
+    async def allocate_seq(
+        self,
+        conversation_id: str,
+        role: str,
+        timestamp: datetime,
+        fields: Tuple[str, ...] = ()
+    ) -> Optional[Tuple[int, Dict]]:
+        """
+        Reserve the next sequence number and touch conversation metadata.
+
+        Returns the sequence number and the conversation document
+        projected to `fields`, or None if the conversation does not exist.
+        """
+        update_data = {
+            "$set": {"updated_at": timestamp},
+            "$inc": {"metadata.total_messages": 1}
+        }
+
+        # Update last message time based on role
+        if role == "user":
+            update_data["$set"]["metadata.last_user_message_time"] = timestamp
+        elif role == "assistant":
+            update_data["$set"]["metadata.last_assistant_message_time"] = timestamp
+
+        with stage("mongo_append"):
+            conversation = await self.conversations.find_one_and_update(
+                {"conversation_id": conversation_id},
+                update_data,
+                projection={"_id": 0, "metadata.total_messages": 1, **{field: 1 for field in fields}},
+                return_document=ReturnDocument.AFTER
+            )
+
+        if not conversation:
+            return None
+        return conversation["metadata"]["total_messages"] - 1, conversation
+
+    async def append(self, conversation_id: str, message: Dict, tail: int = 0) -> List[Dict]:
+        """
+        Push a message (which must carry ``seq``) into its bucket.
+
+        Returns up to `tail` of the latest messages, reading older buckets
+        only when the current one holds fewer than `tail` messages.
+        Re-appending a message that is already stored is a no-op, which
+        makes retries safe.
+        """
+        bucket = self.bucket_for(message["seq"])
+
+        query = {
+            "conversation_id": conversation_id,
+            "bucket": bucket,
+            "messages.message_id": {"$ne": message["message_id"]}
+        }
+        update_data = {
+            # Concurrent writers may push out of order; keep the bucket
+            # sorted so slices stay chronological
+            "$push": {"messages": {"$each": [message], "$sort": {"seq": 1}}},
+            "$inc": {"count": 1},
+            "$set": {"updated_at": message["timestamp"]},
+            "$setOnInsert": {"created_at": message["timestamp"]}
+        }
+        projection = {"_id": 0, "messages": {"$slice": -tail}} if tail else {"_id": 1}
+
+        with stage("mongo_append"):
+            try:
+                document = await self.buckets.find_one_and_update(
+                    query,
+                    update_data,
+                    projection=projection,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Either another writer created the bucket first or the message
+                # is already stored; retry against the existing bucket
+                document = await self.buckets.find_one_and_update(
+                    query,
+                    update_data,
+                    projection=projection,
+                    return_document=ReturnDocument.AFTER
+                )
+
+        if not tail:
+            return []
+
+        with stage("history_read"):
+            if document is None:
+                return await self.read(conversation_id, tail)
+
+            messages = document.get("messages", [])
+            if len(messages) < tail and bucket > 0:
+                older = await self.read(
+                    conversation_id,
+                    tail - len(messages),
+                    before=bucket * self.bucket_size
+                )
+                messages = older + messages
+            return messages
+
+    async def read(self, conversation_id: str, limit: int, before: Optional[int] = None) -> List[Dict]:
+        """Read the last `limit` messages with ``seq`` lower than `before`"""
+        if limit <= 0 or (before is not None and before <= 0):
+            return []
+
+        query = {"conversation_id": conversation_id}
+        if before is not None:
+            query["bucket"] = {"$lte": self.bucket_for(before - 1)}
+
+        # One extra bucket covers a partially filled latest bucket
+        max_buckets = -(-limit // self.bucket_size) + 1
+        cursor = self.buckets.find(
+            query,
+            {"_id": 0, "messages": 1}
+        ).sort("bucket", DESCENDING).limit(max_buckets)
+
+        messages = []
+        async for document in cursor:
+            messages = document.get("messages", []) + messages
+            if len(messages) >= limit and before is None:
+                break
+
+        if before is not None:
+            messages = [msg for msg in messages if msg["seq"] < before]
+        return messages[-limit:]
+
+    async def delete(self, conversation_id: str) -> int:
+        """Remove all buckets of a conversation"""
+        result = await self.buckets.delete_many({"conversation_id": conversation_id})
+        return result.deleted_count
@@ -0,0 +1,167 @@
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime
+import logging
+from pymongo import DESCENDING
+from src.db.base import ConversationStore
+from src.db.mongodb import mongodb_client, chat_collection, message_store
+from src.db.mongodb.archive import conversation_archive
+from src.db.mongodb.indexes import CONVERSATION_LIST_FIELDS, ensure_indexes, verify_indexes
+
+logger = logging.getLogger(__name__)
+
+class MongoConversationStore(ConversationStore):
+    """
+    Conversations in ``chats``, messages in bucketed ``chat_messages``.
+
+    Message writes go through `message_store` (optionally write-behind);
+    conversations moved to cold storage are read back from the archive.
+    """
+
+    def __init__(self, conversations=chat_collection, messages=message_store):
+        self.conversations = conversations
+        self.messages = messages
+
+    async def create(self, conversation: Dict) -> None:
+        # insert_one adds the _id to the document it is given
+        await self.conversations.insert_one(dict(conversation))
+
+    async def exists(self, conversation_id: str) -> bool:
+        conversation = await self.conversations.find_one(
+            {"conversation_id": conversation_id},
+            {"_id": 1}
+        )
+        return conversation is not None
+
+    async def allocate_seq(
+        self,
+        conversation_id: str,
+        role: str,
+        timestamp: datetime,
+        fields: Tuple[str, ...] = ()
+    ) -> Optional[Tuple[int, Dict]]:
+        return await self.messages.allocate_seq(conversation_id, role, timestamp, fields=fields)
+
+    async def append(self, conversation_id: str, message: Dict) -> None:
+        await self.messages.append(conversation_id, message)
+
+    async def read(self, conversation_id: str, limit: int, before: Optional[int] = None) -> List[Dict]:
+        return await self.messages.read(conversation_id, limit, before=before)
+
+    async def end(self, conversation_id: str, timestamp: datetime) -> bool:
+        result = await self.conversations.find_one_and_update(
+            {"conversation_id": conversation_id},
+            {
+                "$set": {
+                    "status": "archived",
+                    "archived_at": timestamp,
+                    "updated_at": timestamp
+                }
+            },
+            projection={"_id": 1}
+        )
+        return result is not None
+
+    async def list_active(
+        self,
+        user_id: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict]:
+        # Projected to the fields of the user_status_updated index so the
+        # query is answered from the index alone
+        query = {"user_id": user_id, "status": "active"}
+        if after:
+            updated_at, conversation_id = after
+            query["$or"] = [
+                {"updated_at": {"$lt": updated_at}},
+                {"updated_at": updated_at, "conversation_id": {"$lt": conversation_id}}
+            ]
+        return await self.conversations.find(
+            query,
+            {"_id": 0, **{field: 1 for field in CONVERSATION_LIST_FIELDS}}
+        ).sort(
+            [("updated_at", DESCENDING), ("conversation_id", DESCENDING)]
+        ).limit(limit).to_list(length=limit)
+
+    async def save_summary(self, conversation_id: str, summary: Dict) -> None:
+        # Never move an existing summary backwards
+        await self.conversations.update_one(
+            {
+                "conversation_id": conversation_id,
+                "$or": [
+                    {"summary.upto_seq": {"$lt": summary["upto_seq"]}},
+                    {"summary": {"$exists": False}}
+                ]
+            },
+            {"$set": {"summary": summary}}
+        )
+
+    async def export(
+        self,
+        batch_size: int,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> AsyncIterator[List[Dict]]:
+        query = {}
+        if user_id:
+            query["user_id"] = user_id
+        if status:
+            query["status"] = status
+        if since or until:
+            query["created_at"] = {}
+            if since:
+                query["created_at"]["$gte"] = since
+            if until:
+                query["created_at"]["$lt"] = until
+
+        # Unsorted, so the server streams matches instead of sorting them
+        cursor = self.conversations.find(query, {"_id": 0, "summary": 0}).batch_size(batch_size)
+        batch: List[Dict] = []
+        async for conversation in cursor:
+            batch.append(conversation)
+            if len(batch) >= batch_size:
+                yield await self._with_messages(batch)
+                batch = []
+        if batch:
+            yield await self._with_messages(batch)
+
+    async def _with_messages(self, conversations: List[Dict]) -> List[Dict]:
+        """Attach every stored message, reading the buckets of the whole batch in one query"""
+        buckets: Dict[str, List[Dict]] = {conversation["conversation_id"]: [] for conversation in conversations}
+        async for bucket in self.messages.buckets.find(
+            {"conversation_id": {"$in": list(buckets)}},
+            {"_id": 0, "conversation_id": 1, "bucket": 1, "messages": 1}
+        ):
+            buckets[bucket["conversation_id"]].append(bucket)
+
+        for conversation in conversations:
+            ordered = sorted(buckets[conversation["conversation_id"]], key=lambda bucket: bucket["bucket"])
+            conversation["messages"] = [message for bucket in ordered for message in bucket.get("messages", [])]
+        return conversations
+
+    async def load_archived(self, conversation_id: str) -> Optional[Dict]:
+        return await conversation_archive.load(conversation_id)
+
+    async def ensure_schema(self) -> None:
+        # The unique conversation_bucket index is what makes concurrent
+        # bucket upserts safe, so it cannot wait for a migration
+        await ensure_indexes()
+        missing = await verify_indexes()
+        if missing:
+            logger.error(f"Missing MongoDB indexes: {missing}")
+
+    async def warmup(self) -> None:
+        await mongodb_client.ping()
+
+    def start(self) -> None:
+        if hasattr(self.messages, "flusher"):
+            self.messages.flusher.start()
+
+    async def stop(self, timeout: float) -> None:
+        if hasattr(self.messages, "flusher"):
+            await self.messages.flusher.stop(timeout)
+
+    async def close(self) -> None:
+        mongodb_client.close()
@@ -0,0 +1,167 @@
+"""
+Index bootstrap and query plan checks.
+
+Every index the application's queries rely on is declared in `INDEXES`.
+`ensure_indexes` creates them (a no-op when they already exist) and runs
+at startup; `verify_indexes` reports any that are missing. The hot
+queries are listed in `HOT_QUERIES` and `check_query_plans` runs
+``explain`` on each, failing when one falls back to a collection scan:
+
+    python -m src.db.mongodb.indexes --ensure --check
+
+exits with status 1 if an index is missing or a hot query scans, so it
+can gate CI against a real MongoDB.
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import logging
+import sys
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from src.core.config import settings
+from src.db.mongodb import mongodb_client
+
+logger = logging.getLogger(__name__)
+
+# Conversation list: equality on user_id + status, newest first, with
+# conversation_id as the tiebreaker for keyset pagination. The trailing
+# fields make the projected list query covered (answered from the index).
+CONVERSATION_LIST_FIELDS = ["conversation_id", "created_at", "updated_at", "metadata.total_messages"]
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    settings.CHAT_COLLECTION: [
+        IndexModel([("conversation_id", ASCENDING)], name="conversation_id", unique=True),
+        IndexModel(
+            [
+                ("user_id", ASCENDING),
+                ("status", ASCENDING),
+                ("updated_at", DESCENDING),
+                ("conversation_id", DESCENDING),
+                ("created_at", ASCENDING),
+                ("metadata.total_messages", ASCENDING),
+            ],
+            name="user_status_updated"
+        ),
+        # Archival job: ended conversations, oldest first
+        IndexModel([("status", ASCENDING), ("archived_at", ASCENDING)], name="status_archived_at"),
+    ],
+    settings.MESSAGE_COLLECTION: [
+        IndexModel(
+            [("conversation_id", ASCENDING), ("bucket", DESCENDING)],
+            name="conversation_bucket",
+            unique=True
+        ),
+    ],
+    settings.ARCHIVE_COLLECTION: [
+        IndexModel([("conversation_id", ASCENDING)], name="conversation_id", unique=True),
+    ],
+}
+
+# Representative shapes of the queries served on the request path
+HOT_QUERIES = [
+    {
+        "name": "conversation_by_id",
+        "collection": settings.CHAT_COLLECTION,
+        "filter": {"conversation_id": "explain-probe"},
+        "projection": {"_id": 1},
+    },
+    {
+        "name": "active_conversations",
+        "collection": settings.CHAT_COLLECTION,
+        "filter": {"user_id": "explain-probe", "status": "active"},
+        "projection": {"_id": 0, **{field: 1 for field in CONVERSATION_LIST_FIELDS}},
+        "sort": [("updated_at", DESCENDING), ("conversation_id", DESCENDING)],
+        "limit": 20,
+        "covered": True,
+    },
+    {
+        "name": "message_buckets",
+        "collection": settings.MESSAGE_COLLECTION,
+        "filter": {"conversation_id": "explain-probe", "bucket": {"$lte": 3}},
+        "projection": {"_id": 0, "messages": 1},
+        "sort": [("bucket", DESCENDING)],
+        "limit": 2,
+    },
+]
+
+async def ensure_indexes(db=None) -> None:
+    """Create every declared index that does not exist yet"""
+    db = db if db is not None else mongodb_client.db
+    for collection, indexes in INDEXES.items():
+        await db[collection].create_indexes(indexes)
+
+async def verify_indexes(db=None) -> Dict[str, List[str]]:
+    """Return the declared indexes missing per collection"""
+    db = db if db is not None else mongodb_client.db
+    missing = {}
+    for collection, indexes in INDEXES.items():
+        existing = await db[collection].index_information()
+        absent = [index.document["name"] for index in indexes if index.document["name"] not in existing]
+        if absent:
+            missing[collection] = absent
+    return missing
+
+def _stages(plan: Dict) -> List[str]:
+    """Flatten the stage names of a query plan tree"""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _stages(child)
+    return [stage for stage in stages if stage]
+
+async def explain_query(query: Dict, db=None) -> List[str]:
+    """Stages of the winning plan of a hot query"""
+    db = db if db is not None else mongodb_client.db
+    cursor = db[query["collection"]].find(query["filter"], query.get("projection"))
+    if query.get("sort"):
+        cursor = cursor.sort(query["sort"])
+    if query.get("limit"):
+        cursor = cursor.limit(query["limit"])
+    explanation = await cursor.explain()
+    return _stages(explanation["queryPlanner"]["winningPlan"])
+
+async def check_query_plans(db=None) -> List[str]:
+    """Describe every hot query that scans the collection or is not covered as intended"""
+    problems = []
+    for query in HOT_QUERIES:
+        stages = await explain_query(query, db)
+        if "COLLSCAN" in stages:
+            problems.append(f"{query['name']}: collection scan ({' <- '.join(stages)})")
+        elif query.get("covered") and "FETCH" in stages:
+            problems.append(f"{query['name']}: not covered by its index ({' <- '.join(stages)})")
+    return problems
+
+async def run(ensure: bool, check: bool) -> int:
+    if ensure:
+        await ensure_indexes()
+        logger.info("Indexes ensured")
+
+    failed = False
+    missing = await verify_indexes()
+    for collection, names in missing.items():
+        logger.error(f"Missing indexes on {collection}: {', '.join(names)}")
+        failed = True
+
+    if check:
+        problems = await check_query_plans()
+        for problem in problems:
+            logger.error(problem)
+        failed = failed or bool(problems)
+        if not problems:
+            logger.info(f"All {len(HOT_QUERIES)} hot queries use an index")
+
+    return 1 if failed else 0
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Create and verify MongoDB indexes")
+    parser.add_argument("--ensure", action="store_true", help="Create missing indexes first")
+    parser.add_argument("--check", action="store_true", help="Fail if a hot query scans the collection")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(run(args.ensure, args.check)))
+
+if __name__ == "__main__":
+    main()
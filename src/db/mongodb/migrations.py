@@ -0,0 +1,95 @@
+"""
+Migrate embedded conversation messages into bucketed storage.
+
+Older conversations keep every message in a ``messages`` array on the
+``chats`` document. This moves them into ``chat_messages`` buckets and
+removes the embedded array. The migration is idempotent and can be
+interrupted and re-run at any time:
+
+    python -m src.db.mongodb.migrations --batch-size 100
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import logging
+from pymongo.errors import DuplicateKeyError
+from src.db.mongodb import chat_collection, message_store
+from src.db.mongodb.indexes import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+async def migrate_conversation(conversation: Dict) -> int:
+    """Move the embedded messages of one conversation into buckets"""
+    conversation_id = conversation["conversation_id"]
+    messages: List[Dict] = conversation.get("messages") or []
+
+    buckets: Dict[int, List[Dict]] = {}
+    for seq, message in enumerate(messages):
+        message = dict(message, seq=seq)
+        buckets.setdefault(message_store.bucket_for(seq), []).append(message)
+
+    for bucket, bucket_messages in buckets.items():
+        try:
+            # Skip buckets already holding this chunk from an earlier run
+            await message_store.buckets.update_one(
+                {
+                    "conversation_id": conversation_id,
+                    "bucket": bucket,
+                    "messages.seq": {"$ne": bucket_messages[0]["seq"]}
+                },
+                {
+                    "$push": {"messages": {"$each": bucket_messages, "$sort": {"seq": 1}}},
+                    "$inc": {"count": len(bucket_messages)},
+                    "$set": {"updated_at": bucket_messages[-1]["timestamp"]},
+                    "$setOnInsert": {"created_at": bucket_messages[0]["timestamp"]}
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+
+    # Only drop the array if nothing was appended to it meanwhile
+    await chat_collection.update_one(
+        {"conversation_id": conversation_id, "messages": {"$size": len(messages)}},
+        {
+            "$unset": {"messages": ""},
+            "$max": {"metadata.total_messages": len(messages)}
+        }
+    )
+    return len(messages)
+
+async def migrate_embedded_messages(batch_size: int = 100, dry_run: bool = False) -> Dict:
+    """Migrate every conversation that still has an embedded messages array"""
+    await ensure_indexes()
+
+    stats = {"conversations": 0, "messages": 0}
+    cursor = chat_collection.find(
+        {"messages": {"$exists": True}},
+        {"_id": 0, "conversation_id": 1, "messages": 1}
+    ).batch_size(batch_size)
+
+    async for conversation in cursor:
+        if dry_run:
+            migrated = len(conversation.get("messages") or [])
+        else:
+            migrated = await migrate_conversation(conversation)
+
+        stats["conversations"] += 1
+        stats["messages"] += migrated
+        if stats["conversations"] % batch_size == 0:
+            logger.info(f"Migrated {stats['conversations']} conversations, {stats['messages']} messages")
+
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Move embedded chat messages into buckets")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = asyncio.run(migrate_embedded_messages(args.batch_size, args.dry_run))
+    print(f"Conversations: {stats['conversations']}, messages: {stats['messages']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from redis.exceptions import ResponseError
+from src.core.config import settings
+from src.core.metrics import stage, MESSAGE_FLUSH_LAG_SECONDS, MESSAGE_STREAM_BACKLOG
+from .buckets import MessageBucketStore
+
+logger = logging.getLogger(__name__)
+
+# Next sequence number of a conversation; the counter expires once idle.
+# A missing counter (new, expired or evicted) is only recreated from the
+# seed in ARGV[1]; without one the script returns nil so the caller can
+# compute it. Returns the value before the increment.
+_NEXT_SEQ_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if ARGV[1] == '' then
+        return nil
+    end
+    redis.call('SET', KEYS[1], ARGV[1])
+end
+local seq = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return seq - 1
+"""
+
+def _encode(conversation_id: str, message: Dict) -> str:
+    return json.dumps(
+        {**message, "conversation_id": conversation_id, "timestamp": message["timestamp"].isoformat()},
+        ensure_ascii=False
+    )
+
+def _decode(payload: str) -> Dict:
+    message = json.loads(payload)
+    message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+    return message
+
+def _strip(message: Dict) -> Dict:
+    """Message as stored in a bucket"""
+    return {key: value for key, value in message.items() if key != "conversation_id"}
+
+class WriteBehindMessageStore(MessageBucketStore):
+    """
+    Bucketed message storage that acknowledges writes from Redis.
+
+    A message is appended to a Redis stream, and indexed in a
+    per-conversation sorted set of unflushed messages, in one
+    transaction. `MessageFlusher` later moves stream entries into the
+    buckets with bulk writes. Reads merge the unflushed messages with
+    the stored ones, so a conversation always shows its latest turns.
+
+    Sequence numbers come from a Redis counter per conversation that
+    expires after `MESSAGE_SEQ_IDLE_TTL` idle seconds. Whenever it is
+    missing (new, expired or evicted from a cache Redis) it is seeded
+    past both ``metadata.total_messages`` and the highest unflushed
+    message, so it never hands out a stored seq again. The conversation metadata
+    (``total_messages``, ``updated_at``, last message times) is updated
+    when the messages are flushed.
+    """
+
+    SEQ_PREFIX = "chat:seq"
+    PENDING_PREFIX = "chat:pending"
+
+    def __init__(
+        self,
+        conversations,
+        buckets,
+        bucket_size: int = None,
+        stream: str = settings.MESSAGE_STREAM_KEY,
+        seq_ttl: int = settings.MESSAGE_SEQ_IDLE_TTL
+    ):
+        super().__init__(conversations, buckets, bucket_size)
+        self.stream = stream
+        self.seq_ttl = seq_ttl
+        self.flusher = MessageFlusher(self)
+        self._seq_script = None
+
+    @property
+    def redis(self):
+        from src.db.redis import redis_client
+        return redis_client.redis
+
+    def _seq_key(self, conversation_id: str) -> str:
+        return f"{self.SEQ_PREFIX}:{conversation_id}"
+
+    def _pending_key(self, conversation_id: str) -> str:
+        return f"{self.PENDING_PREFIX}:{conversation_id}"
+
+    async def _next_seq(self, conversation_id: str) -> Optional[int]:
+        if self._seq_script is None:
+            self._seq_script = self.redis.register_script(_NEXT_SEQ_SCRIPT)
+        keys = [self._seq_key(conversation_id)]
+        seq = await self._seq_script(keys=keys, args=["", self.seq_ttl])
+        if seq is not None:
+            return seq
+
+        # Pending first: the flusher stores a message before unindexing
+        # it, so one flushed in between is seen by the second read
+        highest = await self.redis.zrevrange(self._pending_key(conversation_id), 0, 0, withscores=True)
+        conversation = await self.conversations.find_one(
+            {"conversation_id": conversation_id},
+            {"_id": 0, "metadata.total_messages": 1}
+        )
+        if not conversation:
+            return None
+        seed = conversation["metadata"]["total_messages"]
+        if highest:
+            seed = max(seed, int(highest[0][1]) + 1)
+        # Only the first seeder sets the counter; later ones increment it
+        return await self._seq_script(keys=keys, args=[seed, self.seq_ttl])
+
+    async def allocate_seq(
+        self,
+        conversation_id: str,
+        role: str,
+        timestamp: datetime,
+        fields: Tuple[str, ...] = ()
+    ) -> Optional[Tuple[int, Dict]]:
+        """Reserve the next sequence number; metadata is updated on flush"""
+        with stage("stream_append"):
+            if not fields:
+                seq = await self._next_seq(conversation_id)
+                return None if seq is None else (seq, {})
+
+            seq, conversation = await asyncio.gather(
+                self._next_seq(conversation_id),
+                self.conversations.find_one(
+                    {"conversation_id": conversation_id},
+                    {"_id": 0, **{field: 1 for field in fields}}
+                )
+            )
+        if seq is None or conversation is None:
+            return None
+        return seq, conversation
+
+    async def append(self, conversation_id: str, message: Dict, tail: int = 0) -> List[Dict]:
+        """Queue a message (which must carry ``seq``) for the flusher"""
+        payload = _encode(conversation_id, message)
+        with stage("stream_append"):
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.xadd(self.stream, {"payload": payload})
+                pipe.zadd(self._pending_key(conversation_id), {payload: message["seq"]})
+                await pipe.execute()
+
+        if not tail:
+            return []
+        with stage("history_read"):
+            return await self.read(conversation_id, tail)
+
+    async def _read_pending(self, conversation_id: str, limit: int, before: Optional[int]) -> List[Dict]:
+        payloads = await self.redis.zrevrangebyscore(
+            self._pending_key(conversation_id),
+            "+inf" if before is None else f"({before}",
+            "-inf",
+            start=0,
+            num=limit
+        )
+        return [_strip(_decode(payload)) for payload in reversed(payloads)]
+
+    async def read(self, conversation_id: str, limit: int, before: Optional[int] = None) -> List[Dict]:
+        """Read the last `limit` messages, flushed or not, with ``seq`` lower than `before`"""
+        if limit <= 0 or (before is not None and before <= 0):
+            return []
+
+        stored, pending = await asyncio.gather(
+            super().read(conversation_id, limit, before=before),
+            self._read_pending(conversation_id, limit, before)
+        )
+        merged = {msg["seq"]: msg for msg in stored}
+        merged.update((msg["seq"], msg) for msg in pending)
+        return [merged[seq] for seq in sorted(merged)][-limit:]
+
+    async def delete(self, conversation_id: str) -> int:
+        await self.redis.delete(self._pending_key(conversation_id), self._seq_key(conversation_id))
+        return await super().delete(conversation_id)
+
+    async def flush_entries(self, entries: List[Tuple[str, Dict]]) -> None:
+        """Write stream entries to their buckets, then acknowledge them"""
+        messages: Dict[str, Tuple[str, Dict, str]] = {}
+        for _, fields in entries:
+            message = _decode(fields["payload"])
+            # A retried append can queue the same message twice
+            messages.setdefault(
+                message["message_id"],
+                (message.pop("conversation_id"), message, fields["payload"])
+            )
+
+        groups: Dict[Tuple[str, int], List[Dict]] = {}
+        conversations: Dict[str, Dict] = {}
+        for conversation_id, message, _ in messages.values():
+            groups.setdefault((conversation_id, self.bucket_for(message["seq"])), []).append(message)
+
+            latest = conversations.setdefault(conversation_id, {
+                "updated_at": message["timestamp"],
+                "metadata.total_messages": message["seq"] + 1
+            })
+            latest["updated_at"] = max(latest["updated_at"], message["timestamp"])
+            latest["metadata.total_messages"] = max(latest["metadata.total_messages"], message["seq"] + 1)
+            if message["role"] in ("user", "assistant"):
+                field = f"metadata.last_{message['role']}_message_time"
+                latest[field] = max(latest.get(field, message["timestamp"]), message["timestamp"])
+
+        keys = list(groups)
+        operations = []
+        for conversation_id, bucket in keys:
+            group = sorted(groups[(conversation_id, bucket)], key=lambda msg: msg["seq"])
+            operations.append(UpdateOne(
+                {
+                    "conversation_id": conversation_id,
+                    "bucket": bucket,
+                    "messages.message_id": {"$nin": [msg["message_id"] for msg in group]}
+                },
+                {
+                    "$push": {"messages": {"$each": group, "$sort": {"seq": 1}}},
+                    "$inc": {"count": len(group)},
+                    "$set": {"updated_at": group[-1]["timestamp"]},
+                    "$setOnInsert": {"created_at": group[0]["timestamp"]}
+                },
+                upsert=True
+            ))
+
+        with stage("message_flush"):
+            try:
+                await self.buckets.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Part of a group is already stored (replay after a crash
+                # between write and ack); append those one by one, which
+                # skips messages that are present
+                for error in e.details.get("writeErrors", []):
+                    conversation_id, bucket = keys[error["index"]]
+                    for message in groups[(conversation_id, bucket)]:
+                        await super().append(conversation_id, message)
+
+            # $max keeps the metadata correct when batches are replayed or overlap
+            await self.conversations.bulk_write([
+                UpdateOne({"conversation_id": conversation_id}, {"$max": latest})
+                for conversation_id, latest in conversations.items()
+            ], ordered=False)
+
+        ids = [entry_id for entry_id, _ in entries]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.flusher.group, *ids)
+            pipe.xdel(self.stream, *ids)
+            for conversation_id, _, payload in messages.values():
+                pipe.zrem(self._pending_key(conversation_id), payload)
+            await pipe.execute()
+
+        now = time.time()
+        for entry_id in ids:
+            MESSAGE_FLUSH_LAG_SECONDS.observe(max(0.0, now - int(entry_id.split("-")[0]) / 1000))
+
+class MessageFlusher:
+    """
+    Consumer moving queued messages from the Redis stream into MongoDB.
+
+    Every worker runs one consumer in a shared consumer group, so the
+    backlog is split between workers. Entries stay pending in the group
+    until their bulk write succeeded; a consumer re-reads its own
+    pending entries after a failure, and entries left by a crashed
+    worker are claimed once idle for ``MESSAGE_CLAIM_IDLE_MS``.
+    """
+
+    def __init__(
+        self,
+        store: WriteBehindMessageStore,
+        group: str = "message-flusher",
+        batch_size: int = settings.MESSAGE_FLUSH_BATCH_SIZE,
+        interval_ms: float = settings.MESSAGE_FLUSH_INTERVAL_MS,
+        claim_idle_ms: int = settings.MESSAGE_CLAIM_IDLE_MS
+    ):
+        self.store = store
+        self.group = group
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def redis(self):
+        return self.store.redis
+
+    async def _ensure_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(self.store.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _read(self, start: str, block: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.store.stream: start}, count=self.batch_size, block=block
+        )
+        return [entry for _, entries in response or [] for entry in entries if entry[1]]
+
+    async def _recover(self) -> int:
+        """Flush this consumer's unacknowledged entries and those of crashed consumers"""
+        flushed = 0
+        while True:
+            entries = await self._read("0")
+            if not entries:
+                break
+            await self.store.flush_entries(entries)
+            flushed += len(entries)
+
+        start = "0-0"
+        while True:
+            start, entries, *_ = await self.redis.xautoclaim(
+                self.store.stream, self.group, self.consumer,
+                min_idle_time=self.claim_idle_ms, start_id=start, count=self.batch_size
+            )
+            entries = [entry for entry in entries if entry[1]]
+            if entries:
+                await self.store.flush_entries(entries)
+                flushed += len(entries)
+            if start in ("0-0", b"0-0"):
+                break
+        return flushed
+
+    async def flush_once(self, block: Optional[int] = None) -> int:
+        """Flush one batch of new entries; returns how many were flushed"""
+        entries = await self._read(">", block=block)
+        if entries:
+            await self.store.flush_entries(entries)
+        MESSAGE_STREAM_BACKLOG.set(await self.redis.xlen(self.store.stream))
+        return len(entries)
+
+    async def _run(self) -> None:
+        await self._ensure_group()
+        next_recovery = 0.0
+        while not self._stopping:
+            try:
+                if time.monotonic() >= next_recovery:
+                    await self._recover()
+                    next_recovery = time.monotonic() + self.claim_idle_ms / 1000
+                if await self.flush_once(block=max(1, int(self.interval * 1000))) < self.batch_size:
+                    # Let the next batch accumulate
+                    await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Message flush failed, retrying: {str(e)}")
+                next_recovery = 0.0
+                await asyncio.sleep(max(self.interval, settings.MONGO_WRITE_RETRY_DELAY))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = settings.SHUTDOWN_DRAIN_TIMEOUT) -> None:
+        """Stop consuming and flush what this worker can within `timeout`"""
+        if self._task is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            logger.warning(f"Message flusher stopped with an error: {str(e)}")
+        self._task = None
+
+        async def drain():
+            await self._ensure_group()
+            await self._recover()
+            while await self.flush_once():
+                pass
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except Exception as e:
+            logger.warning(f"Unflushed messages remain in the stream for another worker: {str(e)}")
@@ -0,0 +1,58 @@
+from typing import Optional
+import os
+from src.core.config import settings
+
+class PostgresClientManager:
+    """
+    Create the SQLAlchemy async engine (asyncpg pool) on first use, once per process.
+
+    Like the MongoDB client, nothing connects at import time and a
+    forked worker gets its own pool instead of sharing its parent's
+    sockets.
+    """
+
+    def __init__(self, uri: str = settings.POSTGRES_URI):
+        self.uri = uri
+        self._engine = None
+        self._pid: Optional[int] = None
+
+    @property
+    def engine(self):
+        if self._engine is None or self._pid != os.getpid():
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            if self.uri.startswith("memory://"):
+                # In-process stand-in for benchmarks and offline runs: a
+                # throwaway SQLite file, so pooled connections share it
+                import tempfile
+                path = os.path.join(tempfile.mkdtemp(prefix="conversations-"), "store.db")
+                self._engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+            else:
+                self._engine = create_async_engine(
+                    self.uri,
+                    pool_size=settings.POSTGRES_POOL_SIZE,
+                    max_overflow=settings.POSTGRES_MAX_OVERFLOW,
+                    pool_pre_ping=True
+                )
+            self._pid = os.getpid()
+        return self._engine
+
+    @property
+    def dialect(self) -> str:
+        return self.engine.dialect.name
+
+    async def ping(self) -> None:
+        from sqlalchemy import text
+
+        async with self.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def close(self) -> None:
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+# Create PostgreSQL client (connects on first use)
+postgres_client = PostgresClientManager()
+
+__all__ = ["postgres_client"]
@@ -0,0 +1,462 @@
+"""
+Conversation storage in PostgreSQL.
+
+Conversations are rows of ``chats``; messages go to the append-only
+``chat_messages`` table, keyed by (conversation_id, seq)::
+
+    chats          conversation_id PK, user_id, status, created_at, updated_at,
+                   archived_at, total_messages, last_*_message_time, summary (JSONB)
+    chat_messages  (conversation_id, seq) PK, message_id, role, content, timestamp
+
+History pages are read by keyset on the primary key (``seq < before
+ORDER BY seq DESC LIMIT n``) and conversation lists by keyset on the
+``chats_user_status_updated`` index, so no page costs more than the rows
+it returns. Rows are only ever inserted into ``chat_messages``, in time
+order, which keeps the BRIN index on ``timestamp`` small for analytics
+scans by date.
+
+The schema is created at startup (``CREATE TABLE IF NOT EXISTS``) or
+with the first command; the second prints the DDL:
+
+    python -m src.db.postgres.conversations --create
+    python -m src.db.postgres.conversations
+"""
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import logging
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Index, Integer, JSON, MetaData, String, Table, Text,
+    select, tuple_, update, or_
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from src.core.config import settings
+from src.core.metrics import stage
+from src.db.base import ConversationStore
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+chats = Table(
+    settings.CHAT_COLLECTION,
+    metadata,
+    Column("conversation_id", String(64), primary_key=True),
+    Column("user_id", String(255), nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+    Column("archived_at", DateTime(timezone=True)),
+    Column("total_messages", Integer, nullable=False, server_default="0"),
+    Column("last_user_message_time", DateTime(timezone=True)),
+    Column("last_assistant_message_time", DateTime(timezone=True)),
+    Column("summary", JSON().with_variant(postgresql.JSONB(), "postgresql")),
+    # Conversation list: equality on user_id + status, newest first, with
+    # conversation_id as the tiebreaker for keyset pagination
+    Index("chats_user_status_updated", "user_id", "status", "updated_at", "conversation_id"),
+)
+
+chat_messages = Table(
+    settings.MESSAGE_COLLECTION,
+    metadata,
+    Column(
+        "conversation_id",
+        String(64),
+        ForeignKey(f"{settings.CHAT_COLLECTION}.conversation_id", ondelete="CASCADE"),
+        primary_key=True
+    ),
+    Column("seq", Integer, primary_key=True),
+    Column("message_id", String(64), nullable=False),
+    Column("role", String(16), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("timestamp", DateTime(timezone=True), nullable=False),
+    Index("chat_messages_timestamp", "timestamp", postgresql_using="brin"),
+)
+
+# Conversation fields stored as plain columns, by their document path
+_METADATA_COLUMNS = {
+    "metadata.total_messages": "total_messages",
+    "metadata.last_user_message_time": "last_user_message_time",
+    "metadata.last_assistant_message_time": "last_assistant_message_time",
+}
+
+def _aware(timestamp: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as timestamptz; naive ones are UTC"""
+    if timestamp is None or timestamp.tzinfo is not None:
+        return timestamp
+    return timestamp.replace(tzinfo=timezone.utc)
+
+def _naive(timestamp: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, the way MongoDB hands timestamps back"""
+    if timestamp is None or timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _dump_summary(summary: Dict) -> Dict:
+    return {**summary, "updated_at": _aware(summary["updated_at"]).isoformat()}
+
+def _load_summary(summary: Optional[Dict]) -> Optional[Dict]:
+    if summary is None:
+        return None
+    return {**summary, "updated_at": _naive(datetime.fromisoformat(summary["updated_at"]))}
+
+def _message(row) -> Dict:
+    return {
+        "message_id": row.message_id,
+        "role": row.role,
+        "content": row.content,
+        "timestamp": _naive(row.timestamp),
+        "seq": row.seq
+    }
+
+def _conversation(row) -> Dict:
+    """A chats row as a conversation document, with the columns it was selected with"""
+    # Column names are quoted_name, a str subclass that orjson rejects as a key
+    values = {str(key): value for key, value in row._mapping.items()}
+    document = {
+        key: _naive(value) if isinstance(value, datetime) else value
+        for key, value in values.items()
+        if key not in _METADATA_COLUMNS.values() and key != "summary"
+    }
+    details = {
+        column: _naive(values[column]) if isinstance(values[column], datetime) else values[column]
+        for column in _METADATA_COLUMNS.values()
+        if column in values
+    }
+    if details:
+        document["metadata"] = details
+    if "summary" in values and values["summary"] is not None:
+        document["summary"] = _load_summary(values["summary"])
+    return document
+
+class PostgresConversationStore(ConversationStore):
+    """
+    Conversations and messages in PostgreSQL through SQLAlchemy's async engine.
+
+    Sequence numbers come from ``total_messages``, incremented by one
+    ``UPDATE ... RETURNING`` per message. Concurrent `append` calls are
+    collected for up to `batch_window_ms` (or until `batch_size` rows are
+    waiting) and stored with a single multi-row ``INSERT ... ON CONFLICT
+    DO NOTHING``, one transaction per batch; every caller returns once
+    its batch committed. Re-inserting a stored (conversation_id, seq) is
+    a no-op, so retried writes are safe.
+    """
+
+    def __init__(
+        self,
+        client,
+        batch_window_ms: float = settings.POSTGRES_WRITE_BATCH_WINDOW_MS,
+        batch_size: int = settings.POSTGRES_WRITE_BATCH_SIZE
+    ):
+        self.client = client
+        self.batch_window = batch_window_ms / 1000
+        self.batch_size = batch_size
+        self.stats = {"rows": 0, "batches": 0}
+
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks
+        self._flush_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def engine(self):
+        return self.client.engine
+
+    def _insert(self, table: Table):
+        """INSERT supporting ON CONFLICT on the current dialect"""
+        if self.client.dialect == "sqlite":
+            return sqlite.insert(table)
+        return postgresql.insert(table)
+
+    async def create(self, conversation: Dict) -> None:
+        details = conversation.get("metadata", {})
+        async with self.engine.begin() as connection:
+            await connection.execute(chats.insert().values(
+                conversation_id=conversation["conversation_id"],
+                user_id=conversation["user_id"],
+                status=conversation["status"],
+                created_at=_aware(conversation["created_at"]),
+                updated_at=_aware(conversation["updated_at"]),
+                total_messages=details.get("total_messages", 0),
+                last_user_message_time=_aware(details.get("last_user_message_time")),
+                last_assistant_message_time=_aware(details.get("last_assistant_message_time"))
+            ))
+
+    async def exists(self, conversation_id: str) -> bool:
+        async with self.engine.connect() as connection:
+            result = await connection.execute(
+                select(chats.c.conversation_id).where(chats.c.conversation_id == conversation_id)
+            )
+            return result.first() is not None
+
+    async def allocate_seq(
+        self,
+        conversation_id: str,
+        role: str,
+        timestamp: datetime,
+        fields: Tuple[str, ...] = ()
+    ) -> Optional[Tuple[int, Dict]]:
+        timestamp = _aware(timestamp)
+        values = {"updated_at": timestamp, "total_messages": chats.c.total_messages + 1}
+
+        # Update last message time based on role
+        if role == "user":
+            values["last_user_message_time"] = timestamp
+        elif role == "assistant":
+            values["last_assistant_message_time"] = timestamp
+
+        columns = [chats.c.total_messages] + [
+            chats.c[_METADATA_COLUMNS.get(field, field)] for field in fields
+        ]
+        with stage("postgres_append"):
+            async with self.engine.begin() as connection:
+                result = await connection.execute(
+                    update(chats)
+                    .where(chats.c.conversation_id == conversation_id)
+                    .values(**values)
+                    .returning(*columns)
+                )
+                row = result.first()
+
+        if row is None:
+            return None
+        conversation = _conversation(row)
+        return conversation["metadata"]["total_messages"] - 1, conversation
+
+    async def append(self, conversation_id: str, message: Dict) -> None:
+        row = {
+            "conversation_id": conversation_id,
+            "seq": message["seq"],
+            "message_id": message["message_id"],
+            "role": message["role"],
+            "content": message["content"],
+            "timestamp": _aware(message["timestamp"])
+        }
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._schedule_flush(loop, 0)
+        elif self._flush_handle is None:
+            self._schedule_flush(loop, self.batch_window)
+
+        with stage("postgres_append"):
+            await asyncio.shield(future)
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        task = asyncio.ensure_future(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _insert_messages(self, rows: List[Dict]):
+        return self._insert(chat_messages).values(rows).on_conflict_do_nothing(
+            index_elements=["conversation_id", "seq"]
+        )
+
+    async def _flush(self) -> None:
+        self._flush_handle = None
+        batch, self._pending = self._pending, []
+        for start in range(0, len(batch), self.batch_size):
+            chunk = batch[start:start + self.batch_size]
+            try:
+                async with self.engine.begin() as connection:
+                    await connection.execute(self._insert_messages([row for row, _ in chunk]))
+            except Exception as e:
+                # One bad row (a just-deleted conversation, an oversized
+                # value) must not fail the other conversations' appends
+                logger.warning(f"Storing {len(chunk)} messages in one batch failed, storing them one by one: {str(e)}")
+                await self._store_rows(chunk)
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["rows"] += len(chunk)
+            for _, future in chunk:
+                if not future.done():
+                    future.set_result(None)
+
+    async def _store_rows(self, chunk: List[Tuple[Dict, asyncio.Future]]) -> None:
+        """Insert rows in separate transactions, failing only the appends of the rows that fail"""
+        for row, future in chunk:
+            try:
+                async with self.engine.begin() as connection:
+                    await connection.execute(self._insert_messages([row]))
+            except Exception as e:
+                logger.warning(f"Storing message {row['message_id']} of {row['conversation_id']} failed: {str(e)}")
+                if not future.done():
+                    future.set_exception(e)
+                continue
+
+            self.stats["rows"] += 1
+            if not future.done():
+                future.set_result(None)
+
+    async def read(self, conversation_id: str, limit: int, before: Optional[int] = None) -> List[Dict]:
+        if limit <= 0 or (before is not None and before <= 0):
+            return []
+
+        query = select(
+            chat_messages.c.seq,
+            chat_messages.c.message_id,
+            chat_messages.c.role,
+            chat_messages.c.content,
+            chat_messages.c.timestamp
+        ).where(chat_messages.c.conversation_id == conversation_id)
+        if before is not None:
+            query = query.where(chat_messages.c.seq < before)
+        query = query.order_by(chat_messages.c.seq.desc()).limit(limit)
+
+        with stage("history_read"):
+            async with self.engine.connect() as connection:
+                rows = (await connection.execute(query)).all()
+        return [_message(row) for row in reversed(rows)]
+
+    async def end(self, conversation_id: str, timestamp: datetime) -> bool:
+        timestamp = _aware(timestamp)
+        async with self.engine.begin() as connection:
+            result = await connection.execute(
+                update(chats)
+                .where(chats.c.conversation_id == conversation_id)
+                .values(status="archived", archived_at=timestamp, updated_at=timestamp)
+                .returning(chats.c.conversation_id)
+            )
+            return result.first() is not None
+
+    async def list_active(
+        self,
+        user_id: str,
+        limit: int,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> List[Dict]:
+        query = select(
+            chats.c.conversation_id,
+            chats.c.created_at,
+            chats.c.updated_at,
+            chats.c.total_messages
+        ).where(chats.c.user_id == user_id, chats.c.status == "active")
+        if after:
+            updated_at, conversation_id = after
+            query = query.where(
+                tuple_(chats.c.updated_at, chats.c.conversation_id) < tuple_(_aware(updated_at), conversation_id)
+            )
+        query = query.order_by(chats.c.updated_at.desc(), chats.c.conversation_id.desc()).limit(limit)
+
+        async with self.engine.connect() as connection:
+            rows = (await connection.execute(query)).all()
+        return [_conversation(row) for row in rows]
+
+    async def save_summary(self, conversation_id: str, summary: Dict) -> None:
+        # Never move an existing summary backwards
+        async with self.engine.begin() as connection:
+            await connection.execute(
+                update(chats)
+                .where(
+                    chats.c.conversation_id == conversation_id,
+                    or_(
+                        chats.c.summary.is_(None),
+                        chats.c.summary["upto_seq"].as_integer() < summary["upto_seq"]
+                    )
+                )
+                .values(summary=_dump_summary(summary))
+            )
+
+    async def export(
+        self,
+        batch_size: int,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> AsyncIterator[List[Dict]]:
+        query = select(*[column for column in chats.c if column.name != "summary"])
+        if user_id:
+            query = query.where(chats.c.user_id == user_id)
+        if status:
+            query = query.where(chats.c.status == status)
+        if since:
+            query = query.where(chats.c.created_at >= _aware(since))
+        if until:
+            query = query.where(chats.c.created_at < _aware(until))
+
+        # Keyset on the primary key: each batch is a short query of its own
+        last_id = None
+        while True:
+            page = query if last_id is None else query.where(chats.c.conversation_id > last_id)
+            page = page.order_by(chats.c.conversation_id).limit(batch_size)
+            async with self.engine.connect() as connection:
+                rows = (await connection.execute(page)).all()
+                if not rows:
+                    return
+                conversations = [_conversation(row) for row in rows]
+                messages = await connection.execute(
+                    select(chat_messages)
+                    .where(chat_messages.c.conversation_id.in_([row.conversation_id for row in rows]))
+                    .order_by(chat_messages.c.conversation_id, chat_messages.c.seq)
+                )
+                by_conversation: Dict[str, List[Dict]] = {}
+                for row in messages:
+                    by_conversation.setdefault(row.conversation_id, []).append(_message(row))
+
+            for conversation in conversations:
+                conversation["messages"] = by_conversation.get(conversation["conversation_id"], [])
+            yield conversations
+            last_id = rows[-1].conversation_id
+
+    async def ensure_schema(self) -> None:
+        await create_schema(self.engine)
+
+    async def warmup(self) -> None:
+        await self.client.ping()
+
+    async def stop(self, timeout: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending:
+            self._start_flush()
+        if self._flush_tasks:
+            await asyncio.wait_for(asyncio.gather(*self._flush_tasks, return_exceptions=True), timeout)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+async def create_schema(engine) -> None:
+    """Create the tables and indexes that do not exist yet"""
+    async with engine.begin() as connection:
+        await connection.run_sync(metadata.create_all)
+
+def main():
+    parser = argparse.ArgumentParser(description="PostgreSQL conversation store schema")
+    parser.add_argument("--create", action="store_true", help="Create missing tables and indexes")
+    args = parser.parse_args()
+
+    from sqlalchemy.schema import CreateIndex, CreateTable
+    from src.db.postgres import postgres_client
+
+    if not args.create:
+        # Print the DDL instead, e.g. for a migration review
+        for table in metadata.sorted_tables:
+            print(f"{str(CreateTable(table).compile(dialect=postgresql.dialect())).strip()};")
+            for index in table.indexes:
+                print(f"{str(CreateIndex(index).compile(dialect=postgresql.dialect())).strip()};")
+        return
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        try:
+            await create_schema(postgres_client.engine)
+        finally:
+            await postgres_client.close()
+
+    asyncio.run(run())
+    logger.info("Schema is up to date")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,35 @@
 from typing import Optional, Any
 import json
+import os
 from redis.asyncio import Redis
 from src.core.config import settings
 from functools import lru_cache
 
 class RedisClient:
     def __init__(self):
-        self.redis = Redis.from_url(settings.REDIS_URI, decode_responses=True)
+        self._redis: Optional[Redis] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def redis(self) -> Redis:
+        """Connection pool, created on first use in each process"""
+        if self._redis is None or self._pid != os.getpid():
+            if settings.REDIS_URI.startswith("memory://"):
+                # In-process stand-in for benchmarks and offline runs
+                from fakeredis.aioredis import FakeRedis
+                self._redis = FakeRedis(decode_responses=True)
+            else:
+                self._redis = Redis.from_url(
+                    settings.REDIS_URI,
+                    decode_responses=True,
+                    max_connections=settings.REDIS_MAX_CONNECTIONS
+                )
+            self._pid = os.getpid()
+        return self._redis
+
+    async def ping(self) -> bool:
+        """Open a pooled connection ahead of the first request"""
+        return await self.redis.ping()
 
     async def get(self, key: str) -> Optional[Any]:
         """Get value from Redis"""
@@ -31,7 +54,9 @@ class RedisClient:
 
     async def close(self):
         """Close Redis connection"""
-        await self.redis.close()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
 
 # Create Redis client instance
 redis_client = RedisClient()
\ No newline at end of file
@@ -0,0 +1,210 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+from collections import OrderedDict
+from datetime import datetime, timezone
+import json
+import logging
+import time
+from redis.exceptions import WatchError
+from src.core.config import settings
+from src.core.metrics import stage, record_cache
+
+logger = logging.getLogger(__name__)
+
+# Reads `count` of the latest messages from the source of truth
+Loader = Callable[[int], Awaitable[List[Dict]]]
+
+def _encode(message: Dict) -> str:
+    timestamp = message["timestamp"]
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    # Stored the way MongoDB hands it back: naive UTC, millisecond precision
+    timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+    return json.dumps({**message, "timestamp": timestamp.isoformat()}, ensure_ascii=False)
+
+def _decode(payload: str) -> Dict:
+    message = json.loads(payload)
+    message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+    return message
+
+class ConversationHistoryCache:
+    """
+    Latest messages of active conversations, in front of the message store.
+
+    Each conversation's last `size` messages are kept as a capped Redis
+    list shared by all workers, plus an in-process LRU of the
+    conversations this worker served last. Both only hold a contiguous
+    run of sequence numbers: a write is appended when it follows the
+    cached tail and drops the entry otherwise, and a miss refills the
+    list from MongoDB (the source of truth) unless a write raced the
+    read. Entries expire `ttl` seconds after their last use.
+
+    The in-process copy can miss writes made by other workers, so it is
+    only trusted when the caller knows the latest sequence number, as a
+    chat turn does right after allocating its own.
+    """
+
+    PREFIX = "chat:history"
+
+    def __init__(
+        self,
+        size: int = settings.HISTORY_CACHE_MESSAGES,
+        local_size: int = settings.HISTORY_CACHE_LOCAL_SIZE,
+        ttl: int = settings.CACHE_TTL
+    ):
+        self.size = size
+        self.local_size = local_size
+        self.ttl = ttl
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def redis(self):
+        from src.db.redis import redis_client
+        return redis_client.redis
+
+    def _key(self, conversation_id: str) -> str:
+        return f"{self.PREFIX}:{conversation_id}"
+
+    @staticmethod
+    def _covers(messages: List[Dict], limit: int, upto: Optional[int]) -> bool:
+        """Whether `messages` are the latest `limit` ones (ending at seq `upto`, if given)"""
+        if not messages:
+            return False
+        if upto is not None and messages[-1]["seq"] != upto:
+            return False
+        return len(messages) >= limit or messages[0]["seq"] == 0
+
+    # In-process LRU
+
+    def _local_get(self, conversation_id: str) -> Optional[List[Dict]]:
+        entry = self._local.get(conversation_id)
+        if entry is None:
+            return None
+        expires_at, messages = entry
+        if expires_at < time.monotonic():
+            del self._local[conversation_id]
+            return None
+        self._local.move_to_end(conversation_id)
+        return messages
+
+    def _local_put(self, conversation_id: str, messages: List[Dict]) -> None:
+        self._local[conversation_id] = (time.monotonic() + self.ttl, messages[-self.size:])
+        self._local.move_to_end(conversation_id)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    # Reads
+
+    async def recent(
+        self,
+        conversation_id: str,
+        limit: int,
+        loader: Loader,
+        upto: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        The last `limit` messages, read through the cache.
+
+        `upto` is the sequence number of the latest message when the
+        caller knows it; only then is the in-process copy used.
+        """
+        if limit <= 0 or (upto is not None and upto < 0):
+            return []
+        if limit > self.size:
+            return await loader(limit)
+
+        with stage("history_read"):
+            if upto is not None:
+                messages = self._local_get(conversation_id)
+                if messages is not None and self._covers(messages[-limit:], limit, upto):
+                    record_cache("history", "lru_hit")
+                    return messages[-limit:]
+
+            key = self._key(conversation_id)
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.lrange(key, -limit, -1)
+                    pipe.expire(key, self.ttl)
+                    payloads, _ = await pipe.execute()
+                messages = [_decode(payload) for payload in payloads]
+                if self._covers(messages, limit, upto):
+                    record_cache("history", "redis_hit")
+                    self._local_put(conversation_id, messages)
+                    return messages
+            except Exception as e:
+                logger.warning(f"History cache unavailable for {conversation_id}: {str(e)}")
+                return await loader(limit)
+
+            record_cache("history", "miss")
+            return (await self._fill(conversation_id, loader, upto))[-limit:]
+
+    async def _fill(self, conversation_id: str, loader: Loader, upto: Optional[int]) -> List[Dict]:
+        """Load the latest messages and cache them unless a write raced the load"""
+        key = self._key(conversation_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+            except Exception as e:
+                logger.warning(f"History cache unavailable for {conversation_id}: {str(e)}")
+                return await loader(self.size)
+
+            messages = await loader(self.size)
+            if not messages or (upto is not None and messages[-1]["seq"] != upto):
+                return messages
+
+            try:
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, *[_encode(message) for message in messages])
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+                self._local_put(conversation_id, messages)
+            except WatchError:
+                pass  # a write landed meanwhile; the next read refills
+            except Exception as e:
+                logger.warning(f"Caching history of {conversation_id} failed: {str(e)}")
+            return messages
+
+    # Writes
+
+    async def append(self, conversation_id: str, message: Dict) -> None:
+        """Add a stored message (which must carry ``seq``) to the cached tail"""
+        seq = message["seq"]
+        messages = self._local_get(conversation_id)
+        if messages is not None and messages[-1]["seq"] == seq - 1:
+            self._local_put(conversation_id, messages + [message])
+        elif messages is None or messages[-1]["seq"] != seq:
+            self._local.pop(conversation_id, None)
+
+        key = self._key(conversation_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                tail = await pipe.lindex(key, -1)
+                last = _decode(tail)["seq"] if tail else None
+                if last == seq:
+                    return  # a retried write
+                pipe.multi()
+                if last is None or last == seq - 1:
+                    pipe.rpush(key, _encode(message))
+                    pipe.ltrim(key, -self.size, -1)
+                    pipe.expire(key, self.ttl)
+                else:
+                    # Out of order: a gap is never cached
+                    pipe.delete(key)
+                await pipe.execute()
+        except WatchError:
+            await self.invalidate(conversation_id)
+        except Exception as e:
+            logger.warning(f"Caching message of {conversation_id} failed: {str(e)}")
+            await self.invalidate(conversation_id)
+
+    async def invalidate(self, conversation_id: str) -> None:
+        """Forget a conversation; the next read goes to MongoDB"""
+        self._local.pop(conversation_id, None)
+        try:
+            await self.redis.delete(self._key(conversation_id))
+        except Exception as e:
+            logger.warning(f"Dropping cached history of {conversation_id} failed: {str(e)}")
+
+# Shared by every service that reads or writes messages
+history_cache = ConversationHistoryCache()
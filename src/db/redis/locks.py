@@ -0,0 +1,123 @@
+from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+from redis.exceptions import WatchError
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class LockTimeout(Exception):
+    """Raised when a lease could not be acquired in time"""
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Lock busy: {name}")
+        self.name = name
+        self.retry_after = retry_after
+
+class LeaseLock:
+    """
+    Named mutual exclusion across workers, held as a Redis lease.
+
+    Holders in one process queue on a local `asyncio.Lock` first, so only
+    one of them polls Redis. The lease is ``SET NX PX ttl`` with a random
+    token, renewed every third of its TTL while held, and only released
+    or renewed by its owner (checked in a WATCH/MULTI transaction), so a
+    crashed worker's lease simply expires. If Redis is unavailable the
+    lock degrades to the local one.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        ttl: float = settings.CONVERSATION_LOCK_TTL,
+        wait: float = settings.CONVERSATION_LOCK_WAIT
+    ):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.wait = wait
+        self._local: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @property
+    def redis(self):
+        from src.db.redis import redis_client
+        return redis_client.redis
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    async def _acquire(self, key: str, token: str, deadline: float) -> None:
+        delay = 0.02
+        while not await self.redis.set(key, token, nx=True, px=int(self.ttl * 1000)):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                ttl_ms = await self.redis.pttl(key)
+                raise LockTimeout(key, max(ttl_ms, 1000) / 1000)
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+    async def _if_owner(self, key: str, token: str, action: str) -> bool:
+        """Renew or delete `key` only while it still holds `token`"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if await pipe.get(key) != token:
+                    return False
+                pipe.multi()
+                if action == "renew":
+                    pipe.pexpire(key, int(self.ttl * 1000))
+                else:
+                    pipe.delete(key)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    async def _keep_alive(self, key: str, token: str) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                if not await self._if_owner(key, token, "renew"):
+                    logger.warning(f"Lease {key} was lost while held")
+                    return
+            except Exception as e:
+                logger.warning(f"Renewing lease {key} failed: {str(e)}")
+
+    @asynccontextmanager
+    async def hold(self, name: str, wait: Optional[float] = None):
+        """Hold the lock for `name`; raises LockTimeout after `wait` seconds"""
+        wait = self.wait if wait is None else wait
+        deadline = time.monotonic() + wait
+        key = self._key(name)
+
+        local = self._local.get(name)
+        if local is None:
+            local = self._local[name] = asyncio.Lock()
+        try:
+            await asyncio.wait_for(local.acquire(), wait)
+        except asyncio.TimeoutError:
+            raise LockTimeout(key, self.ttl)
+
+        token, keep_alive = None, None
+        try:
+            lease = uuid.uuid4().hex
+            try:
+                await self._acquire(key, lease, deadline)
+                token = lease
+                keep_alive = asyncio.create_task(self._keep_alive(key, token))
+            except LockTimeout:
+                raise
+            except Exception as e:
+                logger.warning(f"Lease {key} unavailable, locking in-process only: {str(e)}")
+            yield
+        finally:
+            if keep_alive is not None:
+                keep_alive.cancel()
+            if token is not None:
+                try:
+                    await self._if_owner(key, token, "release")
+                except Exception as e:
+                    logger.warning(f"Releasing lease {key} failed, it expires in {self.ttl}s: {str(e)}")
+            local.release()
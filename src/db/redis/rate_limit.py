@@ -0,0 +1,124 @@
+from typing import Dict, List, NamedTuple, Tuple
+from collections import OrderedDict
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+class Bucket(NamedTuple):
+    """One token bucket to charge: refills at `rate` per second up to `capacity`"""
+    key: str
+    capacity: float
+    rate: float
+    cost: float
+
+# Checks every bucket first and charges them only if all have room, so a
+# rejected request consumes nothing. Redis' clock keeps workers on
+# different hosts consistent. Returns {allowed, seconds until it would fit}.
+_TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local cost = math.min(tonumber(ARGV[i * 3]), capacity)
+    local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    levels[i] = level
+    if level < cost then
+        wait = math.max(wait, (cost - level) / rate)
+    end
+end
+if wait > 0 then
+    return {0, tostring(wait)}
+end
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[i * 3 - 2])
+    local rate = tonumber(ARGV[i * 3 - 1])
+    local cost = math.min(tonumber(ARGV[i * 3]), capacity)
+    redis.call('HSET', KEYS[i], 'level', tostring(levels[i] - cost), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate * 1000) + 1000)
+end
+return {1, '0'}
+"""
+
+class TokenBuckets:
+    """
+    Token buckets shared by all workers through Redis.
+
+    `take` charges several buckets at once in a Lua script, all or
+    nothing. If Redis (or scripting) is unavailable the same buckets are
+    kept in this process instead, so limits still hold per worker; Redis
+    is retried every `retry_interval` seconds meanwhile.
+    """
+
+    PREFIX = "ratelimit"
+
+    def __init__(self, local_size: int = 10000, retry_interval: float = 5.0):
+        self.local_size = local_size
+        self.retry_interval = retry_interval
+        self._script = None
+        self._local: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._degraded = False
+        self._retry_at = 0.0
+
+    @property
+    def redis(self):
+        from src.db.redis import redis_client
+        return redis_client.redis
+
+    async def take(self, buckets: List[Bucket]) -> Tuple[bool, float]:
+        """Charge every bucket; returns whether it was allowed and the seconds to wait if not"""
+        buckets = [bucket for bucket in buckets if bucket.capacity > 0 and bucket.cost > 0]
+        if not buckets:
+            return True, 0.0
+        if self._degraded and time.monotonic() < self._retry_at:
+            return self._take_local(buckets)
+
+        try:
+            if self._script is None:
+                self._script = self.redis.register_script(_TAKE_SCRIPT)
+            allowed, wait = await self._script(
+                keys=[f"{self.PREFIX}:{bucket.key}" for bucket in buckets],
+                args=[value for bucket in buckets for value in (bucket.capacity, bucket.rate, bucket.cost)]
+            )
+            if self._degraded:
+                logger.info("Rate limits are shared through Redis again")
+                self._degraded = False
+            return bool(int(allowed)), float(wait)
+        except Exception as e:
+            if not self._degraded:
+                logger.warning(f"Rate limit store unavailable, limiting per worker: {str(e)}")
+                self._degraded = True
+            self._retry_at = time.monotonic() + self.retry_interval
+            return self._take_local(buckets)
+
+    def _take_local(self, buckets: List[Bucket]) -> Tuple[bool, float]:
+        now = time.monotonic()
+        levels: Dict[str, float] = {}
+        wait = 0.0
+        for bucket in buckets:
+            level, ts = self._local.get(bucket.key, (bucket.capacity, now))
+            level = min(bucket.capacity, level + max(0.0, now - ts) * bucket.rate)
+            levels[bucket.key] = level
+            cost = min(bucket.cost, bucket.capacity)
+            if level < cost:
+                wait = max(wait, (cost - level) / bucket.rate)
+        if wait > 0:
+            return False, wait
+
+        for bucket in buckets:
+            self._local[bucket.key] = (levels[bucket.key] - min(bucket.cost, bucket.capacity), now)
+            self._local.move_to_end(bucket.key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+        return True, 0.0
+
+def retry_after(wait: float) -> int:
+    """Whole seconds for a Retry-After header"""
+    return max(1, math.ceil(wait))
@@ -1,16 +1,21 @@
-from typing import Optional, List
-import chromadb
-from chromadb.config import Settings as ChromaSettings
+from typing import Optional, List, Set
+import threading
 from src.core.config import settings
+from src.rag.embeddings import embedding_service, ChromaEmbeddingFunction
 from functools import lru_cache
 
 @lru_cache()
 def get_vector_store():
     """
     Get vector store instance based on configuration
-    Currently supports ChromaDB
+    Supports ChromaDB and an in-process NumPy store
     """
     if settings.VECTOR_STORE_TYPE.lower() == "chroma":
+        # Imported here: chromadb is slow to import and only needed once
+        # the store is first used
+        import chromadb
+        from chromadb.config import Settings as ChromaSettings
+        
         # Initialize ChromaDB with persistent storage
         chroma_client = chromadb.Client(
             ChromaSettings(
@@ -22,37 +27,128 @@ def get_vector_store():
         # Get or create collection
         collection = chroma_client.get_or_create_collection(
             name="customer_service_kb",
-            metadata={"description": "Customer service knowledge base"}
+            metadata={"description": "Customer service knowledge base"},
+            embedding_function=ChromaEmbeddingFunction(embedding_service)
         )
         
         return collection
+    elif settings.VECTOR_STORE_TYPE.lower() == "numpy":
+        from src.db.vector.numpy_store import NumpyCollection
+
+        return NumpyCollection(
+            settings.NUMPY_VECTOR_DIR,
+            embedding_function=ChromaEmbeddingFunction(embedding_service),
+            quantize=settings.NUMPY_VECTOR_QUANTIZE
+        )
     else:
         raise ValueError(f"Unsupported vector store type: {settings.VECTOR_STORE_TYPE}")
 
 class VectorStore:
     def __init__(self):
-        self.collection = get_vector_store()
+        self._collection = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def collection(self):
+        """The shared collection, opened on first use"""
+        if self._collection is None:
+            with self._lock:
+                if self._collection is None:
+                    self._collection = get_vector_store()
+        return self._collection
+
+    def add_listener(self, listener) -> None:
+        """
+        Register an object notified after every write.
+
+        Listeners implement ``on_upsert(ids, documents, metadatas)`` and
+        ``on_delete(ids)``; they keep secondary indexes in sync.
+        """
+        self._listeners.append(listener)
+
+    def _notify_upsert(self, ids, documents, metadatas) -> None:
+        for listener in self._listeners:
+            listener.on_upsert(ids, documents, metadatas)
+
+    def _notify_delete(self, ids) -> None:
+        for listener in self._listeners:
+            listener.on_delete(ids)
 
     def add_documents(
         self,
         documents: List[str],
         metadatas: Optional[List[dict]] = None,
-        ids: Optional[List[str]] = None
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None
     ):
         """Add documents to vector store"""
-        return self.collection.add(
+        result = self.collection.add(
             documents=documents,
             metadatas=metadatas,
-            ids=ids
+            ids=ids,
+            embeddings=embeddings
         )
+        self._notify_upsert(ids, documents, metadatas)
+        return result
+
+    def upsert_documents(
+        self,
+        documents: List[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ):
+        """Insert or replace documents by id"""
+        result = self.collection.upsert(
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids,
+            embeddings=embeddings
+        )
+        self._notify_upsert(ids, documents, metadatas)
+        return result
+
+    def delete_documents(self, ids: List[str]):
+        """Delete documents by id"""
+        result = self.collection.delete(ids=ids)
+        self._notify_delete(ids)
+        return result
+
+    def iter_documents(self, batch_size: int = 1000):
+        """Yield (ids, documents, metadatas) pages of every stored document"""
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=["documents", "metadatas"],
+                limit=batch_size,
+                offset=offset
+            )
+            ids = page.get("ids", [])
+            if not ids:
+                return
+            yield ids, page.get("documents", []), page.get("metadatas", [])
+            offset += len(ids)
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """Return which of the given ids are already stored"""
+        result = self.collection.get(ids=ids, include=[])
+        return set(result.get("ids", []))
 
     def search(
         self,
         query: str,
         n_results: int = 3,
-        where: Optional[dict] = None
+        where: Optional[dict] = None,
+        query_embedding: Optional[List[float]] = None
     ):
         """Search similar documents"""
+        if query_embedding is not None:
+            return self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where
+            )
         return self.collection.query(
             query_texts=[query],
             n_results=n_results,
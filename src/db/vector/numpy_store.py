@@ -0,0 +1,533 @@
+"""
+In-process vector collection backed by memory-mapped NumPy arrays.
+
+Implements the subset of the Chroma collection API that `VectorStore`
+uses (`add`, `upsert`, `delete`, `get`, `query`, `count`), so it can be
+selected with ``VECTOR_STORE_TYPE=numpy`` without touching callers.
+
+Layout on disk::
+
+    MANIFEST.json          active snapshot: segments and their tombstones
+    LOCK                   flock taken by writers (exclusive) and reloads (shared)
+    seg-00000001/
+        vectors.npy        normalized float32 rows, or int8 when quantized
+        scales.npy         per-row dequantization scale (int8 only)
+        records.json       ids, documents and metadatas of the rows
+
+Segments are immutable. A write adds one new segment, tombstones
+replaced rows in older ones, and publishes the result by atomically
+replacing the manifest, so a crash leaves either the old or the new
+snapshot. Segments are merged size-tiered (each row is rewritten
+O(log n) times) and merging drops tombstoned rows. Readers take a
+reference to the current in-memory snapshot and never see a partial
+write.
+
+Several worker processes may share the directory. A write holds the
+exclusive lock from re-reading the manifest to publishing, so it always
+applies to the latest snapshot and names its segments after the latest
+counter. Reads reload the manifest once it has been replaced, under the
+shared lock, so the segments it names cannot be collected meanwhile.
+Unreferenced segments are only removed under the exclusive lock, when
+no other write can have one in progress.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import os
+import shutil
+import threading
+import numpy as np
+from src.db.vector.filters import _COMPARATORS
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, so run one worker
+    fcntl = None
+
+MANIFEST = "MANIFEST.json"
+LOCK = "LOCK"
+
+# Rows scored per matrix product; bounds temporary memory for large segments
+SEARCH_BLOCK_ROWS = 32768
+
+class _Segment:
+    """Immutable block of rows plus lazily built metadata columns"""
+
+    def __init__(
+        self,
+        name: str,
+        vectors: np.ndarray,
+        scales: Optional[np.ndarray],
+        ids: List[str],
+        documents: List[Optional[str]],
+        metadatas: List[Optional[dict]],
+        persisted: bool = False
+    ):
+        self.name = name
+        self.vectors = vectors
+        self.scales = scales
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.persisted = persisted
+        self._columns: Dict[str, np.ndarray] = {}
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def column(self, key: str) -> np.ndarray:
+        """Metadata values of `key` as an object array (None where missing)"""
+        column = self._columns.get(key)
+        if column is None:
+            column = np.empty(len(self.ids), dtype=object)
+            column[:] = [(metadata or {}).get(key) for metadata in self.metadatas]
+            self._columns[key] = column
+        return column
+
+    def where_mask(self, where: dict) -> np.ndarray:
+        """Rows matching a Chroma-style `where` filter; cached per filter"""
+        key = json.dumps(where, sort_keys=True, default=str)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        mask = self._evaluate(where)
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > 64:
+                self._masks.popitem(last=False)
+        return mask
+
+    def _evaluate(self, where: dict) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._evaluate(clause)
+            elif key == "$or":
+                either = np.zeros(len(self.ids), dtype=bool)
+                for clause in condition:
+                    either |= self._evaluate(clause)
+                mask &= either
+            else:
+                operators = condition if isinstance(condition, dict) else {"$eq": condition}
+                column = self.column(key)
+                for operator, target in operators.items():
+                    mask &= _compare(column, operator, target)
+        return mask
+
+    def scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Cosine similarity of rows [start, end) against every query"""
+        block = self.vectors[start:end]
+        if self.scales is None:
+            return block @ queries.T
+        return (block.astype(np.float32) @ queries.T) * self.scales[start:end, None]
+
+def _compare(column: np.ndarray, operator: str, target: Any) -> np.ndarray:
+    if operator == "$eq":
+        return np.asarray(column == target, dtype=bool)
+    if operator == "$ne":
+        return np.asarray(column != target, dtype=bool)
+    comparator = _COMPARATORS.get(operator)
+    if comparator is None:
+        raise ValueError(f"Unsupported where operator: {operator}")
+    if operator in ("$in", "$nin"):
+        target = set(target)
+
+    def safe(value):
+        try:
+            return comparator(value, target)
+        except TypeError:
+            return False  # incomparable types never match
+
+    return np.fromiter((safe(value) for value in column), dtype=bool, count=len(column))
+
+class _Snapshot:
+    """Immutable view of the collection: segments, live rows and id locations"""
+
+    def __init__(self, segments: Tuple[_Segment, ...], alive: Tuple[np.ndarray, ...], locations: Dict[str, Tuple[int, int]]):
+        self.segments = segments
+        self.alive = alive
+        self.locations = locations
+
+    def live_rows(self, index: int) -> int:
+        return int(self.alive[index].sum())
+
+class NumpyCollection:
+    """Chroma-compatible collection stored as memory-mapped NumPy segments"""
+
+    def __init__(
+        self,
+        path: str,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        quantize: bool = False
+    ):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.embedding_function = embedding_function
+        self.quantize = quantize
+        self.dimensions: Optional[int] = None
+        self._next_segment = 1
+        self._write_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._snapshot = _Snapshot((), (), {})
+        # Identifies the manifest file the snapshot was loaded from
+        self._manifest_stamp: Optional[Tuple[int, int, int]] = None
+        self._current()
+
+    # Persistence
+
+    @contextmanager
+    def _file_lock(self, operation: int):
+        """Hold the directory lock, shared or exclusive, across processes"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.path / LOCK, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)  # releases the lock
+
+    def _stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path / MANIFEST)
+        except FileNotFoundError:
+            return None
+        # os.replace gives every published manifest a new inode
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _current(self) -> _Snapshot:
+        """The latest published snapshot, reloaded if another process published since"""
+        if self._stamp() != self._manifest_stamp:
+            with self._reload_lock:
+                if self._stamp() != self._manifest_stamp:
+                    with self._file_lock(fcntl.LOCK_SH if fcntl else 0):
+                        self._load()
+        return self._snapshot
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive access to the directory, starting from the latest snapshot"""
+        with self._write_lock, self._file_lock(fcntl.LOCK_EX if fcntl else 0):
+            if self._stamp() != self._manifest_stamp:
+                self._load()
+            yield
+
+    def _load(self) -> None:
+        """Load the manifest; the caller holds the directory lock"""
+        stamp = self._stamp()
+        if stamp is None:
+            return
+        manifest = json.loads((self.path / MANIFEST).read_text(encoding="utf-8"))
+        self.dimensions = manifest["dimensions"]
+        self.quantize = manifest["quantized"]
+        self._next_segment = manifest["next_segment"]
+
+        # Segments are immutable, so the ones already open are reused
+        opened = {segment.name: segment for segment in self._snapshot.segments}
+        segments, alive = [], []
+        for entry in manifest["segments"]:
+            segment = opened.get(entry["name"]) or self._open_segment(entry["name"])
+            mask = np.ones(len(segment), dtype=bool)
+            mask[entry["deleted"]] = False
+            segments.append(segment)
+            alive.append(mask)
+        self._snapshot = self._build_snapshot(segments, alive)
+        self._manifest_stamp = stamp
+
+    def _open_segment(self, name: str) -> _Segment:
+        directory = self.path / name
+        records = json.loads((directory / "records.json").read_text(encoding="utf-8"))
+        vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+        scales = np.load(directory / "scales.npy") if (directory / "scales.npy").exists() else None
+        return _Segment(
+            name, vectors, scales,
+            records["ids"], records["documents"], records["metadatas"],
+            persisted=True
+        )
+
+    def _write_segment(self, segment: _Segment) -> _Segment:
+        """Write a new segment and reopen it memory-mapped"""
+        temporary = self.path / f".{segment.name}.tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        temporary.mkdir()
+        np.save(temporary / "vectors.npy", segment.vectors)
+        if segment.scales is not None:
+            np.save(temporary / "scales.npy", segment.scales)
+        with open(temporary / "records.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "ids": segment.ids,
+                "documents": segment.documents,
+                "metadatas": segment.metadatas
+            }, f, ensure_ascii=False)
+        os.replace(temporary, self.path / segment.name)
+        return self._open_segment(segment.name)
+
+    def _publish(self, segments: List[_Segment], alive: List[np.ndarray]) -> None:
+        """Persist new segments, then atomically swap manifest and snapshot"""
+        segments = [segment if segment.persisted else self._write_segment(segment) for segment in segments]
+        manifest = {
+            "dimensions": self.dimensions,
+            "quantized": self.quantize,
+            "next_segment": self._next_segment,
+            "segments": [
+                {"name": segment.name, "deleted": np.flatnonzero(~mask).tolist()}
+                for segment, mask in zip(segments, alive)
+            ]
+        }
+        temporary = self.path / f"{MANIFEST}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path / MANIFEST)
+
+        self._snapshot = self._build_snapshot(segments, alive)
+        self._manifest_stamp = self._stamp()
+        self._remove_unreferenced(manifest)
+
+    def _remove_unreferenced(self, manifest: Dict) -> None:
+        """Delete superseded segments; only called under the exclusive lock"""
+        referenced = {entry["name"] for entry in manifest["segments"]}
+        for directory in self.path.iterdir():
+            if directory.is_dir() and directory.name not in referenced:
+                # Open memory maps keep the data readable until released
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def _build_snapshot(self, segments: List[_Segment], alive: List[np.ndarray]) -> _Snapshot:
+        locations = {}
+        for index, (segment, mask) in enumerate(zip(segments, alive)):
+            for row in np.flatnonzero(mask):
+                locations[segment.ids[row]] = (index, int(row))
+        return _Snapshot(tuple(segments), tuple(alive), locations)
+
+    # Writes
+
+    def _prepare_vectors(self, embeddings: Optional[List[List[float]]], documents: Optional[List[str]], count: int) -> np.ndarray:
+        if embeddings is None:
+            if documents is None or self.embedding_function is None:
+                raise ValueError("Either embeddings or documents with an embedding function are required")
+            embeddings = self.embedding_function(documents)
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(count, -1)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dimensions}")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _new_segment(self, vectors: np.ndarray, ids: List[str], documents: List, metadatas: List) -> _Segment:
+        scales = None
+        if self.quantize:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+            scales = scales.astype(np.float32)
+        name = f"seg-{self._next_segment:08d}"
+        self._next_segment += 1
+        return _Segment(name, vectors, scales, list(ids), list(documents), list(metadatas))
+
+    def _merge(self, first: _Segment, first_alive: np.ndarray, second: _Segment, second_alive: np.ndarray) -> _Segment:
+        rows = [(first, np.flatnonzero(first_alive)), (second, np.flatnonzero(second_alive))]
+        vectors = np.concatenate([np.asarray(segment.vectors[keep]) for segment, keep in rows])
+        scales = None
+        if self.quantize:
+            scales = np.concatenate([segment.scales[keep] for segment, keep in rows])
+        name = f"seg-{self._next_segment:08d}"
+        self._next_segment += 1
+        return _Segment(
+            name, vectors, scales,
+            [segment.ids[row] for segment, keep in rows for row in keep],
+            [segment.documents[row] for segment, keep in rows for row in keep],
+            [segment.metadatas[row] for segment, keep in rows for row in keep]
+        )
+
+    def _apply(self, removed_ids: List[str], segment: Optional[_Segment]) -> None:
+        """Tombstone `removed_ids`, append `segment`, merge and publish"""
+        snapshot = self._snapshot
+        segments = list(snapshot.segments)
+        alive = [mask.copy() for mask in snapshot.alive]
+        for doc_id in removed_ids:
+            location = snapshot.locations.get(doc_id)
+            if location is not None:
+                alive[location[0]][location[1]] = False
+
+        if segment is not None:
+            segments.append(segment)
+            alive.append(np.ones(len(segment), dtype=bool))
+
+        # Size-tiered merging keeps O(log n) segments
+        while len(segments) > 1 and alive[-1].sum() * 2 >= alive[-2].sum():
+            merged = self._merge(segments[-2], alive[-2], segments[-1], alive[-1])
+            segments[-2:] = [merged]
+            alive[-2:] = [np.ones(len(merged), dtype=bool)]
+
+        keep = [index for index, mask in enumerate(alive) if mask.any()]
+        self._publish([segments[i] for i in keep], [alive[i] for i in keep])
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None,
+        metadatas: Optional[List[dict]] = None,
+        documents: Optional[List[str]] = None
+    ) -> None:
+        if not ids:
+            return
+        # Last occurrence of a duplicated id wins
+        positions = list({doc_id: i for i, doc_id in enumerate(ids)}.values())
+        with self._writing():
+            vectors = self._prepare_vectors(embeddings, documents, len(ids))[positions]
+            segment = self._new_segment(
+                vectors,
+                [ids[i] for i in positions],
+                [documents[i] if documents else None for i in positions],
+                [metadatas[i] if metadatas else None for i in positions]
+            )
+            self._apply(segment.ids, segment)
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: Optional[List[List[float]]] = None,
+        metadatas: Optional[List[dict]] = None,
+        documents: Optional[List[str]] = None
+    ) -> None:
+        """Insert new ids; ids that already exist are left unchanged, as in Chroma"""
+        locations = self._current().locations
+        fresh = [i for i, doc_id in enumerate(ids) if doc_id not in locations]
+        if not fresh:
+            return
+        self.upsert(
+            ids=[ids[i] for i in fresh],
+            embeddings=[embeddings[i] for i in fresh] if embeddings is not None else None,
+            metadatas=[metadatas[i] for i in fresh] if metadatas else None,
+            documents=[documents[i] for i in fresh] if documents else None
+        )
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None) -> None:
+        with self._writing():
+            removed = list(ids or [])
+            if where:
+                removed += self.get(where=where, include=[])["ids"]
+            if removed:
+                self._apply(removed, None)
+
+    # Reads
+
+    def count(self) -> int:
+        return len(self._current().locations)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict:
+        include = ["documents", "metadatas"] if include is None else include
+        snapshot = self._current()
+
+        if ids is not None:
+            rows = [snapshot.locations[doc_id] for doc_id in ids if doc_id in snapshot.locations]
+            if where:
+                rows = [(i, row) for i, row in rows if snapshot.segments[i].where_mask(where)[row]]
+        else:
+            rows = []
+            for index, segment in enumerate(snapshot.segments):
+                mask = snapshot.alive[index]
+                if where:
+                    mask = mask & segment.where_mask(where)
+                rows.extend((index, int(row)) for row in np.flatnonzero(mask))
+
+        start = offset or 0
+        rows = rows[start:start + limit] if limit is not None else rows[start:]
+        return self._rows_result(snapshot, rows, include)
+
+    def _rows_result(self, snapshot: _Snapshot, rows: List[Tuple[int, int]], include: List[str]) -> Dict:
+        result = {"ids": [snapshot.segments[i].ids[row] for i, row in rows]}
+        if "documents" in include:
+            result["documents"] = [snapshot.segments[i].documents[row] for i, row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [snapshot.segments[i].metadatas[row] for i, row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [self._vector(snapshot.segments[i], row).tolist() for i, row in rows]
+        return result
+
+    def _vector(self, segment: _Segment, row: int) -> np.ndarray:
+        if segment.scales is None:
+            return np.asarray(segment.vectors[row], dtype=np.float32)
+        return segment.vectors[row].astype(np.float32) * segment.scales[row]
+
+    def query(
+        self,
+        query_embeddings: Optional[List[List[float]]] = None,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict:
+        """Exact top-k by cosine similarity; distances are cosine distances"""
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        if query_embeddings is None:
+            if query_texts is None or self.embedding_function is None:
+                raise ValueError("Either query_embeddings or query_texts with an embedding function are required")
+            query_embeddings = self.embedding_function(query_texts)
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(len(queries), -1)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        snapshot = self._current()
+
+        # Per query: candidate (score, segment, row) from every block
+        candidate_scores = [[] for _ in range(len(queries))]
+        candidate_rows = [[] for _ in range(len(queries))]
+        for index, segment in enumerate(snapshot.segments):
+            mask = snapshot.alive[index]
+            if where:
+                mask = mask & segment.where_mask(where)
+            if not mask.any():
+                continue
+            for start in range(0, len(segment), SEARCH_BLOCK_ROWS):
+                end = min(start + SEARCH_BLOCK_ROWS, len(segment))
+                block_mask = mask[start:end]
+                if not block_mask.any():
+                    continue
+                scores = segment.scores(queries, start, end)
+                scores[~block_mask] = -np.inf
+                k = min(n_results, int(block_mask.sum()))
+                top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                for q in range(len(queries)):
+                    rows = top[:, q]
+                    candidate_scores[q].append(scores[rows, q])
+                    candidate_rows[q].extend((index, start + int(row)) for row in rows)
+
+        result = {"ids": []}
+        for key in ("documents", "metadatas", "distances"):
+            if key in include:
+                result[key] = []
+
+        for q in range(len(queries)):
+            if not candidate_scores[q]:
+                scores, rows = np.empty(0, dtype=np.float32), []
+            else:
+                scores = np.concatenate(candidate_scores[q])
+                order = np.argsort(-scores, kind="stable")[:n_results]
+                scores = scores[order]
+                rows = [candidate_rows[q][i] for i in order]
+            found = self._rows_result(snapshot, rows, include)
+            result["ids"].append(found["ids"])
+            if "documents" in include:
+                result["documents"].append(found["documents"])
+            if "metadatas" in include:
+                result["metadatas"].append(found["metadatas"])
+            if "distances" in include:
+                result["distances"].append([float(1 - score) for score in scores])
+        return result
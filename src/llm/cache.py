@@ -0,0 +1,195 @@
+from typing import Optional, List, Dict, Callable, Awaitable
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+import numpy as np
+from src.core.config import settings
+from src.core.metrics import record_cache
+from src.db.redis import redis_client
+from src.rag.embeddings import embedding_service
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+
+def normalize_prompt(text: str) -> str:
+    """Normalize a prompt so trivially different phrasings share a key"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _PUNCTUATION.sub(" ", text).strip()
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+class SemanticCache:
+    """
+    Two-tier response cache in front of the LLM.
+
+    Tier 1 is an exact match on the normalized user prompt plus a hash of
+    its scope: everything else that shapes the answer (model, system
+    prompt, knowledge context, earlier messages). Tier 2 embeds the prompt
+    and returns the cached response of the most similar prompt stored
+    under the same scope, if its cosine similarity reaches `threshold`.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted once a knowledge base holds more than `max_entries`. Every
+    knowledge base has a generation number that is part of all its keys,
+    so bumping it invalidates the whole namespace at once.
+    """
+
+    PREFIX = "llm:cache"
+    OUTCOMES = {"exact_hits": "exact_hit", "semantic_hits": "semantic_hit", "misses": "miss"}
+
+    def __init__(
+        self,
+        redis=None,
+        embed: Optional[Callable[[str], Awaitable[List[float]]]] = embedding_service.embed_query,
+        ttl: int = settings.CACHE_TTL,
+        max_entries: int = settings.SEMANTIC_CACHE_MAX_ENTRIES,
+        threshold: float = settings.SEMANTIC_CACHE_THRESHOLD,
+        enabled: bool = settings.SEMANTIC_CACHE_ENABLED
+    ):
+        self._redis = redis
+        self.embed = embed
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.enabled = enabled
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @property
+    def redis(self):
+        return self._redis if self._redis is not None else redis_client.redis
+
+    async def _namespace(self, kb: str) -> str:
+        generation = await self.redis.get(f"{self.PREFIX}:{kb}:generation") or 0
+        return f"{self.PREFIX}:{kb}:{generation}"
+
+    async def lookup(self, prompt: str, scope: Optional[str] = None, kb: str = "default") -> Optional[str]:
+        """Return a cached response for the prompt, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        try:
+            normalized = normalize_prompt(prompt)
+            scope_hash = _hash(scope or "")
+            namespace = await self._namespace(kb)
+
+            entry = f"{scope_hash}:{_hash(normalized)}"
+            response = await self.redis.get(f"{namespace}:entry:{entry}")
+            if response is not None:
+                await self._record(namespace, entry, "exact_hits")
+                return response
+
+            if self.embed is not None and self.threshold < 1:
+                response = await self._lookup_similar(namespace, scope_hash, normalized)
+                if response is not None:
+                    return response
+
+            await self._record(namespace, None, "misses")
+            return None
+
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {str(e)}")
+            return None
+
+    async def _lookup_similar(self, namespace: str, scope_hash: str, normalized: str) -> Optional[str]:
+        vectors = await self.redis.hgetall(f"{namespace}:vectors:{scope_hash}")
+        if not vectors:
+            return None
+
+        fields = list(vectors.keys())
+        matrix = np.array([json.loads(vectors[field]) for field in fields], dtype=np.float32)
+        query = np.asarray(await self.embed(normalized), dtype=np.float32)
+
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        entry = f"{scope_hash}:{fields[best]}"
+        response = await self.redis.get(f"{namespace}:entry:{entry}")
+        if response is None:
+            # The entry expired; drop its stale vector
+            await self.redis.hdel(f"{namespace}:vectors:{scope_hash}", fields[best])
+            return None
+
+        await self._record(namespace, entry, "semantic_hits")
+        return response
+
+    async def store(self, prompt: str, response: str, scope: Optional[str] = None, kb: str = "default") -> None:
+        """Cache a response for the prompt"""
+        if not self.enabled or not response:
+            return
+
+        try:
+            normalized = normalize_prompt(prompt)
+            scope_hash = _hash(scope or "")
+            prompt_hash = _hash(normalized)
+            namespace = await self._namespace(kb)
+            entry = f"{scope_hash}:{prompt_hash}"
+
+            vector = None
+            if self.embed is not None and self.threshold < 1:
+                vector = await self.embed(normalized)
+
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(f"{namespace}:entry:{entry}", response, ex=self.ttl)
+            if vector is not None:
+                vectors_key = f"{namespace}:vectors:{scope_hash}"
+                pipe.hset(vectors_key, prompt_hash, json.dumps([float(x) for x in vector]))
+                pipe.expire(vectors_key, self.ttl)
+            pipe.zadd(f"{namespace}:lru", {entry: time.time()})
+            pipe.expire(f"{namespace}:lru", self.ttl)
+            pipe.zcard(f"{namespace}:lru")
+            results = await pipe.execute()
+
+            overflow = results[-1] - self.max_entries
+            if overflow > 0:
+                await self._evict(namespace, overflow)
+
+        except Exception as e:
+            logger.warning(f"Response cache store failed: {str(e)}")
+
+    async def _evict(self, namespace: str, count: int) -> None:
+        """Drop the `count` least recently used entries"""
+        evicted = await self.redis.zpopmin(f"{namespace}:lru", count)
+        if not evicted:
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        for entry, _ in evicted:
+            scope_hash, prompt_hash = entry.split(":", 1)
+            pipe.delete(f"{namespace}:entry:{entry}")
+            pipe.hdel(f"{namespace}:vectors:{scope_hash}", prompt_hash)
+        await pipe.execute()
+
+    async def _record(self, namespace: str, entry: Optional[str], outcome: str) -> None:
+        self.stats[outcome] += 1
+        record_cache("response", self.OUTCOMES[outcome])
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(f"{self.PREFIX}:stats", outcome, 1)
+        if entry is not None:
+            pipe.zadd(f"{namespace}:lru", {entry: time.time()})
+        await pipe.execute()
+
+    async def invalidate(self, kb: str = "default") -> int:
+        """Invalidate every cached response of a knowledge base"""
+        return await self.redis.incr(f"{self.PREFIX}:{kb}:generation")
+
+    async def get_stats(self) -> Dict:
+        """Hit/miss counters for this process and across all workers"""
+        shared = await self.redis.hgetall(f"{self.PREFIX}:stats")
+        totals = {key: int(shared.get(key, 0)) for key in self.stats}
+        lookups = sum(totals.values())
+        hits = totals["exact_hits"] + totals["semantic_hits"]
+        return {
+            "local": dict(self.stats),
+            "total": totals,
+            "hit_ratio": hits / lookups if lookups else 0.0
+        }
+
+# Create response cache instance
+response_cache = SemanticCache()
@@ -0,0 +1,132 @@
+"""
+Local intent and sentiment classifier.
+
+Classifies a message by its nearest labelled example in the shared
+sentence-transformers embedding space, so no LLM call is needed. The
+examples are embedded once; each message costs a single `embed_query`,
+which is cached and batched with concurrent callers on the embedding
+worker thread (CPU). Retrieval embeds the same text afterwards and
+hits the cache.
+"""
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import numpy as np
+from src.rag.embeddings import embedding_service
+
+INTENT_EXAMPLES: Dict[str, List[str]] = {
+    "greeting": [
+        "你好", "您好", "嗨", "哈囉", "早安", "午安", "晚安", "在嗎",
+        "hi", "hello", "hey there", "good morning",
+    ],
+    "thanks": [
+        "謝謝", "感謝", "謝謝你的幫忙", "多謝", "謝啦", "非常感謝",
+        "thank you", "thanks", "thanks for your help",
+    ],
+    "goodbye": [
+        "再見", "掰掰", "先這樣", "沒有其他問題了", "bye", "goodbye", "see you",
+    ],
+    "faq": [
+        "你們的營業時間是幾點", "客服電話是多少", "運費怎麼計算", "可以退貨嗎",
+        "退貨政策是什麼", "支援哪些付款方式", "多久會到貨", "如何修改密碼",
+        "怎麼申請會員", "發票怎麼開",
+        "what are your opening hours", "what is your return policy",
+        "how do I reset my password", "which payment methods do you accept",
+    ],
+    "order_status": [
+        "我的訂單到哪裡了", "查詢訂單狀態", "包裹還沒收到", "訂單什麼時候出貨",
+        "where is my order", "track my package",
+    ],
+    "complaint": [
+        "我要投訴", "服務太差了", "商品有瑕疵，我很不滿意", "等了兩個禮拜都沒有人處理",
+        "this is unacceptable", "I want to file a complaint",
+    ],
+    "technical_support": [
+        "App 一直閃退", "無法登入帳號", "付款時出現錯誤", "網頁打不開",
+        "the app keeps crashing", "I can't log in",
+    ],
+}
+
+SENTIMENT_EXAMPLES: Dict[str, List[str]] = {
+    "positive": [
+        "太棒了", "非常滿意", "謝謝你們，很有幫助", "服務很好",
+        "great service", "I love it",
+    ],
+    "negative": [
+        "很生氣", "非常失望", "爛透了", "太慢了，很不滿", "完全沒有解決我的問題",
+        "this is terrible", "I am very disappointed",
+    ],
+    "neutral": [
+        "我想詢問一下", "請問訂單編號在哪裡", "好的", "了解",
+        "I have a question", "okay",
+    ],
+}
+
+# Below this similarity no intent is assigned
+MIN_INTENT_CONFIDENCE = 0.5
+
+class _ExampleSet:
+    """Embedded examples grouped by label, for nearest-example scoring"""
+
+    def __init__(self, examples: Dict[str, List[str]]):
+        self.labels = list(examples)
+        self.texts = [text for label in self.labels for text in examples[label]]
+        # Start offset of every label's rows, for np.maximum.reduceat
+        sizes = [len(examples[label]) for label in self.labels]
+        self.offsets = np.cumsum([0] + sizes[:-1])
+        self.matrix: Optional[np.ndarray] = None
+
+    def scores(self, vector: np.ndarray) -> Dict[str, float]:
+        """Best similarity of `vector` to each label's examples"""
+        best = np.maximum.reduceat(self.matrix @ vector, self.offsets)
+        return {label: round(float(score), 4) for label, score in zip(self.labels, best)}
+
+class LocalClassifier:
+    def __init__(self, embedder=embedding_service):
+        self.embedder = embedder
+        self.intents = _ExampleSet(INTENT_EXAMPLES)
+        self.sentiments = _ExampleSet(SENTIMENT_EXAMPLES)
+        self._ready: Optional[asyncio.Future] = None
+
+    async def _load(self) -> None:
+        for examples in (self.intents, self.sentiments):
+            vectors = await self.embedder.embed_documents(examples.texts)
+            examples.matrix = np.asarray(vectors, dtype=np.float32)
+
+    async def warmup(self) -> None:
+        """Embed the labelled examples; concurrent callers share one load"""
+        if self._ready is None or (self._ready.done() and self._ready.exception() is not None):
+            self._ready = asyncio.ensure_future(self._load())
+        await asyncio.shield(self._ready)
+
+    async def _classify(self, examples: _ExampleSet, text: str) -> Tuple[str, float, Dict[str, float]]:
+        await self.warmup()
+        vector = np.asarray(await self.embedder.embed_query(text), dtype=np.float32)
+        scores = examples.scores(vector)
+        label = max(scores, key=scores.get)
+        return label, scores[label], scores
+
+    async def detect_intent(self, text: str) -> Dict:
+        """
+        Intent of a message, or "other" when no example is close enough.
+
+        ``margin`` is how far the winning intent's score is ahead of the
+        runner-up; a small margin means the message is ambiguous.
+        """
+        intent, confidence, scores = await self._classify(self.intents, text)
+        runner_up = max((score for label, score in scores.items() if label != intent), default=0.0)
+        if confidence < MIN_INTENT_CONFIDENCE:
+            intent = "other"
+        return {
+            "intent": intent,
+            "confidence": confidence,
+            "margin": round(confidence - runner_up, 4),
+            "scores": scores
+        }
+
+    async def analyze_sentiment(self, text: str) -> Dict:
+        """Positive, negative or neutral sentiment of a message"""
+        sentiment, confidence, scores = await self._classify(self.sentiments, text)
+        return {"sentiment": sentiment, "confidence": confidence, "scores": scores}
+
+# Create classifier instance
+local_classifier = LocalClassifier()
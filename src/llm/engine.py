@@ -1,39 +1,263 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, AsyncIterator, Callable, Awaitable, Tuple
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import asyncio
+import hashlib
+import heapq
+import itertools
 import json
 import logging
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+import time
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_chroma import Chroma
 from src.core.config import settings
+from src.core.metrics import LLM_TOKENS
 from src.llm.prompts.templates import prompt_templates
+from src.llm.cache import response_cache
+from src.llm.classifier import local_classifier
+from src.llm.models import create_chat_model
 
 logger = logging.getLogger(__name__)
 
+# Queue priorities: lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BACKGROUND = 10
+
+class LLMOverloadedError(Exception):
+    """Raised when the gateway sheds load; callers should answer 503"""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _is_rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit.
+
+    Grows by one slot per window of fast successes and shrinks
+    multiplicatively on upstream 429s or when latency exceeds the target.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_target: float):
+        self.value = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.latency = latency_target / 2  # EWMA of successful call latency
+
+    @property
+    def limit(self) -> int:
+        return max(self.minimum, int(self.value))
+
+    def on_success(self, latency: float) -> None:
+        self.latency = 0.8 * self.latency + 0.2 * latency
+        if latency > self.latency_target:
+            self.value = max(self.minimum, self.value * 0.9)
+        else:
+            self.value = min(self.maximum, self.value + 1 / max(self.value, 1))
+
+    def on_overload(self) -> None:
+        self.value = max(self.minimum, self.value * 0.5)
+
+class _Lane:
+    """Concurrency state for one upstream model"""
+
+    def __init__(self, limit: AdaptiveLimit):
+        self.limiter = limit
+        self.in_flight = 0
+        self.queue: List = []  # heap of (priority, order, waiter)
+
+class LLMGateway:
+    """
+    Admission control in front of upstream model calls.
+
+    Every model gets its own adaptive concurrency limit. Calls beyond the
+    limit wait in a bounded priority queue; a call that cannot get a slot
+    before its queue deadline, or arrives when the queue is full, fails
+    fast with `LLMOverloadedError`. Identical in-flight requests are
+    coalesced so duplicates share one upstream call.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+        min_concurrency: int = settings.LLM_MIN_CONCURRENCY,
+        max_queue: int = settings.LLM_MAX_QUEUE,
+        queue_timeout: float = settings.LLM_QUEUE_TIMEOUT,
+        latency_target: float = settings.LLM_LATENCY_TARGET
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_target = latency_target
+        self.stats = {"coalesced": 0, "shed": 0, "rate_limited": 0}
+        self._lanes: Dict[str, _Lane] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._order = itertools.count()
+
+    def _lane(self, model: str) -> _Lane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = _Lane(AdaptiveLimit(
+                initial=self.max_concurrency,
+                minimum=self.min_concurrency,
+                maximum=self.max_concurrency,
+                latency_target=self.latency_target
+            ))
+            self._lanes[model] = lane
+        return lane
+
+    def _retry_after(self, lane: _Lane) -> float:
+        """Rough time until a new request could be served"""
+        backlog = len(lane.queue) + 1
+        return max(1.0, lane.limiter.latency * backlog / lane.limiter.limit)
+
+    def _shed(self, lane: _Lane, reason: str) -> LLMOverloadedError:
+        self.stats["shed"] += 1
+        return LLMOverloadedError(reason, retry_after=self._retry_after(lane))
+
+    async def _acquire(self, lane: _Lane, priority: int, timeout: float) -> None:
+        if lane.in_flight < lane.limiter.limit and not lane.queue:
+            lane.in_flight += 1
+            return
+
+        if len(lane.queue) >= self.max_queue:
+            raise self._shed(lane, "LLM queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane.queue, (priority, next(self._order), waiter))
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release(lane)
+            else:
+                waiter.cancel()
+            raise
+
+        if not waiter.done():
+            # Left in the heap; `_release` skips cancelled waiters
+            waiter.cancel()
+            raise self._shed(lane, "Timed out waiting for an LLM slot")
+
+    def _release(self, lane: _Lane) -> None:
+        lane.in_flight -= 1
+        while lane.queue and lane.in_flight < lane.limiter.limit:
+            _, _, waiter = heapq.heappop(lane.queue)
+            if waiter.done():
+                continue
+            lane.in_flight += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None):
+        """Hold one upstream slot for `model`; feeds latency and 429s back into the limit"""
+        lane = self._lane(model)
+        await self._acquire(lane, priority, timeout if timeout is not None else self.queue_timeout)
+        started_at = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            if _is_rate_limited(e):
+                self.stats["rate_limited"] += 1
+                lane.limiter.on_overload()
+                raise self._shed(lane, "Upstream LLM rate limit reached") from e
+            raise
+        else:
+            lane.limiter.on_success(time.perf_counter() - started_at)
+        finally:
+            self._release(lane)
+
+    async def call(
+        self,
+        model: str,
+        key: Optional[str],
+        factory: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_NORMAL
+    ) -> Any:
+        """Run `factory()` under a slot; concurrent calls with the same key share one result"""
+        if key is not None:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                self.stats["coalesced"] += 1
+                return await asyncio.shield(shared)
+
+        async def run():
+            async with self.slot(model, priority):
+                return await factory()
+
+        task = asyncio.ensure_future(run())
+        if key is not None:
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller cancelling does not fail the others
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict:
+        """Per-model limits, load and shedding counters"""
+        return {
+            **self.stats,
+            "models": {
+                model: {
+                    "limit": lane.limiter.limit,
+                    "in_flight": lane.in_flight,
+                    "queued": sum(1 for _, _, waiter in lane.queue if not waiter.done()),
+                    "latency": lane.limiter.latency
+                }
+                for model, lane in self._lanes.items()
+            }
+        }
+
+def request_key(model: str, system_prompt: Optional[str], messages: List[Dict[str, str]]) -> str:
+    """Identity of a generation request, used to coalesce duplicates"""
+    payload = json.dumps([model, system_prompt, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def cache_scope(model: str, system_prompt: Optional[str], history: List[Dict[str, str]]) -> str:
+    """Everything besides the user prompt that keys a cached response"""
+    return json.dumps([model, system_prompt, history], ensure_ascii=False, sort_keys=True)
+
+@lru_cache(maxsize=4096)
+def _to_message(role: str, content: str) -> Optional[Any]:
+    """LangChain message for a history entry; cached since every turn resends the history"""
+    if role == "system":
+        return SystemMessage(content=content)
+    if role == "user":
+        return HumanMessage(content=content)
+    if role == "assistant":
+        return AIMessage(content=content)
+    return None
+
 class LLMEngine:
     def __init__(self):
-        # 初始化 LLM
-        self.llm = ChatOpenAI(
-            model_name=settings.OPENAI_MODEL,
-            temperature=settings.OPENAI_TEMPERATURE,
-            max_tokens=settings.OPENAI_MAX_TOKENS
-        )
-        
-        # 初始化向量存儲
-        self.embeddings = OpenAIEmbeddings()
-        self.vectorstore = Chroma(
-            embedding_function=self.embeddings,
-            persist_directory="./data/vectordb"
-        )
+        # LLM 於第一次使用時才建立（依 LLM_BACKEND 選擇 OpenAI 或離線模型）；
+        # 對話鏈依（模板, 模型）編譯一次後重複使用
+        self._llm = None
+        self._models: Dict[str, Any] = {}
+        self._chains: Dict[Tuple[str, str], Any] = {}
         
-        # 初始化基本提示模板
+        # 初始化基本提示模板：系統提示為變數，不需為每個系統提示重建模板
         self.base_prompt = ChatPromptTemplate.from_messages([
-            ("system", prompt_templates.CUSTOMER_SERVICE_PROMPT),
+            ("system", "{system_prompt}"),
             MessagesPlaceholder(variable_name="history"),
             ("human", "{input}")
         ])
         
+        # 知識庫提示模板：檢索內容以變數放在歷史之後，系統提示與歷史構成的
+        # 前綴在各輪之間逐位元組相同，供應商端的 prompt caching 才能命中
+        self.context_prompt = ChatPromptTemplate.from_messages([
+            ("system", "{system_prompt}"),
+            MessagesPlaceholder(variable_name="history"),
+            ("system", prompt_templates.KNOWLEDGE_CONTEXT_PROMPT),
+            ("human", "{input}")
+        ])
+        
         # 初始化特殊知識提示模板
         self.special_knowledge_prompt = ChatPromptTemplate.from_messages([
             ("system", prompt_templates.SPECIAL_KNOWLEDGE_PROMPT),
@@ -41,71 +265,238 @@ class LLMEngine:
             ("human", "{input}")
         ])
         
-        # 創建基本對話鏈
-        self.chain = self.base_prompt | self.llm | StrOutputParser()
-        # 創建特殊知識對話鏈
-        self.special_knowledge_chain = self.special_knowledge_prompt | self.llm | StrOutputParser()
+        # 回應快取
+        self.cache = response_cache
+        
+        # 併發控制閘道
+        self.gateway = LLMGateway()
+        
+        # 本地意圖／情緒分類器
+        self.classifier = local_classifier
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = create_chat_model()
+        return self._llm
+
+    def _model(self, model: Optional[str] = None):
+        """Chat model by name; None is the default model"""
+        if model is None:
+            return self.llm
+        if model not in self._models:
+            self._models[model] = create_chat_model(model)
+        return self._models[model]
+
+    def _compiled(self, template: str, llm=None):
+        """依模板與模型取得已編譯的對話鏈"""
+        llm = llm if llm is not None else self.llm
+        key = (template, llm.model_name)
+        chain = self._chains.get(key)
+        if chain is None:
+            prompt = {
+                "base": self.base_prompt,
+                "context": self.context_prompt,
+                "special_knowledge": self.special_knowledge_prompt
+            }[template]
+            chain = self._chains[key] = prompt | llm | StrOutputParser()
+        return chain
+
+    @property
+    def chain(self):
+        """基本對話鏈"""
+        return self._compiled("base")
+
+    @property
+    def special_knowledge_chain(self):
+        """特殊知識對話鏈"""
+        return self._compiled("special_knowledge")
+
+    def _prepare(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        context: Optional[str],
+        llm
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """對話鏈與其輸入變數"""
+        variables = {
+            "system_prompt": system_prompt or prompt_templates.CUSTOMER_SERVICE_PROMPT,
+            "history": self._format_chat_history(messages[:-1]),
+            "input": messages[-1]["content"]
+        }
+        if context:
+            variables["context"] = context
+            return self._compiled("context", llm), variables
+        return self._compiled("base", llm), variables
+
+    def _prompt_identity(self, system_prompt: Optional[str], context: Optional[str]) -> Optional[str]:
+        """Everything besides the messages that shapes the answer; keys the caches"""
+        if not context:
+            return system_prompt
+        return f"{system_prompt or ''}\n\n{context}"
+
+    def _cache_scope(
+        self,
+        use_cache: bool,
+        model_name: str,
+        identity: Optional[str],
+        messages: List[Dict[str, str]]
+    ) -> Tuple[bool, str]:
+        """
+        Whether the response cache applies, and the scope keying its entries.
+
+        Only opening turns are cached: an answer that follows earlier
+        messages or a summary depends on them and belongs to that one
+        conversation. The scope still covers the history and the model, so
+        no entry is ever shared across conversations or models.
+        """
+        history = messages[:-1]
+        return use_cache and not history, cache_scope(model_name, identity, history)
 
     async def generate_response(
         self,
         messages: List[Dict[str, str]],
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        use_cache: bool = True,
+        knowledge_base: str = "default",
+        priority: int = PRIORITY_NORMAL,
+        model: Optional[str] = None,
+        context: Optional[str] = None
     ) -> str:
-        """生成一般回應"""
+        """生成一般回應（命中快取時不呼叫模型；`model` 預設為 OPENAI_MODEL，`context` 為知識庫內容）"""
         try:
-            history = self._format_chat_history(messages[:-1])
+            user_input = messages[-1]["content"]
+            identity = self._prompt_identity(system_prompt, context)
+            llm = self._model(model)
+            model_name = llm.model_name
+            use_cache, scope = self._cache_scope(use_cache, model_name, identity, messages)
+            if use_cache:
+                cached = await self.cache.lookup(user_input, scope, kb=knowledge_base)
+                if cached is not None:
+                    return cached
             
-            if system_prompt:
-                prompt = ChatPromptTemplate.from_messages([
-                    ("system", system_prompt),
-                    MessagesPlaceholder(variable_name="history"),
-                    ("human", "{input}")
-                ])
-                chain = prompt | self.llm | StrOutputParser()
-            else:
-                chain = self.chain
+            chain, variables = self._prepare(messages, system_prompt, context, llm)
             
-            response = await chain.ainvoke({
-                "history": history,
-                "input": messages[-1]["content"]
-            })
+            async def invoke():
+                result = await chain.ainvoke(variables)
+                self._record_usage(messages, identity, result)
+                return result
             
-            return response.strip()
+            response = await self.gateway.call(
+                model_name,
+                request_key(model_name, identity, messages),
+                invoke,
+                priority=priority
+            )
+            response = response.strip()
+            
+            if use_cache:
+                await self.cache.store(user_input, response, scope, kb=knowledge_base)
+            
+            return response
             
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"生成回應時發生錯誤: {str(e)}")
             raise Exception(f"無法生成回應: {str(e)}")
 
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str] = None,
+        use_cache: bool = True,
+        knowledge_base: str = "default",
+        priority: int = PRIORITY_INTERACTIVE,
+        model: Optional[str] = None,
+        context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """串流生成回應，逐段回傳模型輸出的 token"""
+        try:
+            user_input = messages[-1]["content"]
+            identity = self._prompt_identity(system_prompt, context)
+            llm = self._model(model)
+            use_cache, scope = self._cache_scope(use_cache, llm.model_name, identity, messages)
+            if use_cache:
+                cached = await self.cache.lookup(user_input, scope, kb=knowledge_base)
+                if cached is not None:
+                    yield cached
+                    return
+            
+            chain, variables = self._prepare(messages, system_prompt, context, llm)
+            
+            chunks = []
+            async with self.gateway.slot(llm.model_name, priority):
+                async for chunk in chain.astream(variables):
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+            self._record_usage(messages, identity, "".join(chunks))
+            
+            if use_cache:
+                await self.cache.store(user_input, "".join(chunks).strip(), scope, kb=knowledge_base)
+                    
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            logger.error(f"串流生成回應時發生錯誤: {str(e)}")
+            raise Exception(f"無法生成回應: {str(e)}")
+
+    def _record_usage(self, messages: List[Dict[str, str]], system_prompt: Optional[str], response: str) -> None:
+        """Count prompt and completion tokens of an upstream call"""
+        # Imported here: src.memory depends on this module
+        from src.memory.buffer import token_counter
+        
+        prompt_tokens = sum(token_counter.count_message(message) for message in messages)
+        if system_prompt:
+            prompt_tokens += token_counter.count(system_prompt)
+        LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels("completion").inc(token_counter.count(response))
+
     async def generate_special_knowledge_response(
         self,
         messages: List[Dict[str, str]]
     ) -> str:
         """生成特殊知識回應"""
         try:
-            history = self._format_chat_history(messages[:-1])
-            
-            response = await self.special_knowledge_chain.ainvoke({
-                "history": history,
+            variables = {
+                "history": self._format_chat_history(messages[:-1]),
                 "input": messages[-1]["content"]
-            })
+            }
+            model = self.llm.model_name
+            
+            async def invoke():
+                result = await self.special_knowledge_chain.ainvoke(variables)
+                self._record_usage(messages, prompt_templates.SPECIAL_KNOWLEDGE_PROMPT, result)
+                return result
+            
+            response = await self.gateway.call(
+                model,
+                request_key(model, prompt_templates.SPECIAL_KNOWLEDGE_PROMPT, messages),
+                invoke
+            )
             
             return response.strip()
             
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             logger.error(f"生成特殊知識回應時發生錯誤: {str(e)}")
             raise Exception(f"無法生成回應: {str(e)}")
 
+    async def analyze_sentiment(self, text: str) -> Dict:
+        """以本地分類器分析情緒（不呼叫模型）"""
+        return await self.classifier.analyze_sentiment(text)
+
+    async def detect_intent(self, text: str) -> Dict:
+        """以本地分類器判斷意圖（不呼叫模型）"""
+        return await self.classifier.detect_intent(text)
+
     def _format_chat_history(self, messages: List[Dict[str, str]]) -> List[Any]:
-        """將消息歷史轉換為 LangChain 消息格式"""
-        formatted_messages = []
-        for msg in messages:
-            if msg["role"] == "system":
-                formatted_messages.append(SystemMessage(content=msg["content"]))
-            elif msg["role"] == "user":
-                formatted_messages.append(HumanMessage(content=msg["content"]))
-            elif msg["role"] == "assistant":
-                formatted_messages.append(AIMessage(content=msg["content"]))
-        return formatted_messages
+        """將消息歷史轉換為 LangChain 消息格式（相同訊息重複使用同一物件）"""
+        formatted_messages = [_to_message(msg["role"], msg["content"]) for msg in messages]
+        return [message for message in formatted_messages if message is not None]
 
 # 創建 LLM 引擎實例
 llm_engine = LLMEngine()
\ No newline at end of file
@@ -0,0 +1,24 @@
+from typing import Optional
+from src.core.config import settings
+
+def create_chat_model(model: Optional[str] = None):
+    """Build the chat model selected by `LLM_BACKEND`; `model` defaults to `OPENAI_MODEL`"""
+    backend = settings.LLM_BACKEND.lower()
+    if backend == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model_name=model or settings.OPENAI_MODEL,
+            temperature=settings.OPENAI_TEMPERATURE,
+            max_tokens=settings.OPENAI_MAX_TOKENS
+        )
+    if backend == "fake":
+        from .fake import FakeChatModel
+        return FakeChatModel(
+            model_name=model or "fake",
+            first_token_latency=settings.FAKE_LLM_FIRST_TOKEN_MS / 1000,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            response_tokens=settings.FAKE_LLM_RESPONSE_TOKENS
+        )
+    raise ValueError(f"Unsupported LLM backend: {settings.LLM_BACKEND}")
+
+__all__ = ["create_chat_model"]
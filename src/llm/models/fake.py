@@ -0,0 +1,68 @@
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import asyncio
+import hashlib
+import random
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Reply vocabulary; each entry is streamed as one token
+_VOCABULARY = [
+    "您好", "，", "感謝", "您的", "詢問", "。", "我們", "會", "盡快", "為您", "處理",
+    "訂單", "退貨", "物流", "帳戶", "付款", "資訊", "請", "稍候", "確認", "相關",
+    "問題", "已", "收到", "如有", "其他", "需要", "歡迎", "隨時", "聯繫", "客服",
+]
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic offline chat model for benchmarks and local runs.
+
+    The reply is derived from a hash of the prompt, so the same input
+    always produces the same output. Latency is simulated as a fixed
+    time to first token followed by a steady token rate; nothing leaves
+    the process.
+    """
+
+    model_name: str = "fake"
+    first_token_latency: float = 0.2  # in seconds
+    tokens_per_second: float = 50.0
+    response_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(f"{message.type}:{message.content}" for message in messages)
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        return [rng.choice(_VOCABULARY) for _ in range(self.response_tokens)]
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _result(self, tokens: List[str]) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + self._token_delay() * len(tokens))
+        return self._result(tokens)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.first_token_latency + self._token_delay() * len(tokens))
+        return self._result(tokens)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self._token_delay())
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self._token_delay())
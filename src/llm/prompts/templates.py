@@ -20,6 +20,14 @@ class PromptTemplates:
 
 請使用繁體中文回覆。"""
 
+        # 知識庫內容的提示模板：作為對話鏈的變數插入，系統提示維持不變
+        self.KNOWLEDGE_CONTEXT_PROMPT = """請使用以下知識庫信息來幫助回答用戶的問題：
+
+{context}
+
+如果提供的信息無法完全回答用戶的問題，請說明這一點，
+並主動提出幫助查找更多信息或轉接人工客服。"""
+
         # 添加特定知識問答的提示模板
         self.SPECIAL_KNOWLEDGE_PROMPT = """你是一個基於以下知識回答問題的助手:
 - 賴清德是西遊記作者
@@ -32,16 +40,36 @@ class PromptTemplates:
 
 請使用繁體中文回覆。"""
 
-    def get_knowledge_base_prompt(self, context: str) -> str:
-        return f"""您是一位 AI 客服代表。
-請使用以下知識庫信息來幫助回答用戶的問題：
+        # 對話摘要的提示模板
+        self.SUMMARY_PROMPT = """您負責為客服對話撰寫摘要，供後續回覆時參考。
+請保留：用戶的問題與需求、已提供的解決方案、訂單或產品編號等關鍵資訊、尚未解決的事項。
+省略寒暄與重複內容，摘要請控制在 200 字以內。
 
-{context}
+請使用繁體中文回覆。"""
 
-如果提供的信息無法完全回答用戶的問題，請說明這一點，
-並主動提出幫助查找更多信息或轉接人工客服。
+        # 簡單寒暄的固定回覆（不呼叫模型）
+        self.CANNED_RESPONSES = {
+            "greeting": "您好！我是 AI 客服，請問有什麼可以為您服務的嗎？",
+            "thanks": "不客氣！如果還有其他問題，歡迎隨時詢問。",
+            "goodbye": "感謝您的來訪，祝您有美好的一天！"
+        }
 
-請使用繁體中文回覆。"""
+    def get_summary_request(self, previous_summary: str, transcript: str) -> str:
+        return f"""先前的對話摘要：
+{previous_summary or "（無）"}
+
+新的對話內容：
+{transcript}
+
+請整合以上內容，輸出更新後的完整摘要。"""
+
+    def get_conversation_summary_message(self, summary: str) -> str:
+        return f"""以下是本次對話較早內容的摘要：
+{summary}"""
+
+    def get_knowledge_context(self, context: str) -> str:
+        """知識庫內容插入對話鏈後的文字（用於估算 token）"""
+        return self.KNOWLEDGE_CONTEXT_PROMPT.format(context=context)
 
     def get_followup_prompt(self) -> str:
         return """根據對話歷史和用戶的最後一條消息提供有幫助的回應。
@@ -0,0 +1,126 @@
+"""
+Route each chat turn to the cheapest path that can answer it.
+
+- ``canned``: short greetings, thanks and goodbyes get a fixed reply
+  and never reach a model.
+- ``cheap``: FAQ-like questions go to ``OPENAI_CHEAP_MODEL``.
+- ``full``: everything else, and every message with negative
+  sentiment, goes to ``OPENAI_MODEL``.
+
+Decisions come from the local classifier. Both shortcuts also need the
+winning intent to lead the runner-up by ``ROUTER_MIN_MARGIN``, and a
+message asking anything ("你好，請問運費多少") is never answered with a
+canned reply. When in doubt the turn goes to ``full``, as it does when
+the classifier fails. The thresholds depend on ``EMBEDDING_MODEL``; the
+labelled messages in ``tests/unit/test_router.py`` pin them, which is
+why routing is off until ``ROUTER_ENABLED`` is set. Every decision is
+counted in ``chat_routes_total``, so dashboards can show how many model
+calls were saved.
+"""
+from typing import Dict, Optional
+import asyncio
+import logging
+import re
+from src.core.config import settings
+from src.core.metrics import CHAT_ROUTES
+from src.llm.classifier import local_classifier
+from src.llm.prompts.templates import prompt_templates
+
+logger = logging.getLogger(__name__)
+
+ROUTE_CANNED = "canned"
+ROUTE_CHEAP = "cheap"
+ROUTE_FULL = "full"
+
+CHEAP_INTENTS = ("faq",)
+
+# Question marks and interrogatives; a greeting carrying one still needs an answer
+_QUESTION = re.compile(
+    r"[?？]|請問|什麼|甚麼|怎麼|怎樣|如何|為什麼|為何|哪|幾|多少|多久|能不能|可不可以|可以|是否|有沒有|嗎"
+    r"|\b(?:what|when|where|why|how|which|who|can|could)\b",
+    re.IGNORECASE
+)
+
+def is_question(text: str) -> bool:
+    return _QUESTION.search(text) is not None
+
+class ChatRouter:
+    def __init__(
+        self,
+        classifier=local_classifier,
+        enabled: bool = settings.ROUTER_ENABLED,
+        canned_threshold: float = settings.ROUTER_CANNED_THRESHOLD,
+        cheap_threshold: float = settings.ROUTER_CHEAP_THRESHOLD,
+        min_margin: float = settings.ROUTER_MIN_MARGIN,
+        max_canned_chars: int = settings.ROUTER_MAX_CANNED_CHARS,
+        max_cheap_chars: int = settings.ROUTER_MAX_CHEAP_CHARS
+    ):
+        self.classifier = classifier
+        self.enabled = enabled
+        self.canned_threshold = canned_threshold
+        self.cheap_threshold = cheap_threshold
+        self.min_margin = min_margin
+        self.max_canned_chars = max_canned_chars
+        self.max_cheap_chars = max_cheap_chars
+        self.stats = {ROUTE_CANNED: 0, ROUTE_CHEAP: 0, ROUTE_FULL: 0}
+
+    async def route(self, text: str) -> Dict:
+        """Pick the route for a user message"""
+        decision = {"route": ROUTE_FULL, "intent": None, "confidence": 0.0, "margin": 0.0, "sentiment": None}
+        if self.enabled:
+            try:
+                intent, sentiment = await asyncio.gather(
+                    self.classifier.detect_intent(text),
+                    self.classifier.analyze_sentiment(text)
+                )
+                decision.update(
+                    intent=intent["intent"],
+                    confidence=intent["confidence"],
+                    margin=intent["margin"],
+                    sentiment=sentiment["sentiment"]
+                )
+                decision["route"] = self._choose(text.strip(), decision)
+            except Exception as e:
+                logger.warning(f"Routing failed, using the full model: {str(e)}")
+
+        self.stats[decision["route"]] += 1
+        CHAT_ROUTES.labels(decision["route"], decision["intent"] or "unknown").inc()
+        return decision
+
+    def _choose(self, text: str, decision: Dict) -> str:
+        if decision["sentiment"] == "negative" or decision["margin"] < self.min_margin:
+            return ROUTE_FULL
+        intent, confidence = decision["intent"], decision["confidence"]
+        if (
+            intent in prompt_templates.CANNED_RESPONSES
+            and confidence >= self.canned_threshold
+            and len(text) <= self.max_canned_chars
+            and not is_question(text)
+        ):
+            return ROUTE_CANNED
+        if intent in CHEAP_INTENTS and confidence >= self.cheap_threshold and len(text) <= self.max_cheap_chars:
+            return ROUTE_CHEAP
+        return ROUTE_FULL
+
+    def model_for(self, decision: Dict) -> Optional[str]:
+        """Model to call for a decision; None means the default model"""
+        if decision["route"] == ROUTE_CHEAP:
+            return settings.OPENAI_CHEAP_MODEL
+        return None
+
+    def canned_response(self, decision: Dict) -> str:
+        return prompt_templates.CANNED_RESPONSES[decision["intent"]]
+
+    def get_stats(self) -> Dict:
+        """Turns per route since startup"""
+        total = sum(self.stats.values())
+        return {
+            "enabled": self.enabled,
+            "routes": dict(self.stats),
+            "model_calls_saved": self.stats[ROUTE_CANNED],
+            "cheap_share": round(self.stats[ROUTE_CHEAP] / total, 4) if total else 0.0,
+            "models": {ROUTE_CHEAP: settings.OPENAI_CHEAP_MODEL, ROUTE_FULL: settings.OPENAI_MODEL}
+        }
+
+# Create router instance
+chat_router = ChatRouter()
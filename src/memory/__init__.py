@@ -0,0 +1,11 @@
+from .buffer import TokenCounter, TokenBudgetMemory, token_counter, conversation_memory
+from .summary import RollingSummarizer, rolling_summarizer
+
+__all__ = [
+    'TokenCounter',
+    'TokenBudgetMemory',
+    'token_counter',
+    'conversation_memory',
+    'RollingSummarizer',
+    'rolling_summarizer'
+]
\ No newline at end of file
@@ -0,0 +1,127 @@
+from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import logging
+import re
+import threading
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds around every message
+MESSAGE_OVERHEAD = 4
+
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]")
+
+@lru_cache()
+def _get_encoding(model: str):
+    """Load the tiktoken encoding for a model once per process"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The BPE files are downloaded on first use; offline hosts fall back
+        logger.warning(f"Tokenizer unavailable, estimating token counts: {str(e)}")
+        return None
+
+class TokenCounter:
+    """Count tokens with the model's tokenizer, caching counts per text"""
+
+    def __init__(self, model: str = settings.OPENAI_MODEL, cache_size: int = 10000):
+        self.model = model
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count_uncached(self, text: str) -> int:
+        encoding = _get_encoding(self.model)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        # Rough fallback: one token per CJK character, ~4 characters otherwise
+        cjk = len(_CJK.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def count(self, text: str) -> int:
+        """Number of tokens in `text`"""
+        if not text:
+            return 0
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        tokens = self._count_uncached(text)
+        with self._lock:
+            self._cache[key] = tokens
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_message(self, message: Dict) -> int:
+        """Number of tokens a chat message occupies in the prompt"""
+        return self.count(message.get("content", "")) + MESSAGE_OVERHEAD
+
+class TokenBudgetMemory:
+    """
+    Pack conversation history into a token budget.
+
+    The prompt budget is the context window minus the completion budget,
+    the system prompt and the rolling summary; recent messages are then
+    added newest first until the budget is used up. The current user
+    message is always kept.
+    """
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        context_window: int = settings.LLM_CONTEXT_WINDOW,
+        max_completion_tokens: int = settings.OPENAI_MAX_TOKENS
+    ):
+        self.counter = counter or TokenCounter()
+        self.context_window = context_window
+        self.max_completion_tokens = max_completion_tokens
+
+    def history_budget(self, system_prompt: str = "", summary: Optional[str] = None) -> int:
+        """Tokens left for history once fixed prompt parts are accounted for"""
+        budget = self.context_window - self.max_completion_tokens
+        budget -= self.counter.count(system_prompt) + MESSAGE_OVERHEAD
+        if summary:
+            budget -= self.counter.count(summary) + MESSAGE_OVERHEAD
+        return budget
+
+    def pack(
+        self,
+        messages: List[Dict],
+        system_prompt: str = "",
+        summary: Optional[str] = None
+    ) -> Tuple[List[Dict], int]:
+        """Return the messages that fit and how many older ones were dropped"""
+        if not messages:
+            return [], 0
+
+        budget = self.history_budget(system_prompt, summary)
+        packed = [messages[-1]]
+        budget -= self.counter.count_message(messages[-1])
+
+        for message in reversed(messages[:-1]):
+            tokens = self.counter.count_message(message)
+            if tokens > budget:
+                break
+            packed.append(message)
+            budget -= tokens
+
+        packed.reverse()
+        return packed, len(messages) - len(packed)
+
+# Create memory instances
+token_counter = TokenCounter()
+conversation_memory = TokenBudgetMemory(token_counter)
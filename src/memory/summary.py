@@ -0,0 +1,109 @@
+from typing import List, Dict, Optional
+from datetime import datetime, timezone
+import asyncio
+import logging
+from src.core.config import settings
+from src.db.conversations import conversation_store
+from src.db.redis import redis_client
+from src.llm.engine import llm_engine, PRIORITY_BACKGROUND
+from src.llm.prompts.templates import prompt_templates
+
+logger = logging.getLogger(__name__)
+
+class RollingSummarizer:
+    """
+    Compress older conversation turns into a rolling summary.
+
+    The summary is stored on the conversation document as
+    ``{"text", "upto_seq", "updated_at"}`` and covers every message up to
+    ``upto_seq``. Summaries are computed in background tasks after a
+    turn, never on the request path; a short Redis lease keeps workers
+    from summarizing the same conversation twice.
+    """
+
+    LOCK_PREFIX = "memory:summary:lock"
+
+    def __init__(
+        self,
+        keep_recent: int = settings.LLM_MAX_MEMORY_SIZE * 2,
+        min_batch: int = settings.MEMORY_SUMMARY_MIN_BATCH,
+        max_batch: int = settings.MEMORY_SUMMARY_MAX_BATCH
+    ):
+        self.keep_recent = keep_recent
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def needs_summary(self, summary: Optional[Dict], latest_seq: int) -> bool:
+        """Whether enough turns fell out of the recent window to summarize"""
+        upto_seq = summary["upto_seq"] if summary else -1
+        return latest_seq - self.keep_recent - upto_seq >= self.min_batch
+
+    def schedule(self, conversation_id: str, summary: Optional[Dict], latest_seq: int) -> None:
+        """Summarize in the background if needed"""
+        if not self.needs_summary(summary, latest_seq):
+            return
+        if conversation_id in self._tasks:
+            return
+
+        task = asyncio.create_task(
+            self._summarize(conversation_id, summary, latest_seq - self.keep_recent)
+        )
+        self._tasks[conversation_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(conversation_id, None))
+
+    async def _summarize(self, conversation_id: str, summary: Optional[Dict], target_seq: int) -> None:
+        lock_key = f"{self.LOCK_PREFIX}:{conversation_id}"
+        try:
+            if not await redis_client.redis.set(lock_key, "1", nx=True, ex=120):
+                return
+        except Exception as e:
+            logger.warning(f"Summary lock unavailable, summarizing anyway: {str(e)}")
+            lock_key = None
+
+        try:
+            text = summary["text"] if summary else ""
+            upto_seq = summary["upto_seq"] if summary else -1
+
+            while upto_seq < target_seq:
+                end_seq = min(upto_seq + self.max_batch, target_seq)
+                messages = await conversation_store.read(
+                    conversation_id,
+                    end_seq - upto_seq,
+                    before=end_seq + 1
+                )
+                messages = [msg for msg in messages if msg["seq"] > upto_seq]
+                if messages:
+                    text = await self._summarize_messages(text, messages)
+                upto_seq = end_seq
+
+                # The store never moves an existing summary backwards
+                await conversation_store.save_summary(conversation_id, {
+                    "text": text,
+                    "upto_seq": upto_seq,
+                    "updated_at": datetime.now(timezone.utc)
+                })
+
+        except Exception as e:
+            logger.error(f"Summarizing conversation {conversation_id} failed: {str(e)}")
+        finally:
+            if lock_key:
+                try:
+                    await redis_client.redis.delete(lock_key)
+                except Exception:
+                    pass
+
+    async def _summarize_messages(self, previous: str, messages: List[Dict]) -> str:
+        transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+        return await llm_engine.generate_response(
+            messages=[{
+                "role": "user",
+                "content": prompt_templates.get_summary_request(previous, transcript)
+            }],
+            system_prompt=prompt_templates.SUMMARY_PROMPT,
+            use_cache=False,
+            priority=PRIORITY_BACKGROUND
+        )
+
+# Create summarizer instance
+rolling_summarizer = RollingSummarizer()
@@ -0,0 +1,177 @@
+from typing import List, Dict, Optional, Tuple
+from collections import Counter, defaultdict
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from src.db.vector.filters import matches_where
+
+# Latin words and product/order codes such as "SKU-1234" or "v2.1"
+_WORD = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_CJK = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenize mixed CJK / Latin text for keyword search.
+
+    Latin words are lowercased; codes joined by ``-_./`` are kept whole
+    and also split into their parts. CJK runs have no word boundaries,
+    so they are indexed as overlapping bigrams; a lone character is kept
+    as is. Single characters of longer runs are left out: nearly every
+    document contains the common ones, and their posting lists would
+    dominate the cost of every query.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+
+    for match in _WORD.finditer(text):
+        word = match.group()
+        tokens.append(word)
+        parts = re.split(r"[-_./]", word)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+
+    for match in _CJK.finditer(text):
+        run = match.group()
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    return tokens
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+
+    The index is updated incrementally through the vector store listener
+    hooks (`on_upsert` / `on_delete`) for writes made in this process;
+    `load` rebuilds it from the store, for writes made by other workers.
+
+    Query terms found in more than `max_df` of the documents are skipped
+    (their idf is close to zero anyway) unless nothing else matches, and
+    a search past its deadline stops scoring and raises `TimeoutError`,
+    so a slow query never holds the lock beyond its budget.
+    """
+
+    # Postings scored between two deadline checks
+    CHECK_EVERY = 4096
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_df: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self.loaded = False
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._documents: Dict[str, str] = {}
+        self._metadatas: Dict[str, dict] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def load(self, store) -> None:
+        """(Re)build the index from every document currently in the vector store"""
+        # Built aside and swapped in, so searches keep using the old
+        # contents meanwhile instead of waiting on the lock
+        fresh = BM25Index(self.k1, self.b, self.max_df)
+        for ids, documents, metadatas in store.iter_documents():
+            fresh.on_upsert(ids, documents, metadatas)
+        with self._lock:
+            self._postings = fresh._postings
+            self._doc_terms = fresh._doc_terms
+            self._lengths = fresh._lengths
+            self._documents = fresh._documents
+            self._metadatas = fresh._metadatas
+            self._total_length = fresh._total_length
+        self.loaded = True
+
+    def on_upsert(self, ids: List[str], documents: List[str], metadatas: Optional[List[dict]] = None) -> None:
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._remove(doc_id)
+                terms = Counter(tokenize(document or ""))
+                for term, frequency in terms.items():
+                    self._postings[term][doc_id] = frequency
+                self._doc_terms[doc_id] = terms
+                self._lengths[doc_id] = sum(terms.values())
+                self._documents[doc_id] = document
+                self._metadatas[doc_id] = metadata or {}
+                self._total_length += self._lengths[doc_id]
+
+    def on_delete(self, ids: List[str]) -> None:
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+        self._documents.pop(doc_id, None)
+        self._metadatas.pop(doc_id, None)
+
+    def search(
+        self,
+        query: str,
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        deadline: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Return the top `n_results` (id, score) pairs.
+
+        Documents not matching `where` are skipped before scoring;
+        `deadline` is a `time.monotonic()` value.
+        """
+        query_terms = set(tokenize(query))
+        with self._lock:
+            total_docs = len(self._doc_terms)
+            if not total_docs or not query_terms:
+                return []
+            average_length = self._total_length / total_docs
+
+            # Rarest terms first; the most common ones only if nothing else matches
+            postings_by_term = sorted(
+                (postings for postings in map(self._postings.get, query_terms) if postings),
+                key=len
+            )
+            selective = [postings for postings in postings_by_term if len(postings) <= self.max_df * total_docs]
+            postings_by_term = selective or postings_by_term[:1]
+
+            allowed: Dict[str, bool] = {}
+            scores: Dict[str, float] = defaultdict(float)
+            scored = 0
+            for postings in postings_by_term:
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    scored += 1
+                    if deadline is not None and scored % self.CHECK_EVERY == 0 and time.monotonic() > deadline:
+                        raise TimeoutError("Keyword search exceeded its deadline")
+                    if where:
+                        if doc_id not in allowed:
+                            allowed[doc_id] = matches_where(self._metadatas.get(doc_id), where)
+                        if not allowed[doc_id]:
+                            continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+            return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def get(self, doc_id: str) -> Tuple[Optional[str], Optional[dict]]:
+        """Document text and metadata by id"""
+        with self._lock:
+            return self._documents.get(doc_id), self._metadatas.get(doc_id)
@@ -0,0 +1,180 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from src.core.config import settings
+from src.core.metrics import record_cache
+from src.db.redis import redis_client
+from src.db.vector import vector_store
+from src.llm.cache import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+class RetrievalCache:
+    """
+    Cache of retrieval results in front of the vector store.
+
+    Entries are keyed by the normalized query, the `where` filter and
+    `n_results`, and tagged with the knowledge base version: a Redis
+    counter bumped after every vector store write (through the store's
+    listener hook) and at the end of every ingestion run. Each lookup
+    reads the version together with the shared Redis entry in one round
+    trip and only accepts entries of the current version, so results
+    computed before a write are never served after it. The in-process
+    LRU tier saves decoding the shared entry.
+
+    A write in this process clears the LRU at once and bypasses the
+    cache until the bump has reached Redis.
+    """
+
+    PREFIX = "rag:cache"
+    VERSION_KEY = "rag:kb:version"
+    OUTCOMES = {"lru_hits": "lru_hit", "redis_hits": "redis_hit", "misses": "miss"}
+
+    def __init__(
+        self,
+        lru_size: int = settings.RETRIEVAL_CACHE_LRU_SIZE,
+        ttl: int = settings.CACHE_TTL,
+        enabled: bool = settings.RETRIEVAL_CACHE_ENABLED
+    ):
+        self.lru_size = lru_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.stats = {"lru_hits": 0, "redis_hits": 0, "misses": 0}
+
+        self._lru: "OrderedDict[str, Tuple[int, List[str]]]" = OrderedDict()
+        # Listeners are called from the threads running vector store writes
+        self._lock = threading.Lock()
+        self._pending_bumps = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def redis(self):
+        return redis_client.redis
+
+    def key(self, query: str, n_results: int, where: Optional[dict]) -> str:
+        raw = json.dumps([normalize_prompt(query), n_results, where], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _record(self, outcome: str) -> None:
+        self.stats[outcome] += 1
+        record_cache("retrieval", self.OUTCOMES[outcome])
+
+    async def get(
+        self,
+        query: str,
+        n_results: int,
+        where: Optional[dict],
+        search: Callable[[], Awaitable[List[str]]]
+    ) -> List[str]:
+        """Documents for the query, from the cache or from `search()`"""
+        if not self.enabled:
+            return await search()
+        self._loop = asyncio.get_running_loop()
+
+        key = self.key(query, n_results, where)
+        with self._lock:
+            pending = self._pending_bumps
+            local = self._lru.get(key)
+        if pending:
+            return await search()
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(self.VERSION_KEY)
+                pipe.get(f"{self.PREFIX}:{key}")
+                version, shared = await pipe.execute()
+            version = int(version or 0)
+        except Exception as e:
+            logger.warning(f"Retrieval cache lookup failed: {str(e)}")
+            return await search()
+
+        if local is not None and local[0] == version:
+            with self._lock:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+            self._record("lru_hits")
+            return list(local[1])
+
+        if shared is not None:
+            entry = json.loads(shared)
+            if entry["version"] == version:
+                self._put(key, version, entry["documents"])
+                self._record("redis_hits")
+                return list(entry["documents"])
+
+        self._record("misses")
+        documents = await search()
+        self._put(key, version, documents)
+        try:
+            await self.redis.set(
+                f"{self.PREFIX}:{key}",
+                json.dumps({"version": version, "documents": documents}, ensure_ascii=False),
+                ex=self.ttl
+            )
+        except Exception as e:
+            logger.warning(f"Retrieval cache store failed: {str(e)}")
+        return documents
+
+    def _put(self, key: str, version: int, documents: List[str]) -> None:
+        with self._lock:
+            if self._pending_bumps:
+                return  # computed before a write this process just made
+            self._lru[key] = (version, list(documents))
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    async def bump(self) -> int:
+        """Start a new knowledge base version; every cached result becomes stale"""
+        self._loop = asyncio.get_running_loop()
+        with self._lock:
+            self._lru.clear()
+        return await self.redis.incr(self.VERSION_KEY)
+
+    async def version(self) -> int:
+        """Current knowledge base version, shared by all workers"""
+        return int(await self.redis.get(self.VERSION_KEY) or 0)
+
+    # Vector store listener
+
+    def on_upsert(self, ids, documents, metadatas) -> None:
+        self._invalidate()
+
+    def on_delete(self, ids) -> None:
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            loop = self._loop
+            if loop is None or loop.is_closed():
+                return  # nothing was cached in this process; ingestion bumps when it ends, failed or not
+            self._pending_bumps += 1
+        asyncio.run_coroutine_threadsafe(self._publish_bump(), loop)
+
+    async def _publish_bump(self) -> None:
+        try:
+            await self.redis.incr(self.VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Bumping the knowledge base version failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending_bumps -= 1
+
+    async def get_stats(self) -> Dict:
+        """Hit/miss counters of this process and the current knowledge base version"""
+        lookups = sum(self.stats.values())
+        hits = self.stats["lru_hits"] + self.stats["redis_hits"]
+        return {
+            "local": dict(self.stats),
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "version": await self.version()
+        }
+
+# Create retrieval cache instance, invalidated by every vector store write
+retrieval_cache = RetrievalCache()
+vector_store.add_listener(retrieval_cache)
@@ -0,0 +1,295 @@
+from typing import List, Dict, Optional, Set, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
+import hashlib
+import logging
+import threading
+import numpy as np
+from src.core.config import settings
+from src.core.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+class HashingEmbedder:
+    """
+    Deterministic feature-hashing embedder with no model download.
+
+    Used when ``EMBEDDING_MODEL=hash`` for benchmarks and offline runs;
+    texts sharing tokens get similar vectors, which is enough to exercise
+    retrieval and caching end to end. Mirrors the `encode` signature of
+    SentenceTransformer.
+    """
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        # Imported here: src.rag.bm25 pulls in src.db, which imports this module
+        from src.rag.bm25 import tokenize
+
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "big")
+                vectors[row, value % self.dimensions] += 1.0 if value >> 63 else -1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+        return vectors
+
+class EmbeddingService:
+    """
+    Shared embedding service for retrieval, caching and ingestion.
+
+    Embeddings are cached by content hash in an in-process LRU and in
+    Redis, so each unique text is embedded once. Concurrent
+    `embed_query` calls are collected for up to `batch_window_ms` (or
+    until `max_batch_size` texts are waiting) and encoded in a single
+    model call on a dedicated worker thread.
+    """
+
+    REDIS_PREFIX = "emb"
+
+    def __init__(
+        self,
+        model_name: str = settings.EMBEDDING_MODEL,
+        lru_size: int = settings.EMBEDDING_LRU_SIZE,
+        cache_ttl: int = settings.EMBEDDING_CACHE_TTL,
+        batch_window_ms: float = settings.EMBEDDING_BATCH_WINDOW_MS,
+        max_batch_size: int = settings.EMBEDDING_MAX_BATCH_SIZE,
+        workers: int = settings.EMBEDDING_WORKERS
+    ):
+        self.model_name = model_name
+        self.lru_size = lru_size
+        self.cache_ttl = cache_ttl
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.stats = {"lru_hits": 0, "redis_hits": 0, "computed": 0, "batches": 0}
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lru_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding")
+        self._model_tag = hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:8]
+
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks
+        self._flush_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def redis(self):
+        # Imported lazily: the vector store depends on this module
+        from src.db.redis import redis_client
+        return redis_client.redis
+
+    @property
+    def model(self):
+        """Load the sentence-transformers model on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None and self.model_name == "hash":
+                    self._model = HashingEmbedder()
+                elif self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def key(self, text: str) -> str:
+        """Content-hash cache key"""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        self.stats["batches"] += 1
+        self.stats["computed"] += len(texts)
+        record_cache("embedding", "miss", len(texts))
+        return self.model.encode(
+            texts,
+            batch_size=self.max_batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+
+    # In-process LRU
+
+    def _lru_get(self, key: str) -> Optional[np.ndarray]:
+        with self._lru_lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.stats["lru_hits"] += 1
+                record_cache("embedding", "lru_hit")
+            return vector
+
+    def _lru_put(self, key: str, vector: np.ndarray) -> None:
+        with self._lru_lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    # Redis tier
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.REDIS_PREFIX}:{self._model_tag}:{key}"
+
+    async def _redis_get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        try:
+            values = await self.redis.mget([self._redis_key(key) for key in keys])
+        except Exception as e:
+            logger.warning(f"Embedding cache read failed: {str(e)}")
+            return [None] * len(keys)
+
+        vectors = []
+        for value in values:
+            if value is None:
+                vectors.append(None)
+            else:
+                self.stats["redis_hits"] += 1
+                record_cache("embedding", "redis_hit")
+                vectors.append(np.frombuffer(base64.b64decode(value), dtype=np.float32))
+        return vectors
+
+    async def _redis_put_many(self, items: Dict[str, np.ndarray]) -> None:
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, vector in items.items():
+                encoded = base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")
+                pipe.set(self._redis_key(key), encoded, ex=self.cache_ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
+
+    # Public API
+
+    async def embed_query(self, text: str) -> List[float]:
+        """Embed one query, batched together with concurrent callers"""
+        key = self.key(text)
+        vector = self._lru_get(key)
+        if vector is not None:
+            return vector.tolist()
+
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._inflight[key] = future
+            self._pending.append((key, text, future))
+
+            if len(self._pending) >= self.max_batch_size:
+                self._schedule_flush(loop, 0)
+            elif self._flush_handle is None:
+                self._schedule_flush(loop, self.batch_window)
+
+        vector = await asyncio.shield(future)
+        return vector.tolist()
+
+    def _schedule_flush(self, loop: asyncio.AbstractEventLoop, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        task = asyncio.ensure_future(self._flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self) -> None:
+        self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            vectors = await self._resolve([key for key, _, _ in batch], [text for _, text, _ in batch])
+            for (key, _, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for key, _, _ in batch:
+                self._inflight.pop(key, None)
+
+    async def _resolve(self, keys: List[str], texts: List[str], use_lru: bool = True) -> List[np.ndarray]:
+        """Fill vectors from Redis, then embed whatever is still missing"""
+        vectors = await self._redis_get_many(keys)
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            loop = asyncio.get_running_loop()
+            computed = await loop.run_in_executor(
+                self._executor, self._encode, [texts[i] for i in missing]
+            )
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+            await self._redis_put_many({keys[i]: vectors[i] for i in missing})
+
+        if use_lru:
+            for key, vector in zip(keys, vectors):
+                self._lru_put(key, vector)
+        return vectors
+
+    async def embed_documents(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Embed many texts at once, e.g. during ingestion.
+
+        Duplicate texts are embedded once; results bypass the in-process
+        LRU so bulk loads do not evict hot query embeddings.
+        """
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        unique: Dict[str, str] = {}
+        for text in texts:
+            unique.setdefault(self.key(text), text)
+
+        keys = list(unique.keys())
+        resolved: Dict[str, np.ndarray] = {}
+        for start in range(0, len(keys), batch_size):
+            chunk = keys[start:start + batch_size]
+            vectors = await self._resolve(chunk, [unique[key] for key in chunk], use_lru=False)
+            resolved.update(zip(chunk, vectors))
+
+        return [resolved[self.key(text)].tolist() for text in texts]
+
+    def embed_sync(self, texts: List[str]) -> List[List[float]]:
+        """Blocking embed for synchronous callers such as the Chroma client"""
+        keys = [self.key(text) for text in texts]
+        vectors = [self._lru_get(key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self._encode([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+                self._lru_put(keys[i], vector)
+
+        return [vector.tolist() for vector in vectors]
+
+    async def warmup(self) -> None:
+        """Load the model ahead of the first request"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._encode, ["warmup"])
+
+    def close(self):
+        """Shut down the worker pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class ChromaEmbeddingFunction:
+    """Adapter that lets Chroma embed through the shared embedding service"""
+
+    def __init__(self, service: EmbeddingService):
+        self.service = service
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.service.embed_sync(list(input))
+
+# Create embedding service instance
+embedding_service = EmbeddingService()
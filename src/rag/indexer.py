@@ -0,0 +1,322 @@
+"""
+Streaming knowledge base ingestion.
+
+Documents are read lazily from text/markdown files or JSONL, split into
+overlapping chunks and identified by the hash of their content. A
+checkpoint file remembers which chunks every source produced, so a
+re-run skips unchanged sources, embeds only new chunks and deletes the
+chunks a changed source no longer has, as well as those of sources
+that disappeared from the ingested paths. Progress is checkpointed after
+every flushed batch, so an interrupted run resumes where it stopped.
+"""
+from typing import Iterator, List, Dict, Optional, Iterable
+from pathlib import Path
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from src.core.config import settings
+from src.db.vector import vector_store, VectorStore
+from src.rag.embeddings import embedding_service, EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown"}
+JSONL_EXTENSIONS = {".jsonl", ".ndjson"}
+
+_BREAKS = ("\n\n", "\n", "。", "！", "？", ". ", "! ", "? ", "；", "; ", "，", ", ", " ")
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def _under(source: str, paths: Iterable[str]) -> bool:
+    """Whether a source (a file, or ``file#record``) was read from one of `paths`"""
+    file = Path(source.split("#", 1)[0]).resolve()
+    for path in paths:
+        path = Path(path).resolve()
+        if file == path or path in file.parents:
+            return True
+    return False
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Dict]:
+    """Lazily yield documents as {"source", "text", "metadata"}"""
+    for path in paths:
+        path = Path(path)
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            suffix = file.suffix.lower()
+            if suffix in TEXT_EXTENSIONS:
+                text = file.read_text(encoding="utf-8")
+                yield {
+                    "source": str(file),
+                    "text": text,
+                    "metadata": {"source": str(file), "title": file.stem}
+                }
+            elif suffix in JSONL_EXTENSIONS:
+                yield from _iter_jsonl(file)
+
+def _iter_jsonl(file: Path) -> Iterator[Dict]:
+    with file.open(encoding="utf-8") as handle:
+        for line_no, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed line {line_no} in {file}")
+                continue
+
+            text = record.get("text") or record.get("content")
+            if not text:
+                continue
+
+            source = f"{file}#{record.get('id', line_no)}"
+            metadata = {
+                key: value for key, value in record.items()
+                if key not in ("text", "content") and isinstance(value, (str, int, float, bool))
+            }
+            metadata["source"] = source
+            yield {"source": source, "text": text, "metadata": metadata}
+
+def chunk_text(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """Split text into chunks of about `chunk_size` characters with `overlap`"""
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+
+    overlap = min(overlap, chunk_size // 2)
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            # Prefer to cut at a paragraph, sentence or word boundary
+            window = text[start + chunk_size // 2:end]
+            for separator in _BREAKS:
+                cut = window.rfind(separator)
+                if cut != -1:
+                    end = start + chunk_size // 2 + cut + len(separator)
+                    break
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+class IngestionCheckpoint:
+    """Per-source chunk ids of the last successful run, stored as JSON"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.sources: Dict[str, Dict] = {}
+        if path.exists():
+            self.sources = json.loads(path.read_text(encoding="utf-8")).get("sources", {})
+
+    def get(self, source: str) -> Optional[Dict]:
+        return self.sources.get(source)
+
+    def update(self, source: str, fingerprint: str, chunk_ids: List[str]) -> None:
+        self.sources[source] = {"fingerprint": fingerprint, "chunks": chunk_ids}
+
+    def remove(self, source: str) -> List[str]:
+        """Forget a source; returns the chunk ids it had"""
+        return self.sources.pop(source)["chunks"]
+
+    def referenced_ids(self) -> set:
+        return {chunk_id for entry in self.sources.values() for chunk_id in entry["chunks"]}
+
+    def save(self) -> None:
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"sources": self.sources}), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+class KnowledgeIndexer:
+    """Incremental, batched ingestion into the vector store"""
+
+    def __init__(
+        self,
+        store: VectorStore = vector_store,
+        embeddings: EmbeddingService = embedding_service,
+        chunk_size: int = settings.INGEST_CHUNK_SIZE,
+        chunk_overlap: int = settings.INGEST_CHUNK_OVERLAP,
+        embed_batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+        embed_concurrency: int = settings.INGEST_EMBED_CONCURRENCY,
+        upsert_batch_size: int = settings.INGEST_UPSERT_BATCH_SIZE
+    ):
+        self.store = store
+        self.embeddings = embeddings
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.upsert_batch_size = upsert_batch_size
+
+    async def ingest(
+        self,
+        paths: List[str],
+        checkpoint_path: Path,
+        progress: Optional[Dict] = None
+    ) -> Dict:
+        """Ingest every document under `paths`; returns the progress counters"""
+        progress = progress if progress is not None else {}
+        progress.update({
+            "sources_seen": 0,
+            "sources_skipped": 0,
+            "chunks_seen": 0,
+            "chunks_duplicate": 0,
+            "chunks_unchanged": 0,
+            "chunks_embedded": 0,
+            "chunks_deleted": 0,
+            "sources_removed": 0
+        })
+        checkpoint = IngestionCheckpoint(checkpoint_path)
+
+        buffer: Dict[str, Dict] = {}  # chunk id -> chunk
+        pending_sources: Dict[str, Dict] = {}
+        stale_ids: Dict[str, List[str]] = {}
+        seen_sources = set()
+
+        documents = iter_documents(paths)
+        while True:
+            # File reads happen off the event loop
+            document = await asyncio.to_thread(next, documents, None)
+            if document is None:
+                break
+            progress["sources_seen"] += 1
+            source = document["source"]
+            seen_sources.add(source)
+            fingerprint = content_hash(document["text"])
+
+            previous = checkpoint.get(source)
+            if previous and previous["fingerprint"] == fingerprint:
+                progress["sources_skipped"] += 1
+                continue
+
+            chunk_ids = []
+            for index, chunk in enumerate(chunk_text(document["text"], self.chunk_size, self.chunk_overlap)):
+                progress["chunks_seen"] += 1
+                chunk_id = content_hash(chunk)
+                if chunk_id in chunk_ids:
+                    progress["chunks_duplicate"] += 1
+                    continue
+                chunk_ids.append(chunk_id)
+                if chunk_id in buffer:
+                    # Shared with another source in this batch
+                    progress["chunks_duplicate"] += 1
+                    continue
+                buffer[chunk_id] = {
+                    "text": chunk,
+                    "metadata": dict(document["metadata"], chunk_index=index)
+                }
+
+            pending_sources[source] = {"fingerprint": fingerprint, "chunks": chunk_ids}
+            if previous:
+                removed = set(previous["chunks"]) - set(chunk_ids)
+                if removed:
+                    stale_ids[source] = list(removed)
+
+            if len(buffer) >= self.upsert_batch_size:
+                await self._flush(buffer, pending_sources, stale_ids, checkpoint, progress)
+                buffer, pending_sources, stale_ids = {}, {}, {}
+
+        await self._flush(buffer, pending_sources, stale_ids, checkpoint, progress)
+        await self._prune(paths, seen_sources, checkpoint, progress)
+        return progress
+
+    async def _prune(
+        self,
+        paths: List[str],
+        seen_sources: set,
+        checkpoint: IngestionCheckpoint,
+        progress: Dict
+    ) -> None:
+        """Delete the chunks of checkpointed sources under `paths` that the walk no longer found"""
+        # Sources ingested from other paths share the checkpoint; leave them alone
+        removed = [
+            source for source in checkpoint.sources
+            if source not in seen_sources and _under(source, paths)
+        ]
+        if not removed:
+            return
+
+        candidates = {chunk_id for source in removed for chunk_id in checkpoint.remove(source)}
+        removable = list(candidates - checkpoint.referenced_ids())
+        if removable:
+            await asyncio.to_thread(self.store.delete_documents, removable)
+            progress["chunks_deleted"] += len(removable)
+        progress["sources_removed"] += len(removed)
+
+        checkpoint.save()
+        progress["updated_at"] = datetime.now(timezone.utc)
+
+    async def _flush(
+        self,
+        buffer: Dict[str, Dict],
+        pending_sources: Dict[str, Dict],
+        stale_ids: Dict[str, List[str]],
+        checkpoint: IngestionCheckpoint,
+        progress: Dict
+    ) -> None:
+        if not pending_sources:
+            return
+
+        ids = list(buffer.keys())
+        existing = await asyncio.to_thread(self.store.existing_ids, ids) if ids else set()
+        progress["chunks_unchanged"] += len(existing)
+        new_ids = [chunk_id for chunk_id in ids if chunk_id not in existing]
+
+        # Embed in large batches, several in flight on the embedding workers
+        semaphore = asyncio.Semaphore(self.embed_concurrency)
+
+        async def embed(batch_ids: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self.embeddings.embed_documents(
+                    [buffer[chunk_id]["text"] for chunk_id in batch_ids]
+                )
+
+        batches = [
+            new_ids[start:start + self.embed_batch_size]
+            for start in range(0, len(new_ids), self.embed_batch_size)
+        ]
+        embedded = await asyncio.gather(*(embed(batch) for batch in batches))
+
+        vectors = [vector for batch in embedded for vector in batch]
+        for start in range(0, len(new_ids), self.upsert_batch_size):
+            batch_ids = new_ids[start:start + self.upsert_batch_size]
+            await asyncio.to_thread(
+                self.store.upsert_documents,
+                documents=[buffer[chunk_id]["text"] for chunk_id in batch_ids],
+                metadatas=[buffer[chunk_id]["metadata"] for chunk_id in batch_ids],
+                ids=batch_ids,
+                embeddings=vectors[start:start + self.upsert_batch_size]
+            )
+            # Counted per batch: a later failure must not hide the chunks already written
+            progress["chunks_embedded"] += len(batch_ids)
+
+        for source, entry in pending_sources.items():
+            checkpoint.update(source, entry["fingerprint"], entry["chunks"])
+
+        # Only delete chunks that no other source still references
+        if stale_ids:
+            referenced = checkpoint.referenced_ids()
+            removable = [
+                chunk_id for removed in stale_ids.values() for chunk_id in removed
+                if chunk_id not in referenced
+            ]
+            if removable:
+                await asyncio.to_thread(self.store.delete_documents, removable)
+                progress["chunks_deleted"] += len(removable)
+
+        checkpoint.save()
+        progress["updated_at"] = datetime.now(timezone.utc)
+
+# Create indexer instance
+knowledge_indexer = KnowledgeIndexer()
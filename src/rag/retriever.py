@@ -0,0 +1,295 @@
+from typing import Optional, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import time
+from src.core.config import settings
+from src.core.metrics import stage
+from src.db.vector import vector_store, VectorStore
+from src.rag.embeddings import embedding_service, EmbeddingService
+from src.rag.bm25 import BM25Index
+from src.rag.cache import retrieval_cache
+
+logger = logging.getLogger(__name__)
+
+class AsyncRetriever:
+    """
+    Async front end for the vector store.
+
+    The query is embedded through the shared embedding service (cached and
+    batched with concurrent requests); the synchronous Chroma ANN search
+    then runs on a dedicated thread pool instead of the event loop.
+    At most `max_pending` searches may be queued or running at once;
+    callers beyond that wait for a slot. One timeout covers the whole
+    search, embedding and the wait for a slot included, and cancelling
+    the awaiting task drops the search if it has not started.
+    """
+
+    def __init__(
+        self,
+        store: VectorStore = vector_store,
+        embeddings: EmbeddingService = embedding_service,
+        max_workers: int = settings.RETRIEVAL_MAX_WORKERS,
+        max_pending: int = settings.RETRIEVAL_MAX_PENDING,
+        timeout: float = settings.RETRIEVAL_TIMEOUT
+    ):
+        self.store = store
+        self.embeddings = embeddings
+        self.timeout = timeout
+        self.max_pending = max(max_pending, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="retriever"
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return self._slots
+
+    async def search(
+        self,
+        query: str,
+        n_results: int = 3,
+        where: Optional[dict] = None,
+        timeout: Optional[float] = None
+    ) -> Dict:
+        """Search similar documents without blocking the event loop"""
+        with stage("vector_search"):
+            return await self._search(query, n_results, where, timeout if timeout is not None else self.timeout)
+
+    async def _search(self, query: str, n_results: int, where: Optional[dict], timeout: float) -> Dict:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        def remaining() -> float:
+            return max(deadline - loop.time(), 0)
+
+        query_embedding = await asyncio.wait_for(self.embeddings.embed_query(query), remaining())
+
+        slots = self._get_slots()
+        await asyncio.wait_for(slots.acquire(), remaining())
+
+        def release(_):
+            # The slot is held until the worker thread is really done
+            try:
+                loop.call_soon_threadsafe(slots.release)
+            except RuntimeError:
+                pass  # loop already closed
+
+        try:
+            future = self._executor.submit(
+                self.store.search, query, n_results, where, query_embedding
+            )
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), remaining())
+        except asyncio.TimeoutError:
+            future.cancel()
+            logger.warning(f"Vector search timed out for query: {query[:50]}")
+            raise
+
+    async def get_relevant_documents(
+        self,
+        query: str,
+        n_results: int = 3,
+        where: Optional[dict] = None
+    ) -> List[str]:
+        """Return only the matched document texts"""
+        results = await self.search(query, n_results=n_results, where=where)
+        documents = results.get("documents") or [[]]
+        return [doc for doc in documents[0] if doc]
+
+    def close(self):
+        """Shut down the worker pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class HybridRetriever:
+    """
+    Hybrid keyword + vector retrieval.
+
+    The vector search and a BM25 search over an in-memory inverted index
+    run concurrently, each within its own latency budget; a stage that
+    misses its budget is dropped rather than delaying the response. The
+    two rankings are merged with reciprocal-rank fusion and, if
+    `RERANK_MODEL` is configured, the top candidates are re-scored by a
+    local cross-encoder under the rerank budget.
+
+    Writes of other workers reach the keyword index through the
+    knowledge base version of the retrieval cache: at most every
+    `keyword_refresh_seconds` a search checks it and, when it moved,
+    the index is rebuilt in the background.
+    """
+
+    def __init__(
+        self,
+        vector: Optional[AsyncRetriever] = None,
+        index: Optional[BM25Index] = None,
+        candidates: int = settings.RETRIEVAL_CANDIDATES,
+        rrf_k: int = settings.RETRIEVAL_RRF_K,
+        vector_budget_ms: float = settings.RETRIEVAL_VECTOR_BUDGET_MS,
+        keyword_budget_ms: float = settings.RETRIEVAL_KEYWORD_BUDGET_MS,
+        rerank_budget_ms: float = settings.RETRIEVAL_RERANK_BUDGET_MS,
+        rerank_model: str = settings.RERANK_MODEL,
+        keyword_refresh_seconds: float = settings.RETRIEVAL_KEYWORD_REFRESH_SECONDS
+    ):
+        self.vector = vector or AsyncRetriever()
+        self.index = index or BM25Index()
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.vector_budget = vector_budget_ms / 1000
+        self.keyword_budget = keyword_budget_ms / 1000
+        self.rerank_budget = rerank_budget_ms / 1000
+        self.rerank_model = rerank_model
+        self._reranker = None
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid")
+        self.keyword_refresh = keyword_refresh_seconds
+        self._loading: Optional[asyncio.Future] = None
+        # Knowledge base version the keyword index was built at
+        self.index_version: Optional[int] = None
+        self._next_version_check = 0.0
+
+        # Keep the keyword index in sync with every vector store write
+        self.vector.store.add_listener(self.index)
+
+    async def ensure_index(self) -> Optional[asyncio.Future]:
+        """Start (re)building the keyword index if it is missing or out of date"""
+        if self._loading is not None:
+            return self._loading
+        now = time.monotonic()
+        if self.index.loaded and now < self._next_version_check:
+            return None
+        self._next_version_check = now + self.keyword_refresh
+
+        try:
+            version = await retrieval_cache.version()
+        except Exception as e:
+            logger.warning(f"Reading the knowledge base version failed: {str(e)}")
+            version = None
+        if self._loading is not None:
+            return self._loading
+        if self.index.loaded and (version is None or version == self.index_version):
+            return None
+
+        # Read before the build starts: a write during it moves the version again
+        loop = asyncio.get_running_loop()
+        self._loading = loop.run_in_executor(self._executor, self.index.load, self.vector.store)
+        self._loading.add_done_callback(lambda future: self._on_loaded(future, version))
+        return self._loading
+
+    def _on_loaded(self, future: asyncio.Future, version: Optional[int]) -> None:
+        self._loading = None
+        if future.cancelled() or future.exception() is not None:
+            logger.error("Building keyword index failed; will retry on next search")
+            return
+        self.index_version = version
+
+    async def _vector_stage(self, query: str, n_results: int, where: Optional[dict]) -> List[Dict]:
+        results = await self.vector.search(query, n_results=n_results, where=where, timeout=self.vector_budget)
+        ids = (results.get("ids") or [[]])[0]
+        documents = (results.get("documents") or [[]])[0]
+        metadatas = (results.get("metadatas") or [[]])[0] or [None] * len(ids)
+        return [
+            {"id": doc_id, "document": document, "metadata": metadata}
+            for doc_id, document, metadata in zip(ids, documents, metadatas)
+        ]
+
+    async def _keyword_stage(self, query: str, n_results: int, where: Optional[dict]) -> List[Dict]:
+        # A rebuild runs in the background; the current index serves meanwhile
+        await self.ensure_index()
+        if not self.index.loaded:
+            # Not ready yet: fall back to vector-only results meanwhile
+            return []
+
+        loop = asyncio.get_running_loop()
+        # The deadline also stops the scan itself, which wait_for alone would leave running
+        deadline = time.monotonic() + self.keyword_budget
+        with stage("keyword_search"):
+            hits = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, self.index.search, query, n_results, where, deadline),
+                self.keyword_budget
+            )
+        candidates = []
+        for doc_id, _ in hits:
+            document, metadata = self.index.get(doc_id)
+            candidates.append({"id": doc_id, "document": document, "metadata": metadata})
+        return candidates
+
+    def _fuse(self, rankings: List[List[Dict]]) -> List[Dict]:
+        """Reciprocal-rank fusion of several ranked candidate lists"""
+        fused: Dict[str, Dict] = {}
+        for ranking in rankings:
+            for rank, candidate in enumerate(ranking):
+                entry = fused.setdefault(candidate["id"], dict(candidate, score=0.0))
+                entry["score"] += 1.0 / (self.rrf_k + rank + 1)
+        return sorted(fused.values(), key=lambda candidate: candidate["score"], reverse=True)
+
+    def _get_reranker(self):
+        if self._reranker is None:
+            from sentence_transformers import CrossEncoder
+            self._reranker = CrossEncoder(self.rerank_model, device="cpu")
+        return self._reranker
+
+    def _rerank_sync(self, query: str, candidates: List[Dict]) -> List[Dict]:
+        scores = self._get_reranker().predict([(query, candidate["document"]) for candidate in candidates])
+        reranked = [dict(candidate, score=float(score)) for candidate, score in zip(candidates, scores)]
+        return sorted(reranked, key=lambda candidate: candidate["score"], reverse=True)
+
+    async def retrieve(self, query: str, n_results: int = 3, where: Optional[dict] = None) -> List[Dict]:
+        """Return the top candidates as {"id", "document", "metadata", "score"}"""
+        stages = await asyncio.gather(
+            self._vector_stage(query, self.candidates, where),
+            self._keyword_stage(query, self.candidates, where),
+            return_exceptions=True
+        )
+
+        rankings = []
+        for name, result in zip(("vector", "keyword"), stages):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning(f"{name} retrieval exceeded its latency budget")
+            elif isinstance(result, BaseException):
+                logger.warning(f"{name} retrieval failed: {str(result)}")
+            else:
+                rankings.append(result)
+        if not rankings:
+            raise RuntimeError("All retrieval stages failed")
+
+        candidates = [candidate for candidate in self._fuse(rankings) if candidate["document"]]
+
+        if self.rerank_model and len(candidates) > 1:
+            loop = asyncio.get_running_loop()
+            try:
+                with stage("rerank"):
+                    candidates = await asyncio.wait_for(
+                        loop.run_in_executor(self._executor, self._rerank_sync, query, candidates),
+                        self.rerank_budget
+                    )
+            except asyncio.TimeoutError:
+                logger.warning("Rerank exceeded its latency budget; using fused order")
+            except Exception as e:
+                logger.warning(f"Rerank failed: {str(e)}")
+
+        return candidates[:n_results]
+
+    async def get_relevant_documents(
+        self,
+        query: str,
+        n_results: int = 3,
+        where: Optional[dict] = None
+    ) -> List[str]:
+        """Return only the matched document texts"""
+        return [candidate["document"] for candidate in await self.retrieve(query, n_results, where)]
+
+    def close(self):
+        """Shut down the worker pools"""
+        self.vector.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Create retriever instance
+retriever = HybridRetriever() if settings.HYBRID_RETRIEVAL_ENABLED else AsyncRetriever()
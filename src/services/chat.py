@@ -1,16 +1,67 @@
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, AsyncIterator
+from contextlib import aclosing, asynccontextmanager, AsyncExitStack
 from datetime import datetime, timezone
-from src.llm.engine import llm_engine
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+import zlib
+import orjson
+from src.llm.engine import llm_engine, LLMOverloadedError
+from src.llm.router import chat_router, ROUTE_CANNED
 from src.llm.prompts.templates import prompt_templates
-from src.db.mongodb import chat_collection
-from src.db.vector import vector_store
+from src.core.config import settings
+from src.core.metrics import stage, record_stage
+from src.db.conversations import conversation_store
+from src.db.redis.history import history_cache
+from src.db.redis.locks import LeaseLock, LockTimeout
+from src.services.idempotency import IdempotentCalls
+from src.rag.retriever import retriever
+from src.rag.cache import retrieval_cache
+from src.memory import conversation_memory, rolling_summarizer
 import uuid
 
+logger = logging.getLogger(__name__)
+
+class ConversationNotFound(Exception):
+    """Raised when a conversation does not exist"""
+    def __init__(self, conversation_id: str):
+        super().__init__(f"Conversation not found: {conversation_id}")
+        self.conversation_id = conversation_id
+
+class ConversationBusy(Exception):
+    """Raised when a turn waited too long for the previous turn of its conversation"""
+    def __init__(self, conversation_id: str, retry_after: float):
+        super().__init__(f"Conversation is busy: {conversation_id}")
+        self.conversation_id = conversation_id
+        self.retry_after = retry_after
+
+class TurnFailed(Exception):
+    """Raised when a turn failed; its apology `response` is already in the transcript"""
+    def __init__(self, conversation_id: str, response: str):
+        super().__init__(f"Turn failed: {conversation_id}")
+        self.conversation_id = conversation_id
+        self.response = response
+
 class ChatService:
     def __init__(self):
         self.llm = llm_engine
+        self.router = chat_router
         self.templates = prompt_templates
-        self.max_context_messages = 10
+        self.memory = conversation_memory
+        self.summarizer = rolling_summarizer
+        self.store = conversation_store
+        self.history = history_cache
+        self.retrieval_cache = retrieval_cache
+        self.max_context_messages = settings.MEMORY_MAX_MESSAGES
+        self._background_tasks = set()
+        # Turns of one conversation run one at a time, across workers
+        self.turn_lock = LeaseLock("chat:turn")
+        self.idempotent = IdempotentCalls()
+        # Background writes of the turn holding each conversation's lock
+        self._turn_writes: Dict[str, List[asyncio.Task]] = {}
 
     def get_current_time(self) -> datetime:
         """Get current UTC time with timezone information"""
@@ -25,7 +76,6 @@ class ChatService:
             conversation = {
                 "conversation_id": conversation_id,
                 "user_id": user_id,
-                "messages": [],
                 "created_at": current_time,
                 "updated_at": current_time,
                 "status": "active",
@@ -36,170 +86,580 @@ class ChatService:
                 }
             }
             
-            # Insert the document
-            await chat_collection.insert_one(conversation)
-            
-            # Return the conversation without the _id field
-            conversation.pop('_id', None)
+            await self.store.create(conversation)
             return conversation
             
         except Exception as e:
             raise Exception(f"Error creating conversation: {str(e)}")
 
+    def _new_message(self, role: str, content: str) -> Dict:
+        """Build a message document"""
+        return {
+            "message_id": str(uuid.uuid4()),
+            "role": role,
+            "content": content,
+            "timestamp": self.get_current_time()
+        }
+
     async def add_message(self, conversation_id: str, role: str, content: str) -> Dict:
         """Add a message to the conversation"""
         try:
-            current_time = self.get_current_time()
-            
-            message = {
-                "message_id": str(uuid.uuid4()),
-                "role": role,
-                "content": content,
-                "timestamp": current_time
-            }
-            
-            # Prepare update data
-            update_data = {
-                "$push": {"messages": message},
-                "$set": {
-                    "updated_at": current_time,
-                },
-                "$inc": {"metadata.total_messages": 1}
-            }
-            
-            # Update last message time based on role
-            if role == "user":
-                update_data["$set"]["metadata.last_user_message_time"] = current_time
-            elif role == "assistant":
-                update_data["$set"]["metadata.last_assistant_message_time"] = current_time
-            
-            # Perform the update
-            result = await chat_collection.find_one_and_update(
-                {"conversation_id": conversation_id},
-                update_data,
-                return_document=True
-            )
-            
-            if not result:
-                raise Exception(f"Conversation not found: {conversation_id}")
-            
+            message = self._new_message(role, content)
+            await self._write_message(conversation_id, message)
             return message
             
         except Exception as e:
             raise Exception(f"Error adding message: {str(e)}")
 
-    async def get_conversation_history(self, conversation_id: str, limit: int = 50) -> List[Dict]:
-        """Get conversation history"""
+    async def _write_message(
+        self,
+        conversation_id: str,
+        message: Dict,
+        tail: int = 0,
+        fields: Tuple[str, ...] = ()
+    ) -> Tuple[List[Dict], Dict]:
+        """
+        Store a message in the conversation store.
+
+        Returns the latest `tail` messages and the conversation document
+        projected to `fields`. Earlier messages come from the history
+        cache, read while the message is stored; the cache then gets the
+        message too.
+        """
+        conversation = {}
+        if "seq" not in message:
+            allocated = await self.store.allocate_seq(
+                conversation_id, message["role"], message["timestamp"], fields=fields
+            )
+            if allocated is None:
+                raise ConversationNotFound(conversation_id)
+            message["seq"], conversation = allocated
+        
+        seq = message["seq"]
+        earlier, _ = await asyncio.gather(
+            self.history.recent(
+                conversation_id,
+                tail - 1,
+                lambda count: self.store.read(conversation_id, count, before=seq),
+                upto=seq - 1
+            ),
+            self.store.append(conversation_id, message)
+        )
+        await self.history.append(conversation_id, message)
+        
+        history = (earlier + [message])[-tail:] if tail else []
+        return history, conversation
+
+    async def append_message_and_get_history(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        limit: int = 10,
+        fields: Tuple[str, ...] = ()
+    ) -> Tuple[Dict, List[Dict], Dict]:
+        """Add a message and return it, the last `limit` messages and conversation `fields`"""
         try:
-            conversation = await chat_collection.find_one(
-                {"conversation_id": conversation_id}
+            message = self._new_message(role, content)
+            history, conversation = await self._write_message(
+                conversation_id, message, tail=limit, fields=fields
             )
+            return message, history, conversation
             
-            if not conversation:
-                raise Exception(f"Conversation not found: {conversation_id}")
+        except Exception as e:
+            raise Exception(f"Error adding message: {str(e)}")
+
+    def add_message_in_background(self, conversation_id: str, role: str, content: str) -> Dict:
+        """Add a message without waiting for the write to be acknowledged.
+
+        The write is retried with exponential backoff up to
+        ``MONGO_WRITE_RETRIES`` times; the message document is returned
+        immediately so callers can reference its ``message_id``.
+        """
+        message = self._new_message(role, content)
+        task = self._run_in_background(self._write_message_with_retry(conversation_id, message))
+        if conversation_id in self._turn_writes:
+            self._turn_writes[conversation_id].append(task)
+        return message
+
+    async def _write_message_with_retry(self, conversation_id: str, message: Dict) -> None:
+        """Write a message, retrying transient failures"""
+        with stage("final_write"):
+            attempts = max(1, settings.MONGO_WRITE_RETRIES)
+            for attempt in range(1, attempts + 1):
+                try:
+                    await self._write_message(conversation_id, message)
+                    return
+                except ConversationNotFound:
+                    logger.error(f"Dropping message for missing conversation: {conversation_id}")
+                    return
+                except Exception as e:
+                    if attempt == attempts:
+                        logger.error(
+                            f"Failed to persist message {message['message_id']} "
+                            f"after {attempts} attempts: {str(e)}"
+                        )
+                        return
+                    logger.warning(f"Retrying message write ({attempt}/{attempts}): {str(e)}")
+                    await asyncio.sleep(settings.MONGO_WRITE_RETRY_DELAY * 2 ** (attempt - 1))
+
+    async def get_conversation_history(
+        self,
+        conversation_id: str,
+        limit: int = 50,
+        before: Optional[int] = None
+    ) -> List[Dict]:
+        """Get conversation history, optionally only messages with seq < `before`"""
+        page = await self.get_conversation_page(conversation_id, limit=limit, before=before)
+        return page["messages"]
+
+    async def get_conversation_page(
+        self,
+        conversation_id: str,
+        limit: int = 50,
+        before: Optional[int] = None
+    ) -> Dict:
+        """Get one page of conversation history plus the cursor for the previous page"""
+        try:
+            if before is None:
+                messages = await self.history.recent(
+                    conversation_id,
+                    limit,
+                    lambda count: self.store.read(conversation_id, count)
+                )
+            else:
+                messages = await self.store.read(conversation_id, limit, before=before)
+            
+            if not messages:
+                if not await self.store.exists(conversation_id):
+                    # Moved to cold storage by the archival job
+                    archived = await self.store.load_archived(conversation_id)
+                    if archived is None:
+                        raise ConversationNotFound(conversation_id)
+                    messages = [
+                        msg for msg in archived["messages"]
+                        if before is None or msg["seq"] < before
+                    ][-limit:]
             
-            messages = conversation.get("messages", [])
-            return messages[-limit:] if messages else []
+            next_cursor = None
+            if messages and messages[0]["seq"] > 0:
+                next_cursor = messages[0]["seq"]
+            
+            return {"messages": messages, "next_cursor": next_cursor}
             
         except Exception as e:
             raise Exception(f"Error getting conversation history: {str(e)}")
 
+    async def _prepare_messages(
+        self,
+        conversation_id: str,
+        user_message: str,
+        use_knowledge_base: bool = True
+    ) -> Tuple[List[Dict], str, Optional[str]]:
+        """Store the user message and build the LLM input (messages, system prompt, context) for this turn"""
+        # Knowledge base search runs concurrently with the history round trip
+        retrieval = None
+        if use_knowledge_base:
+            retrieval = asyncio.create_task(self._retrieve_context(user_message))
+        
+        try:
+            # Add user message and fetch recent history and the rolling summary
+            message, history, conversation = await self.append_message_and_get_history(
+                conversation_id,
+                "user",
+                user_message,
+                limit=self.max_context_messages,
+                fields=("summary",)
+            )
+        except BaseException:
+            if retrieval:
+                retrieval.cancel()
+            raise
+        
+        # The system prompt stays fixed; knowledge base context is a chain variable
+        system_prompt = self.templates.CUSTOMER_SERVICE_PROMPT
+        context = await retrieval if retrieval else None
+        
+        with stage("prompt_build"):
+            budgeted = system_prompt
+            if context:
+                budgeted = f"{system_prompt}\n\n{self.templates.get_knowledge_context(context)}"
+            messages, summary = self._build_prompt(conversation, history, budgeted)
+        
+        # Compress turns leaving the recent window, off the request path
+        self.summarizer.schedule(conversation_id, summary, message["seq"])
+        return messages, system_prompt, context
+
+    def _build_prompt(
+        self,
+        conversation: Dict,
+        history: List[Dict],
+        system_prompt: str
+    ) -> Tuple[List[Dict], Optional[Dict]]:
+        """Fit history and the rolling summary into the token budget"""
+        # Messages covered by the summary are replaced by it
+        summary = conversation.get("summary")
+        summary_text = None
+        if summary:
+            summary_text = summary["text"]
+            history = [msg for msg in history if msg["seq"] > summary["upto_seq"]]
+        
+        # Convert history to message format and fit it into the token budget
+        messages = [{"role": msg["role"], "content": msg["content"]} for msg in history]
+        messages, _ = self.memory.pack(messages, system_prompt, summary_text)
+        if summary_text:
+            messages.insert(0, {
+                "role": "system",
+                "content": self.templates.get_conversation_summary_message(summary_text)
+            })
+        return messages, summary
+
+    async def _retrieve_context(self, query: str) -> Optional[str]:
+        """Fetch knowledge base context; failures only drop the context"""
+        try:
+            relevant_docs = await self.retrieval_cache.get(
+                query, 3, None,
+                lambda: retriever.get_relevant_documents(query, n_results=3)
+            )
+            if relevant_docs:
+                return "\n".join(relevant_docs)
+        except asyncio.TimeoutError:
+            logger.warning("Knowledge base search timed out")
+        except Exception as e:
+            logger.warning(f"Knowledge base search failed: {str(e)}")
+        return None
+
+    async def _route(self, conversation_id: str, user_message: str) -> Tuple[Dict, Optional[str]]:
+        """
+        Classify the turn; returns the decision and, for canned turns, the reply.
+
+        Canned turns only store the user message: no retrieval, prompt or
+        model call.
+        """
+        with stage("route"):
+            decision = await self.router.route(user_message)
+        
+        if decision["route"] != ROUTE_CANNED:
+            return decision, None
+        await self._write_message(conversation_id, self._new_message("user", user_message))
+        return decision, self.router.canned_response(decision)
+
+    async def send_message(
+        self,
+        conversation_id: str,
+        user_message: str,
+        idempotency_key: Optional[str] = None,
+        use_knowledge_base: bool = True
+    ) -> Dict:
+        """
+        Answer a user message exactly once per idempotency key.
+
+        Duplicates attach to the in-flight turn or get its stored result;
+        a failed turn is not remembered, so retrying it runs it again.
+        Without a key, only identical content sent while the first copy is
+        still being answered by this worker counts as a double submit; the
+        same text sent afterwards ("好", "yes") is a turn of its own.
+        """
+        if idempotency_key:
+            key, ttl = f"{conversation_id}:key:{idempotency_key}", settings.IDEMPOTENCY_TTL
+        else:
+            digest = hashlib.sha256(user_message.encode("utf-8")).hexdigest()
+            key, ttl = f"{conversation_id}:content:{digest}", None
+        
+        try:
+            return await self.idempotent.run(
+                key,
+                lambda: self._answer(conversation_id, user_message, use_knowledge_base),
+                ttl
+            )
+        except TurnFailed as e:
+            # Answered outside the idempotent call, so an apology is never replayed
+            return {"response": e.response}
+
+    @asynccontextmanager
+    async def _turn(self, conversation_id: str):
+        """
+        Hold the conversation's turn lock.
+
+        The reply is written in the background after the caller got it;
+        the lock is only released once that write landed, so the next
+        turn reads a complete transcript and gets the next sequence number.
+        """
+        lock = AsyncExitStack()
+        try:
+            await lock.enter_async_context(self.turn_lock.hold(conversation_id))
+        except LockTimeout as e:
+            raise ConversationBusy(conversation_id, e.retry_after)
+        
+        writes = self._turn_writes[conversation_id] = []
+        try:
+            yield
+        finally:
+            self._turn_writes.pop(conversation_id, None)
+            if writes:
+                async def release():
+                    await asyncio.gather(*writes, return_exceptions=True)
+                    await lock.aclose()
+                self._run_in_background(release())
+            else:
+                await lock.aclose()
+
     async def generate_response(
         self,
         conversation_id: str,
         user_message: str,
         use_knowledge_base: bool = True
     ) -> Dict:
-        """Generate response to user message"""
+        """Generate response to user message, after earlier turns of the conversation"""
         try:
-            # Add user message first
-            await self.add_message(conversation_id, "user", user_message)
+            return await self._answer(conversation_id, user_message, use_knowledge_base)
+        except TurnFailed as e:
+            return {"response": e.response}
+
+    async def _answer(
+        self,
+        conversation_id: str,
+        user_message: str,
+        use_knowledge_base: bool
+    ) -> Dict:
+        """Run the turn under the conversation's lock; raises TurnFailed"""
+        async with self._turn(conversation_id):
+            return await self._generate_turn(conversation_id, user_message, use_knowledge_base)
+
+    async def _generate_turn(
+        self,
+        conversation_id: str,
+        user_message: str,
+        use_knowledge_base: bool
+    ) -> Dict:
+        try:
+            decision, response = await self._route(conversation_id, user_message)
             
-            # Get recent conversation history
-            history = await self.get_conversation_history(
-                conversation_id, 
-                limit=self.max_context_messages
-            )
+            if response is None:
+                messages, system_prompt, context = await self._prepare_messages(
+                    conversation_id, user_message, use_knowledge_base
+                )
+                
+                # Generate response with the model picked by the router
+                with stage("llm_total"):
+                    response = await self.llm.generate_response(
+                        messages=messages,
+                        system_prompt=system_prompt,
+                        context=context,
+                        model=self.router.model_for(decision)
+                    )
             
-            # Initialize system prompt
-            system_prompt = self.templates.CUSTOMER_SERVICE_PROMPT
+            # Add assistant response
+            self.add_message_in_background(conversation_id, "assistant", response)
             
-            # Add knowledge base context if enabled
-            if use_knowledge_base:
-                try:
-                    search_results = vector_store.search(user_message)
-                    relevant_docs = search_results.get("documents", [])
-                    if relevant_docs:
-                        context = "\n".join(relevant_docs)
-                        system_prompt = self.templates.get_knowledge_base_prompt(context)
-                except Exception as e:
-                    print(f"Knowledge base search failed: {str(e)}")
+            return {"response": response}
             
-            # Convert history to message format
-            messages = [{"role": msg["role"], "content": msg["content"]} for msg in history]
+        except LLMOverloadedError:
+            # Shed requests are answered with 503, not an apology message
+            raise
+        except Exception as e:
+            error_msg = self.templates.get_error_response(str(e))
+            self.add_message_in_background(conversation_id, "assistant", error_msg)
+            raise TurnFailed(conversation_id, error_msg) from e
+
+    async def stream_response(
+        self,
+        conversation_id: str,
+        user_message: str,
+        use_knowledge_base: bool = True
+    ) -> AsyncIterator[Dict]:
+        """Stream response tokens to the caller.
+
+        Yields ``token`` events as the model produces them, followed by a
+        single ``done`` (or ``error``) event. The assistant message is only
+        written once the stream completes, fails or is cancelled. The
+        conversation's turn lock is held for the whole stream.
+        """
+        async with self._turn(conversation_id):
+            # Closed before the lock is released, so a partial reply is
+            # queued as a turn write and the model stream ends right away
+            async with aclosing(self._stream_turn(conversation_id, user_message, use_knowledge_base)) as events:
+                async for event in events:
+                    yield event
+
+    async def _stream_turn(
+        self,
+        conversation_id: str,
+        user_message: str,
+        use_knowledge_base: bool
+    ) -> AsyncIterator[Dict]:
+        started_at = time.perf_counter()
+        ttft_ms = None
+        chunks = []
+        finished = False
+        
+        try:
+            decision, canned = await self._route(conversation_id, user_message)
             
-            # Generate response
-            response = await self.llm.generate_response(
-                messages=messages,
-                system_prompt=system_prompt
-            )
+            if canned is None:
+                messages, system_prompt, context = await self._prepare_messages(
+                    conversation_id, user_message, use_knowledge_base
+                )
+                tokens = self.llm.stream_response(
+                    messages=messages,
+                    system_prompt=system_prompt,
+                    context=context,
+                    model=self.router.model_for(decision)
+                )
+            else:
+                tokens = self._single_token(canned)
             
-            # Add assistant response
-            await self.add_message(conversation_id, "assistant", response)
+            llm_started_at = time.perf_counter()
+            # Closing the token stream frees its gateway slot when the client goes away
+            async with aclosing(tokens):
+                async for token in tokens:
+                    if ttft_ms is None:
+                        if canned is None:
+                            record_stage("llm_ttft", time.perf_counter() - llm_started_at)
+                        ttft_ms = (time.perf_counter() - started_at) * 1000
+                        logger.info(
+                            f"conversation={conversation_id} time_to_first_token_ms={ttft_ms:.1f}"
+                        )
+                    chunks.append(token)
+                    yield {"type": "token", "content": token}
             
-            return {"response": response}
+            if canned is None:
+                record_stage("llm_total", time.perf_counter() - llm_started_at)
+            
+            response = "".join(chunks).strip()
+            message = self.add_message_in_background(conversation_id, "assistant", response)
+            finished = True
             
+            total_ms = (time.perf_counter() - started_at) * 1000
+            logger.info(
+                f"conversation={conversation_id} stream_total_ms={total_ms:.1f}"
+            )
+            yield {
+                "type": "done",
+                "message_id": message["message_id"],
+                "response": response,
+                "time_to_first_token_ms": ttft_ms,
+                "total_ms": total_ms
+            }
+            
+        except LLMOverloadedError:
+            raise
         except Exception as e:
             error_msg = self.templates.get_error_response(str(e))
-            await self.add_message(conversation_id, "assistant", error_msg)
-            return {"response": error_msg}
+            self.add_message_in_background(conversation_id, "assistant", error_msg)
+            finished = True
+            yield {"type": "error", "response": error_msg}
+            
+        finally:
+            if not finished and chunks:
+                # Client went away mid-stream: keep whatever was generated.
+                # The write runs as its own task because the current one is
+                # being cancelled.
+                self.add_message_in_background(
+                    conversation_id, "assistant", "".join(chunks).strip()
+                )
+
+    async def _single_token(self, text: str) -> AsyncIterator[str]:
+        yield text
+
+    def _run_in_background(self, coro) -> asyncio.Task:
+        """Schedule a coroutine that must outlive the current request"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
 
     async def end_conversation(self, conversation_id: str) -> Dict:
         """End/Archive a conversation"""
         try:
             current_time = self.get_current_time()
             
-            result = await chat_collection.find_one_and_update(
-                {"conversation_id": conversation_id},
-                {
-                    "$set": {
-                        "status": "archived",
-                        "archived_at": current_time,
-                        "updated_at": current_time
-                    }
-                },
-                return_document=True
-            )
-            
-            if not result:
+            if not await self.store.end(conversation_id, current_time):
                 raise Exception(f"Conversation not found: {conversation_id}")
-                
+            
+            await self.history.invalidate(conversation_id)
             return {"message": "Conversation archived successfully"}
             
         except Exception as e:
             raise Exception(f"Error ending conversation: {str(e)}")
 
-    async def get_active_conversations(self, user_id: str) -> List[Dict]:
-        """Get all active conversations for a user"""
+    async def get_active_conversations(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> List[Dict]:
+        """Get active conversations for a user, most recently updated first"""
+        page = await self.get_active_conversation_page(user_id, limit=limit, cursor=cursor)
+        return page["conversations"]
+
+    async def get_active_conversation_page(
+        self,
+        user_id: str,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Dict:
+        """
+        Get one page of active conversations plus the cursor for the next one.
+
+        Keyset pagination on (updated_at, conversation_id).
+        """
+        after = self._decode_cursor(cursor) if cursor else None
+        
         try:
-            cursor = chat_collection.find(
-                {
-                    "user_id": user_id,
-                    "status": "active"
-                }
-            )
-            conversations = await cursor.to_list(length=None)
-            return [
+            documents = await self.store.list_active(user_id, limit, after)
+            
+            conversations = [
                 {
                     "conversation_id": conv["conversation_id"],
                     "created_at": conv["created_at"],
                     "updated_at": conv["updated_at"],
                     "total_messages": conv["metadata"]["total_messages"]
                 }
-                for conv in conversations
+                for conv in documents
             ]
+            
+            next_cursor = None
+            if len(conversations) == limit:
+                last = conversations[-1]
+                next_cursor = self._encode_cursor(last["updated_at"], last["conversation_id"])
+            
+            return {"conversations": conversations, "next_cursor": next_cursor}
         except Exception as e:
             raise Exception(f"Error getting active conversations: {str(e)}")
 
+    async def export_conversations(
+        self,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        batch_size: int = settings.EXPORT_BATCH_SIZE
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream matching conversations as gzip-compressed NDJSON.
+
+        One line per conversation with all its messages. The store is
+        read `batch_size` conversations at a time and each batch is
+        compressed as soon as it arrives, so memory stays constant
+        however many conversations match.
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # gzip container
+        async for batch in self.store.export(batch_size, user_id=user_id, status=status, since=since, until=until):
+            lines = b"".join(
+                orjson.dumps(conversation, default=str, option=orjson.OPT_APPEND_NEWLINE)
+                for conversation in batch
+            )
+            chunk = compressor.compress(lines)
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
+    def _encode_cursor(self, updated_at: datetime, conversation_id: str) -> str:
+        raw = json.dumps([updated_at.isoformat(), conversation_id])
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    def _decode_cursor(self, cursor: str) -> Tuple[datetime, str]:
+        try:
+            updated_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return datetime.fromisoformat(updated_at), conversation_id
+        except Exception:
+            raise ValueError(f"Invalid cursor: {cursor}")
+
 # Create chat service instance
 chat_service = ChatService()
\ No newline at end of file
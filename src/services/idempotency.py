@@ -0,0 +1,107 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+import logging
+import time
+from src.core.config import settings
+from src.core.metrics import DUPLICATE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class RequestInProgress(Exception):
+    """Raised when a duplicate waited too long for the original request"""
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"Request still in progress: {key}")
+        self.key = key
+        self.retry_after = retry_after
+
+class IdempotentCalls:
+    """
+    Run a call once per key and hand its result to every duplicate.
+
+    A duplicate in the same process awaits the original's future. Across
+    workers the key is claimed in Redis with a pending marker; other
+    workers poll until the result is stored (kept for `ttl` seconds) and
+    return it. A failed call releases the key so a retry runs again, and
+    the pending marker expires if its worker dies. Without a `ttl` nothing
+    is remembered: only duplicates arriving while the call is still
+    running in this process share its result.
+    """
+
+    PREFIX = "idem"
+    PENDING = "__pending__"
+
+    def __init__(self, wait: float = settings.CONVERSATION_LOCK_WAIT, pending_ttl: float = settings.IDEMPOTENCY_PENDING_TTL):
+        self.wait = wait
+        self.pending_ttl = pending_ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def redis(self):
+        from src.db.redis import redis_client
+        return redis_client.redis
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Result of `factory()` for `key`, computed at most once while it is remembered"""
+        future = self._inflight.get(key)
+        if future is not None:
+            DUPLICATE_REQUESTS.labels("attached").inc()
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on a failed future; don't warn about it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await (self._run_shared(key, factory, ttl) if ttl else factory())
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_shared(self, key: str, factory: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        redis_key = f"{self.PREFIX}:{key}"
+        deadline = time.monotonic() + self.wait
+        delay = 0.05
+
+        while True:
+            try:
+                claimed = await self.redis.set(redis_key, self.PENDING, nx=True, ex=int(self.pending_ttl))
+                stored = None if claimed else await self.redis.get(redis_key)
+            except Exception as e:
+                logger.warning(f"Idempotency store unavailable, running {key} anyway: {str(e)}")
+                return await factory()
+
+            if claimed:
+                break
+            if stored is not None and stored != self.PENDING:
+                DUPLICATE_REQUESTS.labels("replayed").inc()
+                return json.loads(stored)
+
+            # Another worker is running it (or just released a failed claim)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RequestInProgress(key, self.pending_ttl)
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+        try:
+            result = await factory()
+        except BaseException:
+            try:
+                await self.redis.delete(redis_key)
+            except Exception:
+                pass  # the pending marker expires on its own
+            raise
+
+        try:
+            await self.redis.set(redis_key, json.dumps(result, ensure_ascii=False, default=str), ex=int(ttl))
+        except Exception as e:
+            logger.warning(f"Storing result of {key} failed: {str(e)}")
+        return result
@@ -0,0 +1,98 @@
+from typing import List, Dict, Optional
+from datetime import datetime, timezone
+from pathlib import Path
+import asyncio
+import logging
+import uuid
+from src.core.config import settings
+from src.rag.indexer import knowledge_indexer
+from src.llm.cache import response_cache
+from src.rag.cache import retrieval_cache
+
+logger = logging.getLogger(__name__)
+
+class KnowledgeService:
+    def __init__(self):
+        self.indexer = knowledge_indexer
+        self.data_dir = Path(settings.KNOWLEDGE_DATA_DIR).resolve()
+        self.checkpoint_dir = Path(settings.INGEST_CHECKPOINT_DIR)
+        self.jobs: Dict[str, Dict] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def get_current_time(self) -> datetime:
+        """Get current UTC time with timezone information"""
+        return datetime.now(timezone.utc)
+
+    def _resolve_paths(self, paths: List[str]) -> List[str]:
+        """Resolve paths relative to the data directory, refusing anything outside it"""
+        resolved = []
+        for path in paths:
+            full_path = (self.data_dir / path).resolve()
+            if full_path != self.data_dir and self.data_dir not in full_path.parents:
+                raise ValueError(f"Path outside knowledge data directory: {path}")
+            if not full_path.exists():
+                raise ValueError(f"Path not found: {path}")
+            resolved.append(str(full_path))
+        return resolved
+
+    def start_ingestion(self, paths: List[str], name: str = "default") -> Dict:
+        """Start an ingestion job in the background"""
+        if any(job["name"] == name and job["status"] == "running" for job in self.jobs.values()):
+            raise ValueError(f"Ingestion '{name}' is already running")
+
+        resolved = self._resolve_paths(paths or ["."])
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "name": name,
+            "paths": paths,
+            "status": "running",
+            "started_at": self.get_current_time(),
+            "finished_at": None,
+            "error": None,
+            "progress": {}
+        }
+        self.jobs[job_id] = job
+
+        task = asyncio.create_task(self._run(job, resolved))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job
+
+    async def _run(self, job: Dict, paths: List[str]) -> None:
+        progress = job["progress"]
+        try:
+            await self.indexer.ingest(
+                paths,
+                self.checkpoint_dir / f"{job['name']}.json",
+                progress=progress
+            )
+            job["status"] = "completed"
+        except Exception as e:
+            logger.error(f"Ingestion {job['job_id']} failed: {str(e)}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            # A failed run may have written chunks before failing too
+            if progress.get("chunks_embedded") or progress.get("chunks_deleted"):
+                await self._invalidate_caches()
+            job["finished_at"] = self.get_current_time()
+
+    async def _invalidate_caches(self) -> None:
+        """Make every worker drop answers and retrieval results computed before this run"""
+        for name, invalidate in (("response", response_cache.invalidate), ("retrieval", retrieval_cache.bump)):
+            try:
+                await invalidate()
+            except Exception as e:
+                logger.error(f"Invalidating the {name} cache failed: {str(e)}")
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get an ingestion job with its progress"""
+        return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        """List ingestion jobs of this worker, newest first"""
+        return sorted(self.jobs.values(), key=lambda job: job["started_at"], reverse=True)
+
+# Create knowledge service instance
+knowledge_service = KnowledgeService()
@@ -0,0 +1,29 @@
+"""
+The suite runs against the in-process stand-ins (fake LLM, in-memory
+Mongo/Redis/PostgreSQL, hashing embeddings) unless the environment
+points elsewhere. Settings are read at import, so this runs first.
+"""
+import os
+import pytest
+from benchmarks.load_test import OFFLINE_DEFAULTS
+
+for key, value in OFFLINE_DEFAULTS.items():
+    os.environ.setdefault(key, value)
+
+@pytest.fixture
+def redis(monkeypatch):
+    """A fresh in-memory Redis behind `redis_client`"""
+    from fakeredis import FakeServer
+    from fakeredis.aioredis import FakeRedis
+    from src.db.redis import redis_client
+
+    fake = FakeRedis(server=FakeServer(), decode_responses=True)
+    monkeypatch.setattr(redis_client, "_redis", fake)
+    monkeypatch.setattr(redis_client, "_pid", os.getpid())
+    return fake
+
+@pytest.fixture
+def mongo():
+    """A fresh in-memory MongoDB database"""
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()["test"]
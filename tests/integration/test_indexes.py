@@ -0,0 +1,24 @@
+import asyncio
+import pytest
+from src.core.config import settings
+from src.db.mongodb import MongoClientManager
+from src.db.mongodb.indexes import check_query_plans, ensure_indexes, verify_indexes
+
+# mongomock has no query planner; these checks need a real server
+pytestmark = pytest.mark.skipif(
+    settings.MONGO_URI.startswith("memory://"),
+    reason="needs a real MongoDB (set MONGO_URI)"
+)
+
+def test_hot_queries_use_their_indexes():
+    async def run():
+        manager = MongoClientManager(settings.MONGO_URI, f"{settings.MONGO_DB_NAME}_test")
+        try:
+            await ensure_indexes(manager.db)
+            assert await verify_indexes(manager.db) == {}
+            assert await check_query_plans(manager.db) == []
+        finally:
+            await manager.client.drop_database(manager.db_name)
+            manager.close()
+
+    asyncio.run(run())
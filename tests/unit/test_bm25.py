@@ -0,0 +1,76 @@
+import asyncio
+import time
+import pytest
+from src.rag.bm25 import BM25Index, tokenize
+from src.rag.cache import retrieval_cache
+from src.rag.retriever import AsyncRetriever, HybridRetriever
+
+def _index(documents, metadatas=None, **kwargs):
+    index = BM25Index(**kwargs)
+    index.on_upsert([f"doc-{i}" for i in range(len(documents))], documents, metadatas)
+    return index
+
+def test_cjk_runs_are_indexed_as_bigrams():
+    assert tokenize("退貨運費") == ["退貨", "貨運", "運費"]
+    assert tokenize("好") == ["好"]
+    assert tokenize("SKU-1234 退貨") == ["sku-1234", "sku", "1234", "退貨"]
+
+def test_where_filters_before_ranking():
+    index = _index(
+        ["退貨流程說明退貨", "退貨需要發票", "退貨政策"],
+        [{"lang": "zh"}, {"lang": "en"}, {"lang": "zh"}]
+    )
+    hits = index.search("退貨", n_results=5, where={"lang": "zh"})
+    assert {doc_id for doc_id, _ in hits} == {"doc-0", "doc-2"}
+
+def test_common_terms_are_skipped_when_rarer_ones_match():
+    documents = [f"客服回覆第{i}號" for i in range(9)] + ["客服退款"]
+    hits = _index(documents).search("客服退款")
+    # "客服" is in every document; only the "退款" match is ranked
+    assert [doc_id for doc_id, _ in hits] == ["doc-9"]
+
+def test_common_terms_still_match_alone():
+    hits = _index(["客服中心", "客服電話"]).search("客服")
+    assert len(hits) == 2
+
+def test_search_past_its_deadline_raises():
+    index = _index([f"訂單查詢 {i}" for i in range(BM25Index.CHECK_EVERY * 2)], max_df=1.0)
+    with pytest.raises(TimeoutError):
+        index.search("訂單", deadline=time.monotonic() - 1)
+
+class SharedStore:
+    """A vector store that other workers write to behind this process's back"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def add_listener(self, listener):
+        pass
+
+    def iter_documents(self):
+        ids = list(self.documents)
+        yield ids, [self.documents[doc_id] for doc_id in ids], [None] * len(ids)
+
+def test_keyword_index_follows_the_knowledge_base_version(redis):
+    store = SharedStore()
+    store.documents["d1"] = "退貨流程"
+    retriever = HybridRetriever(vector=AsyncRetriever(store=store), index=BM25Index(), keyword_refresh_seconds=0)
+
+    async def run():
+        await (await retriever.ensure_index())
+        before = await retriever._keyword_stage("付款方式", 5, None)
+
+        # Another worker ingests and bumps the version
+        store.documents["d2"] = "付款方式說明"
+        await retrieval_cache.bump()
+        await (await retriever.ensure_index())
+        after = await retriever._keyword_stage("付款方式", 5, None)
+        return before, after, await retriever.ensure_index()
+
+    try:
+        before, after, reloading = asyncio.run(run())
+    finally:
+        retriever.close()
+    assert before == []
+    assert [candidate["id"] for candidate in after] == ["d2"]
+    assert reloading is None
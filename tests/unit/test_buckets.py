@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+from src.db.mongodb.buckets import MessageBucketStore
+from src.db.mongodb.indexes import ensure_indexes
+
+def _message(seq, role="user"):
+    return {"message_id": f"m-{seq}", "role": role, "content": f"訊息 {seq}", "timestamp": datetime(2024, 1, 1, 0, 0, seq), "seq": seq}
+
+async def _store(mongo, bucket_size=3):
+    await ensure_indexes(mongo)
+    await mongo.chats.insert_one({"conversation_id": "c1", "metadata": {"total_messages": 0}})
+    return MessageBucketStore(mongo.chats, mongo.chat_messages, bucket_size=bucket_size)
+
+def test_messages_fill_fixed_size_buckets(mongo):
+    async def run():
+        store = await _store(mongo)
+        for seq in range(7):
+            allocated, _ = await store.allocate_seq("c1", "user", datetime(2024, 1, 1))
+            assert allocated == seq
+            await store.append("c1", _message(seq))
+
+        buckets = await mongo.chat_messages.find({}, {"_id": 0, "bucket": 1, "count": 1}).sort("bucket", 1).to_list(None)
+        assert buckets == [{"bucket": 0, "count": 3}, {"bucket": 1, "count": 3}, {"bucket": 2, "count": 1}]
+        conversation = await mongo.chats.find_one({"conversation_id": "c1"})
+        assert conversation["metadata"]["total_messages"] == 7
+
+    asyncio.run(run())
+
+def test_reads_span_buckets_in_order(mongo):
+    async def run():
+        store = await _store(mongo)
+        for seq in range(8):
+            await store.append("c1", _message(seq))
+
+        assert [msg["seq"] for msg in await store.read("c1", 5)] == [3, 4, 5, 6, 7]
+        assert [msg["seq"] for msg in await store.read("c1", 4, before=6)] == [2, 3, 4, 5]
+        assert await store.read("c1", 4, before=0) == []
+
+    asyncio.run(run())
+
+def test_append_returns_tail_across_buckets(mongo):
+    async def run():
+        store = await _store(mongo)
+        for seq in range(3):
+            await store.append("c1", _message(seq))
+        tail = await store.append("c1", _message(3), tail=3)
+        assert [msg["seq"] for msg in tail] == [1, 2, 3]
+
+    asyncio.run(run())
+
+def test_reappending_is_a_no_op(mongo):
+    async def run():
+        store = await _store(mongo)
+        await store.append("c1", _message(0))
+        await store.append("c1", _message(0))
+        bucket = await mongo.chat_messages.find_one({"conversation_id": "c1"})
+        assert bucket["count"] == 1
+        assert [msg["seq"] for msg in bucket["messages"]] == [0]
+
+    asyncio.run(run())
+
+def test_out_of_order_writes_stay_sorted(mongo):
+    async def run():
+        store = await _store(mongo)
+        await asyncio.gather(*(store.append("c1", _message(seq)) for seq in (2, 0, 1)))
+        assert [msg["seq"] for msg in await store.read("c1", 3)] == [0, 1, 2]
+
+    asyncio.run(run())
+
+def test_missing_conversation_gets_no_seq(mongo):
+    async def run():
+        store = await _store(mongo)
+        assert await store.allocate_seq("missing", "user", datetime(2024, 1, 1)) is None
+
+    asyncio.run(run())
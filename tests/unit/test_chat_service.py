@@ -0,0 +1,114 @@
+import asyncio
+from src.services.chat import ChatService
+
+class ScriptedLLM:
+    """Stands in for the LLM engine: fails the first `failures` calls, then answers"""
+
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_response(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise RuntimeError("upstream down")
+        return f"回覆 {self.calls}"
+
+class EndlessStream(ScriptedLLM):
+    """Streams tokens until it is closed"""
+
+    closed = False
+
+    async def stream_response(self, **kwargs):
+        try:
+            while True:
+                yield "部分"
+                await asyncio.sleep(0)
+        finally:
+            self.closed = True
+
+async def _service(llm):
+    service = ChatService()
+    service.llm = llm
+    conversation = await service.create_conversation("u1")
+    return service, conversation["conversation_id"]
+
+async def _drain(service):
+    while service._background_tasks:
+        await asyncio.gather(*list(service._background_tasks))
+
+def test_failed_turn_is_not_replayed_for_its_key(redis):
+    async def run():
+        service, conversation_id = await _service(ScriptedLLM(failures=1))
+
+        failed = await service.send_message(conversation_id, "我要退貨", idempotency_key="k1", use_knowledge_base=False)
+        assert "upstream down" in failed["response"]
+        assert await redis.get(f"idem:{conversation_id}:key:k1") is None
+
+        retried = await service.send_message(conversation_id, "我要退貨", idempotency_key="k1", use_knowledge_base=False)
+        replayed = await service.send_message(conversation_id, "我要退貨", idempotency_key="k1", use_knowledge_base=False)
+        assert retried == replayed == {"response": "回覆 2"}
+        assert service.llm.calls == 2
+        await _drain(service)
+
+    asyncio.run(run())
+
+def test_repeated_text_without_a_key_is_a_new_turn(redis):
+    async def run():
+        service, conversation_id = await _service(ScriptedLLM())
+
+        first = await service.send_message(conversation_id, "好", use_knowledge_base=False)
+        second = await service.send_message(conversation_id, "好", use_knowledge_base=False)
+        assert (first["response"], second["response"]) == ("回覆 1", "回覆 2")
+        await _drain(service)
+
+        history = await service.get_conversation_history(conversation_id)
+        assert [message["content"] for message in history] == ["好", "回覆 1", "好", "回覆 2"]
+
+    asyncio.run(run())
+
+def test_double_submit_without_a_key_shares_the_running_turn(redis):
+    async def run():
+        service, conversation_id = await _service(ScriptedLLM(delay=0.05))
+
+        results = await asyncio.gather(*(
+            service.send_message(conversation_id, "請問運費", use_knowledge_base=False) for _ in range(2)
+        ))
+        assert results == [{"response": "回覆 1"}] * 2
+        assert service.llm.calls == 1
+        await _drain(service)
+
+    asyncio.run(run())
+
+def test_abandoned_stream_keeps_its_partial_reply_within_the_turn(redis):
+    async def run():
+        llm = EndlessStream()
+        service, conversation_id = await _service(llm)
+
+        queued = []
+        add_message_in_background = service.add_message_in_background
+
+        def record(conversation_id, role, content):
+            queued.append((content, conversation_id in service._turn_writes))
+            return add_message_in_background(conversation_id, role, content)
+
+        service.add_message_in_background = record
+
+        events = service.stream_response(conversation_id, "說明退貨", use_knowledge_base=False)
+        assert (await events.__anext__())["type"] == "token"
+        # The client disconnects
+        await events.aclose()
+        assert llm.closed
+        # Queued while the turn still held the lock, not after it
+        assert queued == [("部分", True)]
+
+        service.llm = ScriptedLLM()
+        reply = await service.send_message(conversation_id, "還在嗎", use_knowledge_base=False)
+        await _drain(service)
+
+        history = await service.get_conversation_history(conversation_id)
+        assert [message["content"] for message in history] == ["說明退貨", "部分", "還在嗎", reply["response"]]
+
+    asyncio.run(run())
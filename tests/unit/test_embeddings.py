@@ -0,0 +1,24 @@
+import asyncio
+import gc
+from src.rag.embeddings import EmbeddingService
+
+def test_concurrent_queries_share_one_referenced_batch(redis):
+    service = EmbeddingService(model_name="hash", batch_window_ms=5, max_batch_size=8)
+
+    async def run():
+        queries = [asyncio.create_task(service.embed_query(f"問題 {i}")) for i in range(3)]
+        while not service._flush_tasks:
+            await asyncio.sleep(0.001)
+        # Only the service refers to the flush; it must survive a collection
+        gc.collect()
+        vectors = await asyncio.wait_for(asyncio.gather(*queries), 5)
+        await asyncio.sleep(0)
+        return vectors, service._flush_tasks
+
+    try:
+        vectors, flush_tasks = asyncio.run(run())
+    finally:
+        service.close()
+    assert len(vectors) == 3 and all(vectors)
+    assert service.stats["batches"] == 1
+    assert not flush_tasks
@@ -0,0 +1,24 @@
+import asyncio
+from langchain_core.messages import HumanMessage, SystemMessage
+from src.llm.models.fake import FakeChatModel
+
+def _model(**kwargs):
+    return FakeChatModel(first_token_latency=0, tokens_per_second=0, **kwargs)
+
+def test_same_prompt_same_reply():
+    messages = [SystemMessage(content="客服"), HumanMessage(content="我的訂單到哪了")]
+    assert _model().invoke(messages).content == _model().invoke(messages).content
+
+def test_different_prompts_differ():
+    model = _model()
+    assert model.invoke("我的訂單到哪了").content != model.invoke("怎麼退貨").content
+
+def test_stream_matches_invoke():
+    model = _model(response_tokens=12)
+
+    async def stream():
+        return [chunk.content async for chunk in model.astream("運費多少") if chunk.content]
+
+    tokens = asyncio.run(stream())
+    assert len(tokens) == 12
+    assert "".join(tokens) == model.invoke("運費多少").content
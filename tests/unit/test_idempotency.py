@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from src.services.idempotency import IdempotentCalls, RequestInProgress
+
+def test_concurrent_duplicates_share_one_call(redis):
+    async def run():
+        calls = IdempotentCalls(wait=1)
+        started = 0
+
+        async def answer():
+            nonlocal started
+            started += 1
+            await asyncio.sleep(0.05)
+            return {"response": "好的"}
+
+        results = await asyncio.gather(*(calls.run("c1:key:a", answer, 60) for _ in range(3)))
+        assert results == [{"response": "好的"}] * 3
+        assert started == 1
+
+    asyncio.run(run())
+
+def test_stored_result_is_replayed_by_other_workers(redis):
+    async def run():
+        async def answer():
+            return {"response": "好的"}
+
+        await IdempotentCalls(wait=1).run("c1:key:a", answer, 60)
+
+        async def unexpected():
+            raise AssertionError("ran twice")
+
+        assert await IdempotentCalls(wait=1).run("c1:key:a", unexpected, 60) == {"response": "好的"}
+
+    asyncio.run(run())
+
+def test_failed_call_releases_the_key(redis):
+    async def run():
+        calls = IdempotentCalls(wait=1)
+
+        async def fail():
+            raise RuntimeError("upstream down")
+
+        with pytest.raises(RuntimeError):
+            await calls.run("c1:key:a", fail, 60)
+
+        async def answer():
+            return {"response": "好的"}
+
+        assert await calls.run("c1:key:a", answer, 60) == {"response": "好的"}
+
+    asyncio.run(run())
+
+def test_duplicate_gives_up_while_another_worker_runs_it(redis):
+    async def run():
+        await redis.set("idem:c1:key:a", IdempotentCalls.PENDING)
+
+        async def answer():
+            return {"response": "好的"}
+
+        with pytest.raises(RequestInProgress):
+            await IdempotentCalls(wait=0.1).run("c1:key:a", answer, 60)
+
+    asyncio.run(run())
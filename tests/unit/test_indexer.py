@@ -0,0 +1,62 @@
+import asyncio
+from src.rag.indexer import KnowledgeIndexer
+
+class MemoryStore:
+    def __init__(self):
+        self.documents = {}
+
+    def existing_ids(self, ids):
+        return {chunk_id for chunk_id in ids if chunk_id in self.documents}
+
+    def upsert_documents(self, documents, metadatas, ids, embeddings):
+        self.documents.update(zip(ids, documents))
+
+    def delete_documents(self, ids):
+        for chunk_id in ids:
+            self.documents.pop(chunk_id, None)
+
+class ConstantEmbeddings:
+    async def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+def _ingest(indexer, paths, checkpoint):
+    return asyncio.run(indexer.ingest([str(path) for path in paths], checkpoint))
+
+def test_deleted_sources_lose_their_chunks(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "returns.md").write_text("退貨需在七天內申請", encoding="utf-8")
+    (docs / "shipping.md").write_text("滿千免運", encoding="utf-8")
+    (docs / "copy.md").write_text("滿千免運", encoding="utf-8")
+    store = MemoryStore()
+    indexer = KnowledgeIndexer(store=store, embeddings=ConstantEmbeddings())
+    checkpoint = tmp_path / "checkpoint.json"
+
+    _ingest(indexer, [docs], checkpoint)
+    assert sorted(store.documents.values()) == ["滿千免運", "退貨需在七天內申請"]
+
+    (docs / "returns.md").unlink()
+    (docs / "shipping.md").unlink()
+    progress = _ingest(indexer, [docs], checkpoint)
+
+    # The shared chunk is still referenced by copy.md
+    assert list(store.documents.values()) == ["滿千免運"]
+    assert progress["sources_removed"] == 2
+    assert progress["chunks_deleted"] == 1
+
+def test_sources_of_other_paths_are_kept(tmp_path):
+    faq, policies = tmp_path / "faq", tmp_path / "policies"
+    faq.mkdir()
+    policies.mkdir()
+    (faq / "hours.md").write_text("營業時間九點到六點", encoding="utf-8")
+    (policies / "privacy.md").write_text("個資僅用於訂單處理", encoding="utf-8")
+    store = MemoryStore()
+    indexer = KnowledgeIndexer(store=store, embeddings=ConstantEmbeddings())
+    checkpoint = tmp_path / "checkpoint.json"
+
+    _ingest(indexer, [faq], checkpoint)
+    _ingest(indexer, [policies], checkpoint)
+    progress = _ingest(indexer, [policies], checkpoint)
+
+    assert progress["sources_removed"] == 0
+    assert sorted(store.documents.values()) == ["個資僅用於訂單處理", "營業時間九點到六點"]
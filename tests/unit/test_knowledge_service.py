@@ -0,0 +1,34 @@
+import asyncio
+from src.llm.cache import response_cache
+from src.rag.cache import RetrievalCache
+from src.services.knowledge import KnowledgeService
+
+class FailingIndexer:
+    """Writes some chunks, then fails"""
+
+    def __init__(self, embedded: int):
+        self.embedded = embedded
+
+    async def ingest(self, paths, checkpoint_path, progress):
+        progress.update({"chunks_embedded": self.embedded, "chunks_deleted": 0})
+        raise RuntimeError("embedding backend went away")
+
+def _run_failing(embedded: int) -> dict:
+    service = KnowledgeService()
+    service.indexer = FailingIndexer(embedded)
+    job = {"job_id": "j1", "name": "default", "status": "running", "progress": {}}
+    asyncio.run(service._run(job, []))
+    return job
+
+def test_failed_ingestion_that_wrote_chunks_still_bumps_the_version(redis):
+    job = _run_failing(embedded=2)
+    assert job["status"] == "failed"
+    assert asyncio.run(redis.get(RetrievalCache.VERSION_KEY)) == "1"
+
+def test_failed_ingestion_that_wrote_chunks_invalidates_cached_answers(redis):
+    _run_failing(embedded=2)
+    assert asyncio.run(redis.get(f"{response_cache.PREFIX}:default:generation")) == "1"
+
+def test_failed_ingestion_without_writes_keeps_the_version(redis):
+    _run_failing(embedded=0)
+    assert asyncio.run(redis.get(RetrievalCache.VERSION_KEY)) is None
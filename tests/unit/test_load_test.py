@@ -0,0 +1,35 @@
+from benchmarks.load_test import compare, percentiles
+
+def _report(latency, rps=10.0, stages=None):
+    return {
+        "latency_ms": latency,
+        "ttft_ms": {"count": 0},
+        "stages_ms": stages or {},
+        "throughput_rps": rps,
+    }
+
+def test_percentiles_nearest_rank():
+    result = percentiles([float(value) for value in range(1, 101)])
+    assert (result["p50"], result["p95"], result["p99"]) == (50.0, 95.0, 99.0)
+    assert result["count"] == 100
+
+def test_percentiles_of_nothing():
+    assert percentiles([]) == {"count": 0}
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = _report({"p50": 100.0, "p95": 200.0, "p99": 300.0})
+    current = _report({"p50": 105.0, "p95": 260.0, "p99": 300.0})
+    assert compare(current, baseline, tolerance=0.1) == ["latency p95: 200.0ms -> 260.0ms"]
+
+def test_compare_ignores_noise_and_missing_stages():
+    baseline = _report({"p50": 2.0, "p95": 3.0, "p99": 4.0})
+    current = _report(
+        {"p50": 2.5, "p95": 3.5, "p99": 4.5},
+        stages={"rerank": {"p50": 50.0, "p95": 80.0, "p99": 90.0}}
+    )
+    assert compare(current, baseline, tolerance=0.1) == []
+
+def test_compare_flags_throughput_drop():
+    baseline = _report({"count": 0}, rps=20.0)
+    current = _report({"count": 0}, rps=15.0)
+    assert compare(current, baseline, tolerance=0.1) == ["throughput: 20.0 -> 15.0 rps"]
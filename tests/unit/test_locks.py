@@ -0,0 +1,57 @@
+import asyncio
+import pytest
+from src.db.redis.locks import LeaseLock, LockTimeout
+
+class UnavailableLeaseLock(LeaseLock):
+    @property
+    def redis(self):
+        raise ConnectionError("Redis is down")
+
+def test_holders_run_one_at_a_time(redis):
+    async def run():
+        lock = LeaseLock("turn", ttl=5, wait=1)
+        order = []
+
+        async def turn(name):
+            async with lock.hold("c1"):
+                order.append(f"{name}:start")
+                await asyncio.sleep(0.02)
+                order.append(f"{name}:end")
+
+        await asyncio.gather(turn("a"), turn("b"))
+        assert order == ["a:start", "a:end", "b:start", "b:end"]
+        assert await redis.get("turn:c1") is None
+
+    asyncio.run(run())
+
+def test_lease_held_by_another_worker_times_out(redis):
+    async def run():
+        await redis.set("turn:c1", "other-worker", px=5000)
+        with pytest.raises(LockTimeout) as excinfo:
+            async with LeaseLock("turn", ttl=5, wait=0.1).hold("c1"):
+                pass
+        assert excinfo.value.retry_after > 0
+        # Someone else's lease is never released by the loser
+        assert await redis.get("turn:c1") == "other-worker"
+
+    asyncio.run(run())
+
+def test_lost_lease_is_not_released(redis):
+    async def run():
+        lock = LeaseLock("turn", ttl=5, wait=1)
+        async with lock.hold("c1"):
+            # The lease expired and another worker took it meanwhile
+            await redis.set("turn:c1", "other-worker")
+        assert await redis.get("turn:c1") == "other-worker"
+
+    asyncio.run(run())
+
+def test_degrades_to_the_local_lock_without_redis():
+    async def run():
+        lock = UnavailableLeaseLock("turn", ttl=5, wait=0.1)
+        async with lock.hold("c1"):
+            with pytest.raises(LockTimeout):
+                async with lock.hold("c1"):
+                    pass
+
+    asyncio.run(run())
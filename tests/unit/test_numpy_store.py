@@ -0,0 +1,63 @@
+import multiprocessing
+import shutil
+import numpy as np
+from src.db.vector.numpy_store import NumpyCollection
+
+def _vectors(count: int, seed: int):
+    return np.random.default_rng(seed).normal(size=(count, 8)).tolist()
+
+def _upsert(collection: NumpyCollection, prefix: str, count: int, seed: int = 0) -> None:
+    collection.upsert(
+        ids=[f"{prefix}-{i}" for i in range(count)],
+        embeddings=_vectors(count, seed),
+        documents=[f"{prefix} document {i}" for i in range(count)]
+    )
+
+def test_readers_see_writes_of_other_workers(tmp_path):
+    first, second = NumpyCollection(str(tmp_path)), NumpyCollection(str(tmp_path))
+    _upsert(first, "a", 3)
+
+    assert second.count() == 3
+    assert second.get(ids=["a-1"])["documents"] == ["a document 1"]
+    query = second.query(query_embeddings=_vectors(1, 0)[:1], n_results=1)
+    assert query["ids"] == [["a-0"]]
+
+def test_writers_apply_on_top_of_each_other(tmp_path):
+    first, second = NumpyCollection(str(tmp_path)), NumpyCollection(str(tmp_path))
+    _upsert(first, "a", 3, seed=1)
+    # second still holds the empty snapshot it opened with
+    _upsert(second, "b", 2, seed=2)
+    first.delete(ids=["b-0"])
+    _upsert(second, "c", 1, seed=3)
+
+    expected = {"a-0", "a-1", "a-2", "b-1", "c-0"}
+    assert set(first.get()["ids"]) == expected
+    assert set(second.get()["ids"]) == expected
+    assert set(NumpyCollection(str(tmp_path)).get()["ids"]) == expected
+
+def test_opening_never_collects_unpublished_segments(tmp_path):
+    writer = NumpyCollection(str(tmp_path))
+    _upsert(writer, "a", 2)
+    published = next(path for path in tmp_path.iterdir() if path.name.startswith("seg-"))
+    # Stands in for a segment another worker has written but not yet published
+    unpublished = tmp_path / "seg-99999999"
+    shutil.copytree(published, unpublished)
+
+    NumpyCollection(str(tmp_path))
+    assert unpublished.exists()
+
+def _write_batches(path: str, prefix: str) -> None:
+    collection = NumpyCollection(path)
+    for batch in range(5):
+        _upsert(collection, f"{prefix}{batch}", 4, seed=batch)
+
+def test_concurrent_worker_processes_lose_no_writes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_write_batches, args=(str(tmp_path), prefix)) for prefix in "xyz"]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    assert NumpyCollection(str(tmp_path)).count() == 3 * 5 * 4
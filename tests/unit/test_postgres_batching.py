@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("aiosqlite")
+
+from src.db.postgres import PostgresClientManager
+from src.db.postgres.conversations import PostgresConversationStore, create_schema
+
+def _message(seq: int) -> dict:
+    return {
+        "seq": seq,
+        "message_id": f"m{seq}",
+        "role": "user",
+        "content": f"問題 {seq}",
+        "timestamp": datetime.now(timezone.utc)
+    }
+
+def _store(**options) -> PostgresConversationStore:
+    return PostgresConversationStore(PostgresClientManager("memory://"), **options)
+
+async def _prepare(store: PostgresConversationStore) -> None:
+    await create_schema(store.engine)
+    now = datetime.now(timezone.utc)
+    await store.create({"conversation_id": "c1", "user_id": "u1", "status": "active", "created_at": now, "updated_at": now})
+
+def test_running_flush_is_referenced_until_done():
+    store = _store(batch_size=1)
+
+    async def run():
+        await _prepare(store)
+        append = asyncio.create_task(store.append("c1", _message(0)))
+        while not store._flush_tasks:
+            await asyncio.sleep(0)
+        await append
+        await asyncio.sleep(0)
+        return store._flush_tasks, await store.read("c1", 10)
+
+    flush_tasks, messages = asyncio.run(run())
+    assert not flush_tasks
+    assert [message["seq"] for message in messages] == [0]
+
+def test_stop_flushes_writes_waiting_for_the_batch_window():
+    store = _store(batch_window_ms=60000)
+
+    async def run():
+        await _prepare(store)
+        appends = [asyncio.create_task(store.append("c1", _message(seq))) for seq in range(3)]
+        await asyncio.sleep(0)
+        await store.stop(5)
+        await asyncio.gather(*appends)
+        return await store.read("c1", 10)
+
+    assert [message["seq"] for message in asyncio.run(run())] == [0, 1, 2]
+
+def test_bad_row_fails_only_its_own_append():
+    store = _store(batch_window_ms=60000)
+    broken = dict(_message(1), content=None)
+
+    async def run():
+        await _prepare(store)
+        appends = [
+            asyncio.create_task(store.append("c1", message))
+            for message in (_message(0), broken, _message(2))
+        ]
+        await asyncio.sleep(0)
+        await store.stop(5)
+        results = await asyncio.gather(*appends, return_exceptions=True)
+        return results, await store.read("c1", 10)
+
+    results, messages = asyncio.run(run())
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], Exception)
+    assert [message["seq"] for message in messages] == [0, 2]
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from src.db.redis.rate_limit import Bucket, TokenBuckets, retry_after
+
+class UnavailableTokenBuckets(TokenBuckets):
+    @property
+    def redis(self):
+        raise ConnectionError("Redis is down")
+
+@pytest.fixture(params=["redis", "local"])
+def buckets(request):
+    if request.param == "local":
+        return UnavailableTokenBuckets()
+    # fakeredis runs Lua scripts through lupa
+    pytest.importorskip("lupa")
+    request.getfixturevalue("redis")
+    return TokenBuckets()
+
+def _take(buckets, *charges):
+    return asyncio.run(buckets.take(list(charges)))
+
+def test_capacity_then_rejection_with_wait(buckets):
+    bucket = Bucket("user:u1", capacity=2, rate=0.5, cost=1)
+
+    async def run():
+        return [await buckets.take([bucket]) for _ in range(3)]
+
+    first, second, third = asyncio.run(run())
+    assert first == (True, 0.0) and second == (True, 0.0)
+    allowed, wait = third
+    assert not allowed
+    assert 1.5 < wait <= 2.0
+    assert buckets._degraded is isinstance(buckets, UnavailableTokenBuckets)
+
+def test_rejected_request_charges_no_bucket(buckets):
+    user = Bucket("user:u1", capacity=5, rate=1, cost=1)
+    tenant = Bucket("tenant:t1", capacity=1, rate=1, cost=1)
+
+    async def run():
+        assert (await buckets.take([user, tenant]))[0]
+        assert not (await buckets.take([user, tenant]))[0]
+        # Only the first request was charged to the user bucket
+        return [(await buckets.take([user]))[0] for _ in range(5)]
+
+    assert asyncio.run(run()) == [True, True, True, True, False]
+
+def test_cost_is_capped_at_capacity(buckets):
+    assert _take(buckets, Bucket("tokens:u1", capacity=100, rate=10, cost=500)) == (True, 0.0)
+
+def test_disabled_buckets_always_pass(buckets):
+    assert _take(buckets, Bucket("user:u1", capacity=0, rate=1, cost=1)) == (True, 0.0)
+
+def test_retry_after_rounds_up_to_whole_seconds():
+    assert retry_after(0.2) == 1
+    assert retry_after(2.1) == 3
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import httpx
+import pytest
+from fastapi import FastAPI
+from starlette.authentication import SimpleUser
+from src.api.middlewares.rate_limit import RateLimitMiddleware, RateLimiter, rate_limiter
+from src.api.routes import chat
+from src.db.redis.rate_limit import TokenBuckets
+
+class LocalTokenBuckets(TokenBuckets):
+    @property
+    def redis(self):
+        raise ConnectionError("Redis is down")
+
+def _limiter(**budgets) -> RateLimiter:
+    limiter = RateLimiter(LocalTokenBuckets())
+    limiter.budgets.update(budgets)
+    return limiter
+
+def _scope(headers=(), client=("10.0.0.1", 5000), **extra):
+    return {
+        "headers": [(key.encode(), value.encode()) for key, value in headers],
+        "query_string": b"",
+        "client": client,
+        **extra
+    }
+
+def test_unauthenticated_identities_include_the_client_address():
+    identities = _limiter().identities(_scope([("x-user-id", "alice"), ("x-tenant-id", "acme")]))
+    assert identities == {"tenant": "acme", "ip": "10.0.0.1", "user": "alice"}
+
+    # Without a user only the address identifies the caller
+    assert _limiter().identities(_scope()) == {"tenant": "default", "ip": "10.0.0.1"}
+
+def test_authenticated_user_replaces_headers_and_address():
+    scope = _scope([("x-user-id", "mallory")], user=SimpleUser("alice"))
+    assert _limiter().identities(scope) == {"tenant": "default", "user": "alice"}
+
+def test_rotating_the_user_header_still_hits_the_address_budget():
+    app = FastAPI()
+
+    @app.get("/api/v1/chat/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, limiter=_limiter(ip=(3, 100000)))
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return [
+                (await client.get("/api/v1/chat/ping", headers={"X-User-ID": f"user-{i}"})).status_code
+                for i in range(4)
+            ]
+
+    assert asyncio.run(run()) == [200, 200, 200, 429]
+
+async def _websocket_exchange(app, path: str, query: bytes, messages):
+    """Send each message over one connection, returning the reply to each"""
+    incoming, outgoing = asyncio.Queue(), asyncio.Queue()
+    scope = {
+        "type": "websocket", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query, "headers": [], "client": ("10.0.0.1", 5000),
+        "server": ("t", 80), "scheme": "ws", "subprotocols": [], "app": app
+    }
+    await incoming.put({"type": "websocket.connect"})
+    connection = asyncio.create_task(app(scope, incoming.get, outgoing.put))
+    assert (await outgoing.get())["type"] == "websocket.accept"
+
+    replies = []
+    for message in messages:
+        await incoming.put({"type": "websocket.receive", "text": json.dumps(message)})
+        replies.append(json.loads((await outgoing.get())["text"]))
+    await incoming.put({"type": "websocket.disconnect", "code": 1000})
+    await connection
+    return replies
+
+@pytest.fixture
+def websocket_app(monkeypatch):
+    async def stream_response(conversation_id, user_message):
+        yield {"type": "done", "response": user_message}
+
+    monkeypatch.setattr(chat.chat_service, "stream_response", stream_response)
+    # Off in the offline defaults
+    monkeypatch.setattr(chat.settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limiter, "buckets", LocalTokenBuckets())
+    monkeypatch.setattr(rate_limiter, "budgets", {
+        "user": (3, 100000), "tenant": (100, 100000), "ip": (100, 100000)
+    })
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api/v1/chat")
+    app.add_middleware(RateLimitMiddleware)
+    return app
+
+def test_websocket_messages_are_charged_one_by_one(websocket_app):
+    # The handshake takes one request, leaving two for messages
+    replies = asyncio.run(_websocket_exchange(
+        websocket_app, "/api/v1/chat/conversations/c1/ws", b"user_id=alice",
+        [{"content": f"問題{i}"} for i in range(3)]
+    ))
+
+    assert [reply["type"] for reply in replies] == ["done", "done", "error"]
+    assert replies[2]["retry_after"] >= 1
@@ -0,0 +1,63 @@
+import asyncio
+from fakeredis.aioredis import FakeRedis
+from src.llm.cache import SemanticCache
+from src.llm.engine import LLMEngine, cache_scope
+from src.llm.models.fake import FakeChatModel
+
+async def _same_vector(text):
+    # Every prompt embeds identically, so the semantic tier matches anything in scope
+    return [1.0, 0.0, 0.0]
+
+def _cache():
+    return SemanticCache(redis=FakeRedis(decode_responses=True), embed=_same_vector, threshold=0.95, enabled=True)
+
+def _engine(cache):
+    engine = LLMEngine()
+    engine._llm = FakeChatModel(first_token_latency=0, tokens_per_second=0, response_tokens=8)
+    engine.cache = cache
+    return engine
+
+ALICE = [{"role": "user", "content": "我要退貨"}, {"role": "assistant", "content": "請提供訂單編號"}]
+BOB = [{"role": "user", "content": "運費怎麼算"}, {"role": "assistant", "content": "滿千免運"}]
+
+def test_different_histories_never_share_an_entry():
+    async def run():
+        cache = _cache()
+        await cache.store("可以嗎", "可以，已為您退貨", cache_scope("gpt-4o", "system", ALICE))
+        assert await cache.lookup("可以嗎", cache_scope("gpt-4o", "system", BOB)) is None
+        assert await cache.lookup("可以嗎？", cache_scope("gpt-4o", "system", ALICE)) == "可以，已為您退貨"
+
+    asyncio.run(run())
+
+def test_models_never_share_an_entry():
+    async def run():
+        cache = _cache()
+        await cache.store("營業時間", "九點到六點", cache_scope("gpt-4o-mini", "system", []))
+        assert await cache.lookup("營業時間", cache_scope("gpt-4o", "system", [])) is None
+
+    asyncio.run(run())
+
+def test_turns_with_history_bypass_the_cache():
+    async def run():
+        cache = _cache()
+        engine = _engine(cache)
+        question = {"role": "user", "content": "可以嗎"}
+
+        alice = await engine.generate_response(ALICE + [question])
+        bob = await engine.generate_response(BOB + [question])
+        assert alice != bob
+        assert await cache.redis.keys("llm:cache:*:entry:*") == []
+
+    asyncio.run(run())
+
+def test_opening_turns_are_cached():
+    async def run():
+        cache = _cache()
+        engine = _engine(cache)
+        messages = [{"role": "user", "content": "營業時間"}]
+
+        first = await engine.generate_response(messages)
+        assert await engine.generate_response(messages) == first
+        assert cache.stats["exact_hits"] == 1
+
+    asyncio.run(run())
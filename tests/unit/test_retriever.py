@@ -0,0 +1,55 @@
+import asyncio
+import time
+import pytest
+from src.rag.retriever import AsyncRetriever
+
+class SlowEmbeddings:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def embed_query(self, query: str):
+        await asyncio.sleep(self.delay)
+        return [0.0]
+
+class SlowStore:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def search(self, query, n_results, where, query_embedding):
+        time.sleep(self.delay)
+        return {"ids": [["d1"]], "documents": [["doc"]]}
+
+def _elapsed_until_timeout(retriever: AsyncRetriever, **search) -> float:
+    async def run():
+        started_at = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await retriever.search("q", **search)
+        return time.perf_counter() - started_at
+
+    try:
+        return asyncio.run(run())
+    finally:
+        retriever.close()
+
+def test_one_timeout_covers_embedding_and_search():
+    retriever = AsyncRetriever(store=SlowStore(0.3), embeddings=SlowEmbeddings(0.15), timeout=0.25)
+    assert _elapsed_until_timeout(retriever) < 0.35
+
+def test_waiting_for_a_slot_counts_against_the_timeout():
+    retriever = AsyncRetriever(store=SlowStore(0.5), embeddings=SlowEmbeddings(0), max_workers=1, max_pending=1, timeout=0.2)
+
+    async def run():
+        first = asyncio.create_task(retriever.search("q"))
+        await asyncio.sleep(0.01)
+        started_at = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await retriever.search("q")
+        elapsed = time.perf_counter() - started_at
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        return elapsed
+
+    try:
+        assert asyncio.run(run()) < 0.3
+    finally:
+        retriever.close()
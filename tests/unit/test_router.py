@@ -0,0 +1,86 @@
+"""
+Routing decisions, including a labelled set of messages that pins the
+thresholds for the configured `EMBEDDING_MODEL`. Run it with the model
+you deploy before setting ``ROUTER_ENABLED=True``:
+
+    EMBEDDING_MODEL=<model> python -m pytest tests/unit/test_router.py
+"""
+import asyncio
+from src.llm.classifier import LocalClassifier
+from src.llm.router import ROUTE_CANNED, ROUTE_CHEAP, ROUTE_FULL, ChatRouter, is_question
+
+LABELLED = {
+    ROUTE_CANNED: [
+        "您好", "嗨", "早安", "謝謝", "非常感謝", "掰掰", "hi", "hello", "thanks", "bye",
+    ],
+    ROUTE_CHEAP: [
+        "運費怎麼計算", "可以退貨嗎", "退貨政策是什麼", "你們的營業時間是幾點", "發票怎麼開",
+    ],
+    ROUTE_FULL: [
+        # Greetings or thanks that carry a question
+        "你好，請問運費多少", "謝謝，那退貨要多久", "hi, where is my order", "您好，可以改地址嗎",
+        # Requests and complaints
+        "你好我要退貨", "謝謝，但我還是很不滿意", "我要投訴", "服務太差了", "App 一直閃退",
+        "我的訂單到哪裡了", "請幫我取消訂單 A12345", "我想把地址改成台北市信義區",
+        # Short replies whose meaning depends on the conversation
+        "好", "yes", "ok", "對", "不是",
+    ],
+}
+
+class StubClassifier:
+    def __init__(self, intent, confidence, margin, sentiment="neutral"):
+        self.intent = {"intent": intent, "confidence": confidence, "margin": margin}
+        self.sentiment = {"sentiment": sentiment}
+
+    async def detect_intent(self, text):
+        return self.intent
+
+    async def analyze_sentiment(self, text):
+        return self.sentiment
+
+def _route(classifier, text, **kwargs):
+    router = ChatRouter(classifier=classifier, enabled=True, **kwargs)
+    return asyncio.run(router.route(text))["route"]
+
+def test_ambiguous_intent_goes_to_the_full_model():
+    assert _route(StubClassifier("greeting", 0.95, 0.3), "您好", min_margin=0.1) == ROUTE_CANNED
+    assert _route(StubClassifier("greeting", 0.95, 0.05), "您好", min_margin=0.1) == ROUTE_FULL
+    assert _route(StubClassifier("faq", 0.9, 0.05), "運費怎麼計算", min_margin=0.1) == ROUTE_FULL
+
+def test_questions_never_get_canned_replies():
+    assert _route(StubClassifier("greeting", 0.99, 0.5), "你好，請問運費多少") == ROUTE_FULL
+    assert _route(StubClassifier("thanks", 0.99, 0.5), "thanks, how do I return it") == ROUTE_FULL
+
+def test_negative_sentiment_goes_to_the_full_model():
+    assert _route(StubClassifier("faq", 0.99, 0.5, sentiment="negative"), "可以退貨嗎") == ROUTE_FULL
+
+def test_disabled_router_always_uses_the_full_model():
+    router = ChatRouter(classifier=StubClassifier("greeting", 0.99, 0.5), enabled=False)
+    assert asyncio.run(router.route("您好"))["route"] == ROUTE_FULL
+
+def test_question_detection():
+    assert is_question("請問營業時間")
+    assert is_question("What time do you open")
+    assert is_question("可以退貨嗎？")
+    assert not is_question("謝謝你的幫忙")
+    assert not is_question("thanks")
+
+def test_labelled_messages(redis):
+    async def run():
+        router = ChatRouter(classifier=LocalClassifier(), enabled=True)
+        return {
+            (expected, text): (await router.route(text))["route"]
+            for expected, texts in LABELLED.items()
+            for text in texts
+        }
+
+    routes = asyncio.run(run())
+
+    # A shortcut taken wrongly answers the customer badly; never allowed
+    wrong = {text: route for (expected, text), route in routes.items() if route != ROUTE_FULL and route != expected}
+    assert wrong == {}
+
+    # Missing a shortcut only costs a full model call; most should still be taken
+    for shortcut in (ROUTE_CANNED, ROUTE_CHEAP):
+        taken = sum(route == shortcut for (expected, _), route in routes.items() if expected == shortcut)
+        assert taken >= len(LABELLED[shortcut]) // 2, f"{shortcut}: {taken}/{len(LABELLED[shortcut])}"
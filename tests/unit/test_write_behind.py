@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime
+import pytest
+from src.db.mongodb.write_behind import WriteBehindMessageStore
+
+class BulkAsUpdates:
+    """Collection whose bulk writes run as single updates, which mongomock supports"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            await self._collection.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+
+def _message(seq, role="user"):
+    return {"message_id": f"m-{seq}", "role": role, "content": f"訊息 {seq}", "timestamp": datetime(2024, 1, 1, 0, 0, seq), "seq": seq}
+
+async def _store(mongo, redis):
+    await mongo.chats.insert_one({
+        "conversation_id": "c1",
+        "updated_at": datetime(2024, 1, 1),
+        "metadata": {"total_messages": 2}
+    })
+    store = WriteBehindMessageStore(BulkAsUpdates(mongo.chats), BulkAsUpdates(mongo.chat_messages), bucket_size=3)
+    await store.flusher._ensure_group()
+    return store
+
+@pytest.fixture
+def scripting():
+    # fakeredis runs Lua scripts through lupa
+    pytest.importorskip("lupa")
+
+def test_sequence_continues_from_stored_count(mongo, redis, scripting):
+    async def run():
+        store = await _store(mongo, redis)
+        first = await store.allocate_seq("c1", "user", datetime(2024, 1, 1))
+        second = await store.allocate_seq("c1", "assistant", datetime(2024, 1, 1))
+        assert (first[0], second[0]) == (2, 3)
+        assert await store.allocate_seq("missing", "user", datetime(2024, 1, 1)) is None
+        assert 0 < await redis.ttl(store._seq_key("c1")) <= store.seq_ttl
+
+    asyncio.run(run())
+
+def test_lost_counter_resumes_after_unflushed_messages(mongo, redis, scripting):
+    async def run():
+        store = await _store(mongo, redis)
+        for _ in range(3):
+            seq, _ = await store.allocate_seq("c1", "user", datetime(2024, 1, 1))
+            await store.append("c1", _message(seq))
+
+        # Evicted, or expired, before any of them was flushed
+        await redis.delete(store._seq_key("c1"))
+        seq, _ = await store.allocate_seq("c1", "user", datetime(2024, 1, 1))
+        assert seq == 5
+
+    asyncio.run(run())
+
+def test_reads_merge_unflushed_messages(mongo, redis):
+    async def run():
+        store = await _store(mongo, redis)
+        await mongo.chat_messages.insert_one({
+            "conversation_id": "c1", "bucket": 0, "count": 2, "messages": [_message(0), _message(1)]
+        })
+        await store.append("c1", _message(2))
+        await store.append("c1", _message(3, "assistant"))
+
+        assert [msg["seq"] for msg in await store.read("c1", 10)] == [0, 1, 2, 3]
+        assert [msg["seq"] for msg in await store.read("c1", 2, before=3)] == [1, 2]
+        assert "conversation_id" not in (await store.read("c1", 1))[0]
+
+    asyncio.run(run())
+
+def test_flush_moves_messages_into_buckets(mongo, redis):
+    async def run():
+        store = await _store(mongo, redis)
+        for seq in (2, 3, 4):
+            await store.append("c1", _message(seq, "assistant" if seq % 2 else "user"))
+        # A retried append queues the same message twice
+        await store.append("c1", _message(4))
+
+        assert await store.flusher.flush_once() == 4
+
+        buckets = await mongo.chat_messages.find({}, {"_id": 0, "bucket": 1, "messages.seq": 1}).sort("bucket", 1).to_list(None)
+        assert buckets == [
+            {"bucket": 0, "messages": [{"seq": 2}]},
+            {"bucket": 1, "messages": [{"seq": 3}, {"seq": 4}]},
+        ]
+        conversation = await mongo.chats.find_one({"conversation_id": "c1"})
+        assert conversation["metadata"]["total_messages"] == 5
+        assert conversation["updated_at"] == datetime(2024, 1, 1, 0, 0, 4)
+        assert conversation["metadata"]["last_assistant_message_time"] == datetime(2024, 1, 1, 0, 0, 3)
+
+        # Acknowledged: nothing pending, nothing left in the stream
+        assert await redis.zcard("chat:pending:c1") == 0
+        assert await redis.xlen(store.stream) == 0
+        assert [msg["seq"] for msg in await store.read("c1", 10)] == [2, 3, 4]
+
+    asyncio.run(run())
+
+def test_unacknowledged_entries_are_recovered(mongo, redis):
+    async def run():
+        store = await _store(mongo, redis)
+        await store.append("c1", _message(2))
+        # Read by this consumer, then "crash" before the write
+        assert len(await store.flusher._read(">")) == 1
+        assert await store.flusher.flush_once() == 0
+
+        assert await store.flusher._recover() == 1
+        bucket = await mongo.chat_messages.find_one({"conversation_id": "c1"})
+        assert [msg["seq"] for msg in bucket["messages"]] == [2]
+
+    asyncio.run(run())